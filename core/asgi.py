@@ -14,4 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings.local')  # Use local by default for dev
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Serves the status event stream (/api/loan/events/) without a thread per open connection.
+from loan.events import EventStreamRouter  # noqa: E402 (needs the app registry)
+
+application = EventStreamRouter(django_application)
@@ -51,17 +51,25 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'loan.User'
 
 MIDDLEWARE = [
+    'loan.instrumentation.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Minifies HTML and Brotli/gzip-compresses dynamic responses (static files come precompressed).
+    'loan.compression.ResponseCompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'loan.middleware.BlockFlyDevHostMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Sends the client's reads to the primary for a while after it writes (see loan/replicas.py).
+    'loan.replicas.ReplicaPinningMiddleware',
+    'loan.audit.AuditContextMiddleware',
     'loan.middleware.MobileOnlyMiddleware',
     'loan.middleware.ProfileCompletionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Keep last: it runs the view itself when profiling (see loan/profiling.py).
+    'loan.profiling.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -91,6 +99,20 @@ DATABASES = {
     'default': dj_database_url.config(default=os.getenv('DATABASE_URL'))
 }
 
+# Optional read replica (see loan/replicas.py). Read-only views and admin changelists read
+# from it; a client that wrote stays on the primary for REPLICA_PIN_SECONDS, and the replica
+# is skipped while it lags more than REPLICA_MAX_LAG_SECONDS (checked every
+# REPLICA_LAG_CHECK_SECONDS). Pointing it at DATABASE_URL exercises the routing locally.
+if os.getenv('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = {
+        **dj_database_url.parse(os.getenv('DATABASE_REPLICA_URL')),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['loan.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', '5'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -127,20 +149,152 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = '/static/'
-STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Responsive image variants written by `manage.py build_assets` (see loan/assets.py); the
+# output directory is collected like any other static directory once it exists.
+ASSET_BUILD_DIR = Path(os.getenv('ASSET_BUILD_DIR', BASE_DIR / 'build' / 'static'))
+ASSET_IMAGE_WIDTHS = (96, 160, 320, 480, 768, 1200)
+ASSET_IMAGE_FORMATS = ('avif', 'webp')
+STATICFILES_DIRS = [BASE_DIR / 'static'] + ([ASSET_BUILD_DIR] if ASSET_BUILD_DIR.is_dir() else [])
+
 # Media files (user uploads, signatures)
 # MEDIA_URL is the public URL prefix, MEDIA_ROOT is the filesystem path where files are saved.
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Private media (signatures, agreement PDFs) is served by views after a permission check
+# (see loan/protected_media.py). PROTECTED_MEDIA_SERVER hands the transfer to the front
+# server: 'nginx' (X-Accel-Redirect to PROTECTED_MEDIA_INTERNAL_URL), 'sendfile'
+# (X-Sendfile), or '' to stream a FileResponse from the worker.
+PROTECTED_MEDIA_SERVER = os.getenv('PROTECTED_MEDIA_SERVER', '')
+PROTECTED_MEDIA_INTERNAL_URL = os.getenv('PROTECTED_MEDIA_INTERNAL_URL', '/protected-media/')
+
 
 # Branding / marketing content
 ORG_DISPLAY_NAME = os.getenv('ORG_DISPLAY_NAME', '3rdgenloan')
 INVITE_SENDER_NAME = os.getenv('INVITE_SENDER_NAME', ORG_DISPLAY_NAME)
 INVITE_BANNER_URL = os.getenv('INVITE_BANNER_URL')
 
+# Country calling code for phone numbers entered without one; numbers are stored in E.164
+# (see loan/identity.py).
+PHONE_DEFAULT_COUNTRY_CODE = os.getenv('PHONE_DEFAULT_COUNTRY_CODE', '1')
+
+# Performance instrumentation: Server-Timing header for staff and a Prometheus
+# endpoint at /admin/metrics/ (staff session or `Authorization: Bearer $METRICS_TOKEN`).
+# Each worker flushes its numbers into METRICS_DIR so scrapes cover all workers; files of
+# exited workers are removed at the next scrape.
+PERF_INSTRUMENTATION = os.getenv('PERF_INSTRUMENTATION', 'True').lower() == 'true'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_DIR = os.getenv('METRICS_DIR', '/tmp/loan-metrics')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+# On-demand profiling: staff send `X-Profile: 1` or `?_profile=1`; a fraction of all
+# traffic can be sampled too. Dumps are evicted LRU once PROFILER_MAX_BYTES is exceeded.
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'True').lower() == 'true'
+PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', '0'))
+PROFILER_DIR = Path(os.getenv('PROFILER_DIR', BASE_DIR / 'var' / 'profiles'))
+PROFILER_MAX_BYTES = int(os.getenv('PROFILER_MAX_BYTES', 200 * 1024 * 1024))
+PROFILER_MAX_QUERIES = int(os.getenv('PROFILER_MAX_QUERIES', 500))
+
+# AuditLog retention: `manage.py archive_audit_logs` moves days older than AUDIT_RETENTION_DAYS
+# into gzip JSONL segments under AUDIT_ARCHIVE_DIR (searchable from the AuditLog admin).
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', 365))
+AUDIT_ARCHIVE_DIR = Path(os.getenv('AUDIT_ARCHIVE_DIR', BASE_DIR / 'var' / 'audit-archive'))
+AUDIT_ARCHIVE_SEARCH_LIMIT = int(os.getenv('AUDIT_ARCHIVE_SEARCH_LIMIT', 200))
+
+# Cache: per-process memory by default. Set CACHE_BACKEND/CACHE_LOCATION to a shared
+# backend (e.g. django.core.cache.backends.db.DatabaseCache) so throttles hold across workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Dashboard and withdrawal page fragments cached per Loan.version (see loan/fragments.py);
+# entries of older versions are never read again and expire after FRAGMENT_CACHE_SECONDS.
+FRAGMENT_CACHE = 'default'
+FRAGMENT_CACHE_SECONDS = int(os.getenv('FRAGMENT_CACHE_SECONDS', '86400'))
+
+# Idempotency keys for the borrower POST forms (see loan/idempotency.py). Needs a cache
+# shared by all workers, like the throttles (prod.py uses a database cache). Outcomes are kept IDEMPOTENCY_TTL_SECONDS; a
+# duplicate of a request still running waits up to IDEMPOTENCY_WAIT_SECONDS, and a claim
+# left by a killed worker expires after IDEMPOTENCY_LOCK_SECONDS.
+IDEMPOTENCY_CACHE = 'default'
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', '10'))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '60'))
+
+# Login/registration throttling (token buckets, '<burst>/<period>'), checked before any
+# password hashing. THROTTLE_CLIENT_IP_HEADER names the META key holding the client IP
+# when behind a proxy.
+THROTTLE_CACHE = 'default'
+THROTTLE_RATES = {
+    'login_ip': os.getenv('THROTTLE_LOGIN_IP', '30/5m'),
+    'login_account': os.getenv('THROTTLE_LOGIN_ACCOUNT', '5/5m'),
+    'register_ip': os.getenv('THROTTLE_REGISTER_IP', '10/h'),
+}
+THROTTLE_CLIENT_IP_HEADER = os.getenv('THROTTLE_CLIENT_IP_HEADER', '')
+
+# Dynamic response compression (loan/compression.py). Brotli quality 5 / gzip level 6 keep the
+# per-request CPU cost low; static files are precompressed at maximum level at build time.
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'True').lower() == 'true'
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', 1024))
+RESPONSE_BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', 5))
+RESPONSE_GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', 6))
+HTML_MINIFY = os.getenv('HTML_MINIFY', 'True').lower() == 'true'
+
+# Admin portfolio report (/admin/reports/portfolio/) reads DailySummary rows and is
+# cached this long; the summaries themselves are updated on every loan/withdrawal write.
+# `rebuild_portfolio_summaries` clears PORTFOLIO_REPORT_CACHE, which must be shared by all
+# workers for that to reach them (prod.py points it at the shared cache).
+PORTFOLIO_REPORT_CACHE = 'default'
+PORTFOLIO_REPORT_CACHE_SECONDS = int(os.getenv('PORTFOLIO_REPORT_CACHE_SECONDS', 300))
+# Onboarding funnel (/admin/reports/funnel/) is one aggregation over all users; cache it longer.
+FUNNEL_REPORT_CACHE_SECONDS = int(os.getenv('FUNNEL_REPORT_CACHE_SECONDS', 600))
+
+# Pricing used for repayment schedules and affordability (see loan/amortization.py).
+# LOAN_DTI_LIMIT is the installment/monthly-income ratio above which a quote is flagged.
+LOAN_ANNUAL_RATE = os.getenv('LOAN_ANNUAL_RATE', '0.18')
+LOAN_DTI_LIMIT = os.getenv('LOAN_DTI_LIMIT', '0.40')
+# Daily accrual on the drawn principal of ACTIVE loans (manage.py accrue_interest, see
+# loan/accrual.py): LOAN_ANNUAL_RATE plus an annual fee rate, Actual/LOAN_ACCRUAL_DAY_COUNT.
+LOAN_ANNUAL_FEE_RATE = os.getenv('LOAN_ANNUAL_FEE_RATE', '0')
+LOAN_ACCRUAL_DAY_COUNT = int(os.getenv('LOAN_ACCRUAL_DAY_COUNT', 365))
+
+# Withdrawals per page in the borrower status API (/api/loan/status/).
+LOAN_STATUS_API_PAGE_SIZE = int(os.getenv('LOAN_STATUS_API_PAGE_SIZE', 20))
+
+# Server-sent status events (/api/loan/events/, see loan/events.py). EVENTS_BACKEND is 'local'
+# (one process), 'postgres' (LISTEN/NOTIFY across workers) or empty to pick from the database.
+EVENTS_BACKEND = os.getenv('EVENTS_BACKEND', '')
+EVENTS_CHANNEL = os.getenv('EVENTS_CHANNEL', 'loan_events')
+EVENTS_HEARTBEAT_SECONDS = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', 20))
+EVENTS_RETRY_MS = int(os.getenv('EVENTS_RETRY_MS', 5000))
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 100))
+
+# Payout batch files (see loan/payouts.py): withdrawals claimed, written and marked paid per
+# transaction, and the originator name in the fixed-width header record.
+PAYOUT_CHUNK_SIZE = int(os.getenv('PAYOUT_CHUNK_SIZE', 5000))
+PAYOUT_ORIGINATOR_NAME = os.getenv('PAYOUT_ORIGINATOR_NAME') or ORG_DISPLAY_NAME
+
+# Cursor file of the loan lifecycle sweeper (manage.py sweep_loan_lifecycle, see loan/lifecycle.py);
+# an interrupted run resumes from it.
+LOAN_LIFECYCLE_STATE_FILE = Path(os.getenv('LOAN_LIFECYCLE_STATE_FILE', BASE_DIR / 'var' / 'loan-lifecycle.json'))
+
+# Underwriting rules used when no active UnderwritingRule rows exist (see loan/underwriting.py).
+# Failing a REJECT rule rejects the loan, failing a REVIEW rule leaves it for a human; loans
+# passing every rule are only approved automatically when UNDERWRITING_AUTO_APPROVE is on.
+UNDERWRITING_AUTO_APPROVE = os.getenv('UNDERWRITING_AUTO_APPROVE', 'False').lower() == 'true'
+UNDERWRITING_RULES = [
+    {'name': 'max-term', 'kind': 'MAX_TERM', 'threshold': 12, 'outcome': 'REJECT'},
+    {'name': 'min-age', 'kind': 'MIN_AGE', 'threshold': 18, 'outcome': 'REJECT'},
+    {'name': 'income-multiple', 'kind': 'MAX_INCOME_MULTIPLE', 'threshold': 3, 'outcome': 'REVIEW'},
+    {'name': 'debt-to-income', 'kind': 'MAX_DTI', 'threshold': '0.40', 'outcome': 'REVIEW'},
+    {'name': 'employment', 'kind': 'EMPLOYMENT_NOT_IN', 'values': ['UNEMPLOYED', 'STUDENT'], 'outcome': 'REVIEW'},
+]
+
 # Authentication redirect settings — use site paths rather than Django defaults
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/loan/dashboard/'
@@ -4,6 +4,9 @@ from .base import *
 DEBUG = True
 ALLOWED_HOSTS = ["*"]
 
+# Stand in for nginx/X-Sendfile so PROTECTED_MEDIA_SERVER offload headers work without a proxy
+MIDDLEWARE = ['loan.protected_media.ProtectedMediaEmulationMiddleware', *MIDDLEWARE]
+
 # Allow local dev origins for CSRF
 CSRF_TRUSTED_ORIGINS = [
 	"http://127.0.0.1:8000",
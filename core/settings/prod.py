@@ -28,6 +28,29 @@ for host in ALLOWED_HOSTS:
 # Standard proxy header when behind a proxy/load-balancer
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
+# Behind Fly's proxy REMOTE_ADDR is the proxy; throttle on the real client address.
+THROTTLE_CLIENT_IP_HEADER = os.getenv('THROTTLE_CLIENT_IP_HEADER', 'HTTP_FLY_CLIENT_IP')
+
+# Idempotency claims and login throttles must be seen by every worker and machine, so they
+# use a database cache table (created by `createcachetable` in fly.toml's release step).
+# SHARED_CACHE_BACKEND/SHARED_CACHE_LOCATION can move them to Redis or memcached.
+CACHES['shared'] = {
+	'BACKEND': os.getenv('SHARED_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+	'LOCATION': os.getenv('SHARED_CACHE_LOCATION', 'loan_shared_cache'),
+}
+if CACHES['shared']['BACKEND'] == 'django.core.cache.backends.db.DatabaseCache':
+	# The table only deletes expired rows once it holds MAX_ENTRIES, and then also drops
+	# 1/CULL_FREQUENCY of the live keys (0 would flush every key and throttle at once). Keep
+	# the cap far above a day of keys; `purge_shared_cache` (scheduled) removes expired rows.
+	CACHES['shared']['OPTIONS'] = {
+		'MAX_ENTRIES': int(os.getenv('SHARED_CACHE_MAX_ENTRIES', '1000000')),
+		'CULL_FREQUENCY': int(os.getenv('SHARED_CACHE_CULL_FREQUENCY', '10')),
+	}
+IDEMPOTENCY_CACHE = 'shared'
+THROTTLE_CACHE = 'shared'
+# Shared too, so a summary rebuild clears the cached portfolio report in every worker.
+PORTFOLIO_REPORT_CACHE = 'shared'
+
 # Email backend (use Fly secrets to set these in production)
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
@@ -38,11 +61,12 @@ EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False').lower() == 'true'
 EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL', 'False').lower() == 'true'
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
 
-# Use WhiteNoise's compressed storage (non-manifest) to avoid runtime manifest lookup errors.
-# This is intentionally conservative: switch to the manifest-backed storage once build
-# processes reliably produce staticfiles.json.
-# STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Hashed, gzip/Brotli-precompressed static files (WhiteNoise serves the hashed names with
+# immutable cache headers). STATICFILES_STORAGE is no longer read by Django, hence STORAGES.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'loan.assets.StaticAssetStorage'},
+}
 
 # --- Security settings ---
 CSRF_COOKIE_SECURE = True
@@ -16,17 +16,22 @@ Including another URLconf
 """
 
 from django.contrib import admin
+from django.contrib.auth import views as auth_views
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
 
-from loan.views import send_invite, send_invite_whatsapp
+from loan.forms import IdentityPasswordResetForm
+from loan.views import funnel_report, metrics, portfolio_report, send_invite, send_invite_whatsapp
 
 urlpatterns = [
     path('admin/invite/', send_invite, name='send_invite'),
     path('admin/invite-whatsapp/', send_invite_whatsapp, name='send_invite_whatsapp'),
+    path('admin/metrics/', metrics, name='metrics'),
+    path('admin/reports/portfolio/', portfolio_report, name='portfolio_report'),
+    path('admin/reports/funnel/', funnel_report, name='funnel_report'),
     path('admin/', admin.site.urls),
     path('', include('loan.urls')),
+    # Password reset looks the account up through loan/identity.py
+    path('accounts/password_reset/', auth_views.PasswordResetView.as_view(form_class=IdentityPasswordResetForm), name='password_reset'),
     # Built-in auth views: password reset, login/logout helpers
     path('accounts/', include('django.contrib.auth.urls')),
 ]
@@ -34,6 +39,5 @@ urlpatterns = [
 # Custom error handlers
 handler404 = 'loan.views.custom_404'
 
-if settings.DEBUG:
-    # Serve media files in development
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# MEDIA_ROOT only holds private files (signatures, agreement PDFs, payout files): they are
+# served by views that check permissions (loan/protected_media.py), never by a public route.
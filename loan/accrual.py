@@ -0,0 +1,250 @@
+"""Daily interest and fee accrual on drawn loan principal (``manage.py accrue_interest``).
+
+Interest is charged on what the borrower has drawn, not on the approved
+line: a loan's principal on a given day is the sum of its APPROVED
+withdrawals (paid or not) approved on or before that day. Accrual starts on
+the day of the first draw and runs while the loan is ACTIVE; loans that
+still owe money stay ACTIVE (loan/lifecycle.py only closes lines with
+nothing drawn). Simple interest at ``LOAN_ANNUAL_RATE`` plus
+``LOAN_ANNUAL_FEE_RATE``, on an Actual/``LOAN_ACCRUAL_DAY_COUNT`` basis.
+Money is integer cents and rates are integers at ``RATE_SCALE``; the
+rounding rule is cumulative:
+
+* ``P(k)``, the principal-days through day ``k`` of the loan, is the sum of
+  every day's drawn principal up to ``k`` (``(k + 1) * C(k) - W(k)``, with
+  ``C`` the cents drawn by day ``k`` and ``W`` those cents times their draw
+  day);
+* the amount accrued through day ``k`` is
+  ``P(k) * rate / (RATE_SCALE * day_count)`` rounded half up to the cent;
+* day ``k``'s ledger entry is that figure minus the one through ``k - 1``,
+
+so any run of daily rows sums exactly to the closed-form total (no drift
+from rounding every day), and posted days never change: ``P`` up to a day
+only depends on draws approved by then.
+
+``accrue`` walks ACTIVE loans with draws that are behind ``through`` in
+primary-key (keyset) chunks and computes every missing day of the chunk in
+one NumPy pass (``daily_accruals``): days are expanded with ``repeat`` and
+each day finds its loan's draws with ``searchsorted``, so catching up a
+week costs the same few array operations as one day. Rows go into
+``InterestAccrual`` with ``bulk_create(ignore_conflicts=True)`` on the
+(loan, date) unique constraint, and ``Loan.accrued_through`` moves forward
+in the same transaction, so reruns and overlapping runs never post a day
+twice. At most ``max_days`` days are posted per loan per run; the rest
+follow on the next run.
+"""
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .amortization import INT64_MAX, default_rate, np, to_cents
+from .models import InterestAccrual, Loan, WithdrawalRequest
+
+RATE_PLACES = 8
+RATE_SCALE = 10 ** RATE_PLACES  # annual rates as integers at this scale: 0.18 -> 18000000
+
+LOAN_FIELDS = ('pk', 'accrued_through')
+
+
+def annual_fee_rate():
+    return Decimal(str(getattr(settings, 'LOAN_ANNUAL_FEE_RATE', '0')))
+
+
+def day_count():
+    return int(getattr(settings, 'LOAN_ACCRUAL_DAY_COUNT', 365))
+
+
+def scaled_rate(rate):
+    """``rate`` as an integer at ``RATE_SCALE``; rates with more places are rejected, not rounded."""
+    scaled = Decimal(str(rate)).scaleb(RATE_PLACES)
+    if scaled != scaled.to_integral_value():
+        raise ValueError(f'Annual rate {rate} has more than {RATE_PLACES} decimal places.')
+    return int(scaled)
+
+
+def accrued_cents(principal_days, rate, basis):
+    """Cents accrued on ``principal_days`` (cent-days) at ``rate``, rounded half up."""
+    denominator = RATE_SCALE * basis
+    return (2 * principal_days * rate + denominator) // (2 * denominator)
+
+
+def accrued_to_day(principal_cents, rate, day, basis):
+    """Cents accrued from day 1 through ``day`` on a constant principal (the closed form, single loan)."""
+    return accrued_cents(principal_cents * day, rate, basis)
+
+
+def daily_accruals(draw_loan, draw_day, draw_cents, rate, first_day, days, basis):
+    """Expand loans into daily ledger entries.
+
+    Draws are three equal-length integer sequences: the loan (index into ``first_day`` and
+    ``days``), the loan day it was drawn on (1 = the first draw) and its cents, in any order.
+    ``first_day`` (day number of the loan's first missing day) and ``days`` (how many days to
+    post) have one element per loan; ``rate`` is one scaled rate. Returns
+    ``(loan_index, day_offset, principal_cents, cents)`` integer arrays, one element per
+    posted day, ordered by loan then day.
+    """
+    if np is None:
+        return _daily_accruals_python(draw_loan, draw_day, draw_cents, rate, first_day, days, basis)
+    first_day = np.asarray(first_day, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    total = int(days.sum())
+    index = np.repeat(np.arange(len(days)), days)
+    # Position of each row inside its loan's run: 0, 1, ... days - 1.
+    starts = np.cumsum(days) - days
+    offset = np.arange(total, dtype=np.int64) - np.repeat(starts, days)
+    day = first_day[index] + offset
+
+    # Draws sorted by (loan, day) as one key; prefix sums give C and W per row.
+    draw_loan = np.asarray(draw_loan, dtype=np.int64)
+    draw_day = np.asarray(draw_day, dtype=np.int64)
+    draw_cents = np.asarray(draw_cents, dtype=np.int64)
+    stride = max(int(day.max()) if total else 0, int(draw_day.max()) if len(draw_day) else 0) + 1
+    keys = draw_loan * stride + draw_day
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    drawn = np.concatenate(([0], np.cumsum(draw_cents[order])))
+    weighted = np.concatenate(([0], np.cumsum(draw_cents[order] * draw_day[order])))
+    upto = np.searchsorted(keys, index * stride + day, side='right')
+    loan_start = np.searchsorted(keys, index * stride, side='left')
+    principal = drawn[upto] - drawn[loan_start]
+    principal_days = (day + 1) * principal - (weighted[upto] - weighted[loan_start])
+
+    denominator = RATE_SCALE * basis
+    peak = int(principal_days.max()) if total else 0
+    dtype = object if 2 * peak * rate + denominator > INT64_MAX else np.int64
+    principal_days = principal_days.astype(dtype)
+    through = (2 * principal_days * rate + denominator) // (2 * denominator)
+    # P(k - 1) = P(k) - C(k): yesterday's principal-days lack today's principal.
+    before = (2 * (principal_days - principal.astype(dtype)) * rate + denominator) // (2 * denominator)
+    return index, offset, principal, (through - before).astype(np.int64)
+
+
+def _daily_accruals_python(draw_loan, draw_day, draw_cents, rate, first_day, days, basis):
+    draws = [[] for _ in days]
+    for loan, day, cents in zip(draw_loan, draw_day, draw_cents):
+        draws[loan].append((day, cents))
+    index, offsets, principals, cents = [], [], [], []
+    for i, (first, count) in enumerate(zip(first_day, days)):
+        for offset in range(count):
+            day = first + offset
+            principal = sum(c for d, c in draws[i] if d <= day)
+            principal_days = sum(c * (day - d + 1) for d, c in draws[i] if d <= day)
+            index.append(i)
+            offsets.append(offset)
+            principals.append(principal)
+            cents.append(accrued_cents(principal_days, rate, basis) - accrued_cents(principal_days - principal, rate, basis))
+    return index, offsets, principals, cents
+
+
+def _cents_to_decimal(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def drawn():
+    """Withdrawals that count as drawn principal."""
+    return WithdrawalRequest.objects.filter(status='APPROVED')
+
+
+def due(through):
+    """ACTIVE loans with drawn principal and days not yet posted up to ``through``."""
+    return Loan.objects.filter(status='ACTIVE').filter(
+        Exists(drawn().filter(loan=OuterRef('pk'))),
+        Q(accrued_through__isnull=True) | Q(accrued_through__lt=through),
+    )
+
+
+def draws_by_loan(loan_ids):
+    """``{loan id: [(draw date, cents), ...]}``; a draw is dated by its approval."""
+    draws = {}
+    rows = drawn().filter(loan_id__in=loan_ids).values_list('loan_id', 'amount', 'processed_at', 'created_at')
+    for loan_id, amount, processed_at, created_at in rows:
+        draws.setdefault(loan_id, []).append((timezone.localdate(processed_at or created_at).toordinal(), to_cents(amount)))
+    return draws
+
+
+def accrue_chunk(rows, through, *, rate, fee_rate, basis, max_days):
+    """Post the missing days of one chunk of ``LOAN_FIELDS`` rows; returns ``(loans, entries)``."""
+    first_day, days, start_ordinals, loan_ids, last_days = [], [], [], [], []
+    draw_loan, draw_day, draw_cents = [], [], []
+    through_ordinal = through.toordinal()
+    draws = draws_by_loan([pk for pk, _ in rows])
+    for pk, accrued_through in rows:
+        if pk not in draws:
+            continue
+        start = min(ordinal for ordinal, _ in draws[pk])
+        # Day numbers count from 1 on the first draw; resume after the last posted day.
+        first = max(start, accrued_through.toordinal() + 1 if accrued_through else start)
+        count = min(through_ordinal - first + 1, max_days)
+        if count <= 0:
+            continue
+        for ordinal, cents in draws[pk]:
+            draw_loan.append(len(loan_ids))
+            draw_day.append(ordinal - start + 1)
+            draw_cents.append(cents)
+        loan_ids.append(pk)
+        first_day.append(first - start + 1)
+        days.append(count)
+        start_ordinals.append(start)
+        last_days.append(first + count - 1)
+    if not loan_ids:
+        return 0, 0
+
+    index, offset, principal, interest = daily_accruals(draw_loan, draw_day, draw_cents, rate, first_day, days, basis)
+    fees = daily_accruals(draw_loan, draw_day, draw_cents, fee_rate, first_day, days, basis)[3] if fee_rate else None
+    annual = Decimal(rate).scaleb(-RATE_PLACES)
+    entries = [
+        InterestAccrual(
+            loan_id=loan_ids[i],
+            date=date.fromordinal(start_ordinals[i] + first_day[i] - 1 + int(k)),
+            principal=_cents_to_decimal(principal[n]),
+            annual_rate=annual,
+            interest=_cents_to_decimal(cents),
+            fee=_cents_to_decimal(fees[n]) if fees is not None else Decimal('0.00'),
+        )
+        for n, (i, k, cents) in enumerate(zip(index, offset, interest))
+    ]
+
+    by_last_day = {}
+    for pk, last in zip(loan_ids, last_days):
+        by_last_day.setdefault(last, []).append(pk)
+    with transaction.atomic():
+        InterestAccrual.objects.bulk_create(entries, batch_size=5000, ignore_conflicts=True)
+        # Usually one UPDATE: every loan caught up to the same day.
+        for last, pks in by_last_day.items():
+            Loan.objects.filter(pk__in=pks).update(accrued_through=date.fromordinal(last))
+    return len(loan_ids), len(entries)
+
+
+def accrue(through=None, *, chunk_size=10000, max_days=31, queryset=None, progress=None):
+    """Post daily accruals for ACTIVE loans with drawn principal up to ``through`` (default: yesterday).
+
+    Returns ``{'through', 'loans', 'entries', 'seconds', 'rate'}``; ``rate`` is loans per second.
+    """
+    through = through or timezone.localdate() - timedelta(days=1)
+    rate = scaled_rate(default_rate())
+    fee_rate = scaled_rate(annual_fee_rate())
+    basis = day_count()
+    queryset = due(through) if queryset is None else queryset & due(through)
+    rows = queryset.order_by('pk').values_list(*LOAN_FIELDS)
+
+    stats = {'through': through, 'loans': 0, 'entries': 0}
+    started = time.perf_counter()
+    last_pk = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+        loans, entries = accrue_chunk(chunk, through, rate=rate, fee_rate=fee_rate, basis=basis, max_days=max_days)
+        stats['loans'] += loans
+        stats['entries'] += entries
+        last_pk = chunk[-1][0]
+        if progress:
+            progress(stats)
+    stats['seconds'] = time.perf_counter() - started
+    stats['rate'] = stats['loans'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
@@ -1,21 +1,30 @@
+import itertools
+import json
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils import timezone
-from .models import User, Profile, BankDetail, Loan, AuditLog, WithdrawalRequest
+from django.utils.html import format_html
+from .models import User, Profile, BankDetail, Loan, AuditLog, WithdrawalRequest, PayoutBatch, ProfileDump, DailySummary, InterestAccrual, UnderwritingRule
+from . import amortization, archive, audit, payouts, profiling, protected_media, underwriting
+from .forms import AuditArchiveSearchForm
+from .replicas import ReplicaChangelistMixin
+from .search import BorrowerSearchMixin
 from django.contrib import messages
 
 def approve_loan(modeladmin, request, queryset):
 	for loan in queryset:
 		if loan.status == 'PENDING':
 			loan.status = 'APPROVED'
+			loan.approved_at = timezone.now()
 			if not loan.approved_amount:
 				loan.approved_amount = loan.requested_amount
-			loan.save()
-			AuditLog.objects.create(
-				admin=request.user,
-				action='APPROVED',
-				entity_type='Loan',
-				entity_id=loan.id
-			)
+			with audit.action('APPROVED'):
+				loan.save()
 			messages.success(request, f"Loan {loan.id} approved.")
 approve_loan.short_description = "Approve selected loans"
 
@@ -23,39 +32,88 @@ def reject_loan(modeladmin, request, queryset):
 	for loan in queryset:
 		if loan.status == 'PENDING':
 			loan.status = 'REJECTED'
-			loan.save()
-			AuditLog.objects.create(
-				admin=request.user,
-				action='REJECTED',
-				entity_type='Loan',
-				entity_id=loan.id
-			)
+			with audit.action('REJECTED'):
+				loan.save()
 			messages.success(request, f"Loan {loan.id} rejected.")
 reject_loan.short_description = "Reject selected loans"
 
+def repayment_summary(modeladmin, request, queryset):
+	# Whole selection in one vectorized pass; use "select all" for the full book
+	summary = amortization.book_summary(queryset)
+	context = {
+		**modeladmin.admin_site.each_context(request),
+		'title': "Repayment summary",
+		'opts': modeladmin.model._meta,
+		'summary': summary,
+	}
+	return TemplateResponse(request, 'admin/loan/loan/repayment_summary.html', context)
+repayment_summary.short_description = "Repayment summary for selected loans"
+
+def run_underwriting(modeladmin, request, queryset):
+	stats = underwriting.underwrite(queryset, admin=request.user)
+	decisions = ", ".join(f"{count} {decision.lower()}" for decision, count in stats['decisions'].most_common())
+	messages.success(request, f"Underwriting evaluated {stats['evaluated']} pending loans ({decisions or 'none'}); {stats['written']} decided.")
+run_underwriting.short_description = "Run underwriting rules on selected pending loans"
+
 @admin.register(Loan)
-class LoanAdmin(admin.ModelAdmin):
+class LoanAdmin(ReplicaChangelistMixin, BorrowerSearchMixin, admin.ModelAdmin):
 	list_display = ('id', 'user', 'requested_amount', 'approved_amount', 'status', 'created_at')
 	list_filter = ('status', 'created_at')
-	actions = [approve_loan, reject_loan]
+	list_select_related = ('user',)
+	search_fields = ('id', 'user__email', 'user__phone', 'user__full_name', 'user__bank_detail__account_last4')
+	search_id_fields = ('pk',)
+	actions = [approve_loan, reject_loan, run_underwriting, repayment_summary]
 
 @admin.register(AuditLog)
-class AuditLogAdmin(admin.ModelAdmin):
+class AuditLogAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
 	list_display = ('admin', 'action', 'entity_type', 'entity_id', 'timestamp')
 	list_filter = ('action', 'entity_type', 'timestamp')
+	readonly_fields = ('details',)
+
+	def get_urls(self):
+		urls = [
+			path('archive/', self.admin_site.admin_view(self.archive_search_view), name='loan_auditlog_archive'),
+		]
+		return urls + super().get_urls()
+
+	def archive_search_view(self, request):
+		if not self.has_view_permission(request):
+			raise Http404
+		form = AuditArchiveSearchForm(request.GET or None, initial={'include_live': True})
+		limit = getattr(settings, 'AUDIT_ARCHIVE_SEARCH_LIMIT', 200)
+		rows = None
+		if form.is_valid():
+			matches = archive.search(
+				form.filters(),
+				start=form.cleaned_data['date_from'],
+				end=form.cleaned_data['date_to'],
+				include_live=form.cleaned_data['include_live'],
+			)
+			if request.GET.get('format') == 'jsonl':
+				lines = (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in matches)
+				resp = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+				resp['Content-Disposition'] = 'attachment; filename="auditlog-search.jsonl"'
+				return resp
+			rows = list(itertools.islice(matches, limit + 1))
+		context = {
+			**self.admin_site.each_context(request),
+			'title': "Search audit log archive",
+			'opts': self.model._meta,
+			'form': form,
+			'rows': rows[:limit] if rows is not None else None,
+			'truncated': rows is not None and len(rows) > limit,
+			'limit': limit,
+			'segments': archive.indexes(),
+		}
+		return TemplateResponse(request, 'admin/loan/auditlog/archive_search.html', context)
 
 def approve_withdrawal(modeladmin, request, queryset):
 	for withdrawal in queryset:
 		if withdrawal.status == 'PENDING':
 			withdrawal.status = 'APPROVED'
 			withdrawal.processed_at = timezone.now()
-			withdrawal.save()
-			AuditLog.objects.create(
-				admin=request.user,
-				action='APPROVED_WITHDRAWAL',
-				entity_type='WithdrawalRequest',
-				entity_id=withdrawal.id
-			)
+			with audit.action('APPROVED_WITHDRAWAL'):
+				withdrawal.save()
 			messages.success(request, f"Withdrawal {withdrawal.id} approved.")
 approve_withdrawal.short_description = "Approve selected withdrawals"
 
@@ -64,22 +122,177 @@ def reject_withdrawal(modeladmin, request, queryset):
 		if withdrawal.status == 'PENDING':
 			withdrawal.status = 'REJECTED'
 			withdrawal.processed_at = timezone.now()
-			withdrawal.save()
-			AuditLog.objects.create(
-				admin=request.user,
-				action='REJECTED_WITHDRAWAL',
-				entity_type='WithdrawalRequest',
-				entity_id=withdrawal.id
-			)
+			with audit.action('REJECTED_WITHDRAWAL'):
+				withdrawal.save()
 			messages.success(request, f"Withdrawal {withdrawal.id} rejected.")
 reject_withdrawal.short_description = "Reject selected withdrawals"
 
+def create_payout_batch(modeladmin, request, queryset):
+	# Only approved, unbatched withdrawals with bank details are claimed; rows another run holds are skipped
+	batch = payouts.create_batch(queryset, created_by=request.user)
+	if batch is None:
+		messages.warning(request, "None of the selected withdrawals can be paid out (approved, not in a batch, with bank details).")
+		return
+	payouts.generate_file(batch)
+	messages.success(request, f"Payout batch {batch.id} created: {batch.withdrawal_count} withdrawals, {batch.total_amount} total.")
+create_payout_batch.short_description = "Create payout batch from selected withdrawals"
+
 @admin.register(WithdrawalRequest)
-class WithdrawalRequestAdmin(admin.ModelAdmin):
-	list_display = ('id', 'user', 'loan', 'amount', 'status', 'created_at', 'processed_at')
-	list_filter = ('status', 'created_at')
-	actions = [approve_withdrawal, reject_withdrawal]
+class WithdrawalRequestAdmin(ReplicaChangelistMixin, BorrowerSearchMixin, admin.ModelAdmin):
+	list_display = ('id', 'user', 'loan', 'amount', 'status', 'created_at', 'processed_at', 'payout_batch', 'paid_at')
+	list_filter = ('status', 'created_at', ('paid_at', admin.EmptyFieldListFilter))
+	list_select_related = ('user', 'loan__user', 'payout_batch')
+	search_fields = ('id', 'loan__id', 'user__email', 'user__phone', 'user__full_name', 'user__bank_detail__account_last4')
+	search_id_fields = ('pk', 'loan_id')
+	actions = [approve_withdrawal, reject_withdrawal, create_payout_batch]
+
+def mark_batches_paid(modeladmin, request, queryset):
+	for batch in queryset.filter(status='GENERATED'):
+		paid = payouts.mark_paid(batch, admin=request.user)
+		messages.success(request, f"Payout batch {batch.id} marked paid ({paid} withdrawals).")
+mark_batches_paid.short_description = "Mark selected batches paid"
+
+def cancel_batches(modeladmin, request, queryset):
+	for batch in queryset.exclude(status__in=['PAID', 'CANCELLED']):
+		try:
+			released = payouts.cancel(batch)
+		except ValueError as exc:
+			messages.error(request, str(exc))
+		else:
+			messages.success(request, f"Payout batch {batch.id} cancelled; {released} withdrawals released.")
+cancel_batches.short_description = "Cancel selected batches"
+
+@admin.register(PayoutBatch)
+class PayoutBatchAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+	list_display = ('id', 'status', 'file_format', 'withdrawal_count', 'total_amount', 'created_by', 'created_at', 'generated_at', 'paid_at', 'download_link')
+	list_filter = ('status', 'file_format', 'created_at')
+	readonly_fields = ('status', 'withdrawal_count', 'total_amount', 'file_sha256', 'entry_hash', 'created_by', 'created_at', 'generated_at', 'paid_at', 'download_link')
+	exclude = ('file',)
+	actions = [mark_batches_paid, cancel_batches]
+
+	def has_add_permission(self, request):
+		# Batches are created from the withdrawal list or `manage.py payout_batch create`
+		return False
+
+	def get_urls(self):
+		urls = [
+			path('<int:batch_id>/download/', self.admin_site.admin_view(self.download_view), name='loan_payoutbatch_download'),
+		]
+		return urls + super().get_urls()
+
+	def download_link(self, obj):
+		if not obj.file:
+			return '-'
+		return format_html('<a href="{}">Download</a>', reverse('admin:loan_payoutbatch_download', args=[obj.pk]))
+	download_link.short_description = "File"
+
+	def download_view(self, request, batch_id):
+		if not self.has_view_permission(request):
+			raise Http404
+		batch = PayoutBatch.objects.filter(pk=batch_id).first()
+		if batch is None:
+			raise Http404
+		return protected_media.serve_field_file(request, batch.file, filename=batch.file.name.rsplit('/', 1)[-1], as_attachment=True)
+
+@admin.register(ProfileDump)
+class ProfileDumpAdmin(admin.ModelAdmin):
+	list_display = ('created_at', 'url_name', 'method', 'status_code', 'duration_ms', 'query_count', 'trigger', 'size_bytes', 'last_accessed', 'download_link')
+	list_filter = ('trigger', 'url_name', 'created_at')
+	readonly_fields = ('url_name', 'path', 'method', 'status_code', 'duration_ms', 'query_count', 'trigger', 'user', 'file_name', 'size_bytes', 'created_at', 'last_accessed', 'download_link', 'top_functions', 'query_log')
+
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
+
+	def get_urls(self):
+		urls = [
+			path('<int:dump_id>/download/', self.admin_site.admin_view(self.download_view), name='loan_profiledump_download'),
+		]
+		return urls + super().get_urls()
+
+	def download_link(self, obj):
+		return format_html('<a href="{}">Download</a>', reverse('admin:loan_profiledump_download', args=[obj.pk]))
+	download_link.short_description = "Dump"
+
+	def top_functions(self, obj):
+		try:
+			return format_html('<pre>{}</pre>', profiling.top_functions(obj))
+		except OSError:
+			return 'Profile file is missing.'
+	top_functions.short_description = "Top functions (cumulative)"
+
+	def change_view(self, request, object_id, form_url='', extra_context=None):
+		obj = self.get_object(request, object_id)
+		if obj is not None:
+			profiling.touch(obj)
+		return super().change_view(request, object_id, form_url, extra_context)
+
+	def download_view(self, request, dump_id):
+		if not self.has_view_permission(request):
+			raise Http404
+		dump = ProfileDump.objects.filter(pk=dump_id).first()
+		if dump is None:
+			raise Http404
+		try:
+			handle = open(profiling.dump_path(dump), 'rb')
+		except FileNotFoundError:
+			raise Http404
+		profiling.touch(dump)
+		return FileResponse(handle, as_attachment=True, filename=dump.file_name, content_type='application/gzip')
+
+@admin.register(UnderwritingRule)
+class UnderwritingRuleAdmin(admin.ModelAdmin):
+	list_display = ('name', 'kind', 'threshold', 'values', 'outcome', 'priority', 'active', 'updated_at')
+	list_editable = ('priority', 'active')
+	list_filter = ('kind', 'outcome', 'active')
+
+@admin.register(DailySummary)
+class DailySummaryAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+	list_display = ('day', 'kind', 'status', 'count', 'amount_total', 'approved_total', 'updated_at')
+	list_filter = ('kind', 'status')
+	date_hierarchy = 'day'
+
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
+
+@admin.register(InterestAccrual)
+class InterestAccrualAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+	list_display = ('loan', 'date', 'principal', 'annual_rate', 'interest', 'fee')
+	list_filter = ('date',)
+	date_hierarchy = 'date'
+	raw_id_fields = ('loan',)
+	# Ledger of millions of rows: skip the unfiltered COUNT(*) on every page
+	show_full_result_count = False
+
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
+
+@admin.register(User)
+class UserAdmin(ReplicaChangelistMixin, BorrowerSearchMixin, admin.ModelAdmin):
+	list_display = ('email', 'full_name', 'phone', 'is_active', 'is_staff', 'created_at')
+	list_filter = ('is_active', 'is_staff', 'email_verified')
+	search_fields = ('email', 'phone', 'full_name', 'bank_detail__account_last4', 'loans__id')
+	search_user_field = 'pk'
+	search_loan_owners = True
+
+@admin.register(Profile)
+class ProfileAdmin(ReplicaChangelistMixin, BorrowerSearchMixin, admin.ModelAdmin):
+	list_display = ('user', 'city', 'state', 'employment_status', 'completed')
+	list_select_related = ('user',)
+	search_fields = ('user__email', 'user__phone', 'user__full_name', 'user__bank_detail__account_last4', 'user__loans__id')
+	search_loan_owners = True
 
-admin.site.register(User)
-admin.site.register(Profile)
-admin.site.register(BankDetail)
+@admin.register(BankDetail)
+class BankDetailAdmin(ReplicaChangelistMixin, BorrowerSearchMixin, admin.ModelAdmin):
+	list_display = ('user', 'bank_name', 'account_name', 'account_last4', 'created_at')
+	list_select_related = ('user',)
+	search_fields = ('user__email', 'user__phone', 'user__full_name', 'account_last4', 'user__loans__id')
+	search_loan_owners = True
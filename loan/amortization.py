@@ -0,0 +1,304 @@
+"""Level-payment amortization and affordability.
+
+All money is handled in integer cents and every rounding step is explicit
+ROUND_HALF_UP, so the single-loan path (``quote``) and the whole-book path
+(``amortize_book``) produce identical figures:
+
+* monthly rate ``r = annual_rate / 12`` quantized to ``RATE_PLACES`` decimals;
+* installment ``= principal * annuity_factor(r, n)`` rounded to the cent, with
+  the factor quantized to ``FACTOR_PLACES`` decimals;
+* each month's interest is ``balance * r`` rounded to the cent, the rest of
+  the installment repays principal, and the final installment clears the
+  remaining balance;
+* debt-to-income is ``installment / monthly_income`` quantized to 4 places.
+
+``amortize_book`` evaluates all loans with NumPy array arithmetic, one pass
+per month of the longest term. Products are checked against int64 before the
+loop and fall back to Python integers (object arrays) when they could
+overflow; without NumPy it falls back to ``quote`` per loan.
+"""
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional in slim environments
+    np = None
+
+RATE_PLACES = 10
+FACTOR_PLACES = 10
+SCALE = 10 ** RATE_PLACES  # rates and factors are stored as integers at this scale
+CENT = Decimal('0.01')
+DTI_QUANTUM = Decimal('0.0001')
+INT64_MAX = 2 ** 63 - 1
+
+
+@dataclass
+class Installment:
+    number: int
+    payment: Decimal
+    interest: Decimal
+    principal: Decimal
+    balance: Decimal
+
+
+@dataclass
+class Quote:
+    principal: Decimal
+    annual_rate: Decimal
+    term_months: int
+    installment: Decimal
+    total_interest: Decimal
+    total_cost: Decimal
+    debt_to_income: Decimal | None = None
+    schedule: list = field(default_factory=list)
+
+    @property
+    def affordable(self):
+        if self.debt_to_income is None:
+            return None
+        return self.debt_to_income <= dti_limit()
+
+
+def default_rate():
+    return Decimal(str(getattr(settings, 'LOAN_ANNUAL_RATE', '0.18')))
+
+
+def dti_limit():
+    return Decimal(str(getattr(settings, 'LOAN_DTI_LIMIT', '0.40')))
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).quantize(Decimal(1), ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return (Decimal(int(cents)) / 100).quantize(CENT)
+
+
+def _div_half_up(numerator, denominator):
+    """Integer ``numerator / denominator`` rounded half up (non-negative numerator)."""
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def monthly_rate(annual_rate):
+    """Monthly rate as an integer scaled by ``SCALE``."""
+    rate = (Decimal(str(annual_rate)) / 12).quantize(Decimal(1).scaleb(-RATE_PLACES), ROUND_HALF_UP)
+    return int(rate.scaleb(RATE_PLACES))
+
+
+def annuity_factor(rate, term_months):
+    """Installment per unit of principal for a scaled monthly ``rate``, scaled by ``SCALE``."""
+    term_months = int(term_months)
+    if term_months <= 0:
+        raise ValueError('term_months must be positive')
+    if rate == 0:
+        factor = Decimal(1) / term_months
+    else:
+        r = Decimal(rate).scaleb(-RATE_PLACES)
+        factor = r / (1 - (1 + r) ** -term_months)
+    return int(factor.quantize(Decimal(1).scaleb(-FACTOR_PLACES), ROUND_HALF_UP).scaleb(FACTOR_PLACES))
+
+
+def dti_basis(installment_cents, income_cents):
+    """Debt-to-income in units of ``DTI_QUANTUM``; ``None`` without a positive income."""
+    if not income_cents or income_cents <= 0:
+        return None
+    return _div_half_up(installment_cents * 10000, income_cents)
+
+
+def quote(principal, term_months, annual_rate=None, monthly_income=None, schedule=True):
+    """Amortize one loan; ``principal`` and ``monthly_income`` are Decimals (or strings)."""
+    annual_rate = default_rate() if annual_rate is None else Decimal(str(annual_rate))
+    term_months = int(term_months)
+    rate = monthly_rate(annual_rate)
+    balance = to_cents(principal)
+    payment = _div_half_up(balance * annuity_factor(rate, term_months), SCALE)
+
+    rows = []
+    total_interest = 0
+    for number in range(1, term_months + 1):
+        interest = _div_half_up(balance * rate, SCALE)
+        if number == term_months:
+            repaid = balance
+            paid = balance + interest
+        else:
+            repaid = payment - interest
+            paid = payment
+        balance -= repaid
+        total_interest += interest
+        if schedule:
+            rows.append(Installment(number, from_cents(paid), from_cents(interest), from_cents(repaid), from_cents(balance)))
+
+    principal_cents = to_cents(principal)
+    dti = None
+    if monthly_income is not None:
+        bp = dti_basis(payment, to_cents(monthly_income))
+        dti = None if bp is None else Decimal(bp) * DTI_QUANTUM
+    return Quote(
+        principal=from_cents(principal_cents),
+        annual_rate=annual_rate,
+        term_months=term_months,
+        installment=from_cents(payment),
+        total_interest=from_cents(total_interest),
+        total_cost=from_cents(principal_cents + total_interest),
+        debt_to_income=dti,
+        schedule=rows,
+    )
+
+
+def quote_loan(loan, annual_rate=None, schedule=True):
+    """``quote`` for a ``Loan``: approved amount when set, otherwise the requested amount."""
+    return quote(
+        loan.approved_amount or loan.requested_amount,
+        loan.term_months,
+        annual_rate=annual_rate,
+        monthly_income=loan.monthly_income,
+        schedule=schedule,
+    )
+
+
+def amortize_book(principal_cents, terms, annual_rates=None, income_cents=None, with_schedule=False):
+    """Amortize many loans at once.
+
+    ``principal_cents`` and ``terms`` are equal-length integer sequences;
+    ``annual_rates`` is a sequence of Decimals or ``None`` for the default
+    rate, ``income_cents`` an optional sequence (0 for unknown). Returns a dict
+    of integer arrays: ``installment``, ``total_interest``, ``total_cost`` (all
+    cents) and ``dti`` in ``DTI_QUANTUM`` units (-1 where income is unknown).
+    With ``with_schedule`` it also returns ``payment``, ``interest``,
+    ``principal`` and ``balance`` arrays of shape ``(loans, max_term)``.
+    """
+    if np is None:
+        return _amortize_book_python(principal_cents, terms, annual_rates, income_cents, with_schedule)
+
+    principal = np.asarray(principal_cents, dtype=object if _exceeds_int64(principal_cents) else np.int64)
+    terms = np.asarray(terms, dtype=np.int64)
+    count = len(terms)
+    if annual_rates is None:
+        rates = np.full(count, monthly_rate(default_rate()), dtype=np.int64)
+    else:
+        unique_rates = {value: monthly_rate(value) for value in set(annual_rates)}
+        rates = np.fromiter((unique_rates[value] for value in annual_rates), dtype=np.int64, count=count)
+
+    # One Decimal annuity factor per distinct (rate, term) pair, scattered back by index.
+    max_term = int(terms.max()) if count else 0
+    keys, inverse = np.unique(rates * (max_term + 1) + terms, return_inverse=True)
+    factor_table = np.array(
+        [annuity_factor(int(key) // (max_term + 1), int(key) % (max_term + 1)) for key in keys], dtype=np.int64
+    )
+    factors = factor_table[inverse.reshape(-1)]
+
+    peak = int(principal.max()) if count else 0
+    big = peak * max(int(factors.max()) if count else 0, int(rates.max()) if count else 0) * 2 + SCALE > INT64_MAX
+    dtype = object if big else np.int64
+    principal = principal.astype(dtype)
+    factors = factors.astype(dtype)
+    rates = rates.astype(dtype)
+
+    payment = (2 * principal * factors + SCALE) // (2 * SCALE)
+    balance = principal.copy()
+    total_interest = np.zeros(count, dtype=dtype)
+    if with_schedule:
+        schedule = {key: np.zeros((count, max_term), dtype=dtype) for key in ('payment', 'interest', 'principal', 'balance')}
+
+    for month in range(1, max_term + 1):
+        active = terms >= month
+        last = terms == month
+        interest = np.where(active, (2 * balance * rates + SCALE) // (2 * SCALE), 0)
+        repaid = np.where(last, balance, np.where(active, payment - interest, 0))
+        balance = balance - repaid
+        total_interest += interest
+        if with_schedule:
+            column = month - 1
+            schedule['payment'][:, column] = repaid + interest
+            schedule['interest'][:, column] = interest
+            schedule['principal'][:, column] = repaid
+            schedule['balance'][:, column] = balance
+
+    result = {
+        'installment': payment,
+        'total_interest': total_interest,
+        'total_cost': principal + total_interest,
+        'dti': _book_dti(payment, income_cents, count, dtype),
+    }
+    if with_schedule:
+        result.update(schedule)
+    return result
+
+
+def _exceeds_int64(values):
+    try:
+        return max(values, default=0) > INT64_MAX
+    except TypeError:
+        return False
+
+
+def _book_dti(payment, income_cents, count, dtype):
+    if income_cents is None:
+        return np.full(count, -1, dtype=np.int64)
+    income = np.asarray(income_cents, dtype=dtype)
+    known = income > 0
+    safe = np.where(known, income, 1)
+    return np.where(known, (2 * payment * 10000 + safe) // (2 * safe), -1)
+
+
+def _amortize_book_python(principal_cents, terms, annual_rates, income_cents, with_schedule):
+    rates = annual_rates or [None] * len(terms)
+    incomes = income_cents or [0] * len(terms)
+    result = {'installment': [], 'total_interest': [], 'total_cost': [], 'dti': []}
+    if with_schedule:
+        result.update(payment=[], interest=[], principal=[], balance=[])
+    for cents, term, rate, income in zip(principal_cents, terms, rates, incomes):
+        q = quote(from_cents(cents), term, annual_rate=rate, monthly_income=from_cents(income) if income else None, schedule=with_schedule)
+        result['installment'].append(to_cents(q.installment))
+        result['total_interest'].append(to_cents(q.total_interest))
+        result['total_cost'].append(to_cents(q.total_cost))
+        result['dti'].append(-1 if q.debt_to_income is None else int(q.debt_to_income / DTI_QUANTUM))
+        if with_schedule:
+            for key in ('payment', 'interest', 'principal', 'balance'):
+                result[key].append([to_cents(getattr(row, key)) for row in q.schedule])
+    return result
+
+
+def book_summary(loans, annual_rate=None):
+    """Totals for a ``Loan`` queryset, computed with ``amortize_book`` in one pass.
+
+    Principal is the approved amount, falling back to the requested amount.
+    """
+    principal_cents = []
+    terms = []
+    income_cents = []
+    for approved, requested, term, income in loans.values_list(
+        'approved_amount', 'requested_amount', 'term_months', 'monthly_income'
+    ).iterator(chunk_size=10000):
+        principal_cents.append(to_cents(approved or requested))
+        terms.append(term)
+        income_cents.append(to_cents(income) if income else 0)
+
+    count = len(terms)
+    if not count:
+        return {'loans': 0}
+    rates = None if annual_rate is None else [annual_rate] * count
+    book = amortize_book(principal_cents, terms, annual_rates=rates, income_cents=income_cents)
+    installment_total = _total(book['installment'])
+    dti = [v for v in book['dti'] if v >= 0] if np is None else book['dti'][book['dti'] >= 0]
+    limit = int(dti_limit() / DTI_QUANTUM)
+    return {
+        'loans': count,
+        'annual_rate': default_rate() if annual_rate is None else Decimal(str(annual_rate)),
+        'principal': from_cents(sum(principal_cents)),
+        'monthly_installments': from_cents(installment_total),
+        'average_installment': from_cents(_div_half_up(installment_total, count)),
+        'total_interest': from_cents(_total(book['total_interest'])),
+        'total_cost': from_cents(_total(book['total_cost'])),
+        'average_dti': Decimal(_div_half_up(_total(dti), len(dti))) * DTI_QUANTUM if len(dti) else None,
+        'over_dti_limit': sum(1 for v in dti if v > limit) if np is None else int((dti > limit).sum()),
+        'dti_limit': dti_limit(),
+    }
+
+
+def _total(values):
+    return int(values.sum()) if hasattr(values, 'sum') else sum(values)
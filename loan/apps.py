@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class LoanConfig(AppConfig):
     name = 'loan'
+
+    def ready(self):
+        from . import signals  # noqa: F401
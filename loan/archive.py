@@ -0,0 +1,228 @@
+"""AuditLog retention: archive old rows to compressed JSONL segments.
+
+``archive_before(cutoff)`` moves whole days older than ``cutoff`` out of the
+table. Each day becomes one or more segments under ``AUDIT_ARCHIVE_DIR``::
+
+    2025/03/auditlog-2025-03-14-000123.jsonl.gz    one JSON object per row, id order
+    2025/03/auditlog-2025-03-14-000123.index.json  day, rows, id range, action/entity counts
+
+The segment is written to a temporary name and renamed, then its index, and
+only then are the archived rows deleted, in ``batch_size`` batches with one
+short transaction each. A run interrupted between writing and deleting is
+safe to repeat: rows whose ids fall inside an indexed segment for that day
+are deleted without being written again.
+
+``search`` yields matching rows from the live table and then from the
+segments. Indexes prune segments by day, action and entity type; the
+remaining segments are streamed line by line and each line is parsed
+only when it passes a substring prefilter, so memory use does not depend on
+segment size.
+"""
+import gzip
+import json
+import os
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AuditLog
+
+ROW_FIELDS = ('id', 'admin_id', 'action', 'entity_type', 'entity_id', 'details', 'timestamp')
+
+
+def archive_dir():
+    return Path(getattr(settings, 'AUDIT_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'var' / 'audit-archive'))
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def segment_stem(day, first_id):
+    return Path(f'{day:%Y}') / f'{day:%m}' / f'auditlog-{day.isoformat()}-{first_id:06d}'
+
+
+def _read_index(path):
+    with open(path) as f:
+        index = json.load(f)
+    index['path'] = str(path.with_name(path.name.replace('.index.json', '.jsonl.gz')))
+    return index
+
+
+def indexes(start=None, end=None):
+    """Parsed segment indexes (with ``path`` added), oldest first, optionally limited to a day range."""
+    root = archive_dir()
+    if not root.exists():
+        return []
+    found = []
+    for path in sorted(root.glob('*/*/auditlog-*.index.json')):
+        day = date.fromisoformat(path.name[len('auditlog-'):len('auditlog-') + 10])
+        if (start and day < start) or (end and day > end):
+            continue
+        found.append(_read_index(path))
+    return found
+
+
+def day_indexes(day):
+    folder = archive_dir() / segment_stem(day, 0).parent
+    return [_read_index(path) for path in sorted(folder.glob(f'auditlog-{day.isoformat()}-*.index.json'))]
+
+
+def _write_json(path, data):
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def archive_day(day, batch_size=5000, dry_run=False):
+    """Archive and delete every AuditLog row timestamped on ``day``; returns ``(written, deleted)``."""
+    start, end = _day_bounds(day)
+    rows = AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by('pk')
+    archived = [(index['min_id'], index['max_id']) for index in day_indexes(day)]
+
+    def already_archived(pk):
+        return any(low <= pk <= high for low, high in archived)
+
+    pending = rows.values_list('pk', flat=True)
+    if dry_run:
+        ids = list(pending)
+        return sum(1 for pk in ids if not already_archived(pk)), 0
+
+    stats = {'rows': 0, 'min_id': None, 'max_id': None, 'actions': Counter(), 'entity_types': Counter(),
+             'first_timestamp': None, 'last_timestamp': None}
+    stem = None
+    tmp = None
+    out = None
+    try:
+        for row in rows.values(*ROW_FIELDS).iterator(chunk_size=batch_size):
+            if already_archived(row['id']):
+                continue
+            if out is None:
+                stem = archive_dir() / segment_stem(day, row['id'])
+                stem.parent.mkdir(parents=True, exist_ok=True)
+                tmp = stem.with_name(stem.name + '.jsonl.gz.tmp')
+                out = gzip.open(tmp, 'wt', encoding='utf-8')
+                stats['min_id'] = row['id']
+                stats['first_timestamp'] = row['timestamp'].isoformat()
+            out.write(json.dumps(row, cls=DjangoJSONEncoder, sort_keys=True))
+            out.write('\n')
+            stats['rows'] += 1
+            stats['max_id'] = row['id']
+            stats['last_timestamp'] = row['timestamp'].isoformat()
+            stats['actions'][row['action']] += 1
+            stats['entity_types'][row['entity_type']] += 1
+    except BaseException:
+        if out is not None:
+            out.close()
+            os.remove(tmp)
+        raise
+
+    if out is not None:
+        out.close()
+        os.replace(tmp, stem.with_name(stem.name + '.jsonl.gz'))
+        _write_json(stem.with_name(stem.name + '.index.json'), {
+            'day': day.isoformat(),
+            'rows': stats['rows'],
+            'min_id': stats['min_id'],
+            'max_id': stats['max_id'],
+            'first_timestamp': stats['first_timestamp'],
+            'last_timestamp': stats['last_timestamp'],
+            'actions': dict(stats['actions']),
+            'entity_types': dict(stats['entity_types']),
+            'created_at': timezone.now().isoformat(),
+        })
+        archived.append((stats['min_id'], stats['max_id']))
+
+    # Delete only what a segment now covers; rows added to the day meanwhile stay for the next run.
+    deleted = 0
+    for low, high in archived:
+        while True:
+            batch = list(pending.filter(pk__gte=low, pk__lte=high)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                count, _ = AuditLog.objects.filter(pk__in=batch).delete()
+            deleted += count
+    return stats['rows'], deleted
+
+
+def days_before(cutoff):
+    """Days (in the current time zone) with AuditLog rows before ``cutoff``'s day."""
+    start_of_cutoff_day = _day_bounds(timezone.localdate(cutoff))[0]
+    stamps = AuditLog.objects.filter(timestamp__lt=start_of_cutoff_day).datetimes('timestamp', 'day')
+    return [timezone.localdate(stamp) for stamp in stamps]
+
+
+def archive_before(cutoff, batch_size=5000, dry_run=False, progress=None):
+    totals = Counter()
+    for day in days_before(cutoff):
+        written, deleted = archive_day(day, batch_size=batch_size, dry_run=dry_run)
+        totals['days'] += 1
+        totals['written'] += written
+        totals['deleted'] += deleted
+        if progress:
+            progress(day, written, deleted)
+    return totals
+
+
+def _matches(row, filters):
+    for key in ('action', 'entity_type', 'entity_id', 'admin_id'):
+        if filters.get(key) not in (None, '') and row.get(key) != filters[key]:
+            return False
+    return True
+
+
+def _prefilter(filters):
+    """Substrings every matching JSONL line must contain (json.dumps with sort_keys formatting)."""
+    needles = []
+    for key in ('action', 'entity_type', 'entity_id', 'admin_id'):
+        value = filters.get(key)
+        if value not in (None, ''):
+            needles.append(f'"{key}": {json.dumps(value)}')
+    return needles
+
+
+def search_archive(filters, start=None, end=None):
+    """Yield archived rows (dicts, oldest first) matching ``filters``."""
+    needles = _prefilter(filters)
+    for index in indexes(start, end):
+        if filters.get('action') and filters['action'] not in index['actions']:
+            continue
+        if filters.get('entity_type') and filters['entity_type'] not in index['entity_types']:
+            continue
+        try:
+            handle = gzip.open(index['path'], 'rt', encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with handle:
+            for line in handle:
+                if not all(needle in line for needle in needles):
+                    continue
+                row = json.loads(line)
+                if _matches(row, filters):
+                    row['archived'] = True
+                    yield row
+
+
+def search(filters, start=None, end=None, include_live=True):
+    """Rows matching ``filters`` from the live table (newest first), then from the archive."""
+    if include_live:
+        live = AuditLog.objects.order_by('-timestamp', '-pk')
+        for key in ('action', 'entity_type', 'entity_id', 'admin_id'):
+            if filters.get(key) not in (None, ''):
+                live = live.filter(**{key: filters[key]})
+        if start:
+            live = live.filter(timestamp__gte=_day_bounds(start)[0])
+        if end:
+            live = live.filter(timestamp__lt=_day_bounds(end)[1])
+        for row in live.values(*ROW_FIELDS).iterator(chunk_size=1000):
+            row['archived'] = False
+            yield row
+    yield from search_archive(filters, start, end)
@@ -0,0 +1,198 @@
+"""Build-time responsive image variants for static assets.
+
+``manage.py build_assets`` (run before ``collectstatic``) resizes every
+JPEG/PNG in ``STATICFILES_DIRS`` to the ``ASSET_IMAGE_WIDTHS`` narrower than
+the original, encodes each width as AVIF and WebP, and writes them with a
+manifest to ``ASSET_BUILD_DIR``::
+
+    responsive/banner-320w.avif
+    responsive/banner-320w.webp
+    responsive/assets.json   {"banner.jpeg": {"width": 524, "height": 515,
+                              "source_sha256": ..., "variants": {"avif": [[path, 320], ...]}}}
+
+``ASSET_BUILD_DIR`` is itself a static files directory, so ``collectstatic``
+hashes the variants and precompresses text assets (gzip, and Brotli when the
+``Brotli`` package is installed) like any other static file; WhiteNoise then
+serves the hashed names with immutable cache headers. Templates emit the
+markup with ``{% picture %}`` / ``{% responsive_url %}`` from
+``loan/templatetags/assets.py``. Images are rebuilt only when their bytes
+change.
+"""
+import hashlib
+import json
+import os
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+
+from django.conf import settings
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png')
+MANIFEST_NAME = 'responsive/assets.json'
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+# Pillow encoder options per format.
+ENCODE_OPTIONS = {
+    'avif': {'quality': 60, 'speed': 6},
+    'webp': {'quality': 80, 'method': 6},
+}
+
+
+class StaticAssetStorage(CompressedManifestStaticFilesStorage):
+    """Hashed, precompressed static files; a reference to a file that was not collected
+    (e.g. the optional hero video) renders its plain URL instead of failing the page."""
+
+    manifest_strict = False
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            # Only URL lookups (no content) may fall back; post-processing must still fail loudly.
+            if content is None and not self.manifest_strict:
+                return name
+            raise
+
+
+def build_dir():
+    return Path(getattr(settings, 'ASSET_BUILD_DIR', Path(settings.BASE_DIR) / 'build' / 'static'))
+
+
+def widths():
+    return tuple(sorted(getattr(settings, 'ASSET_IMAGE_WIDTHS', (96, 160, 320, 480, 768, 1200))))
+
+
+def formats():
+    """Formats from ``ASSET_IMAGE_FORMATS`` that this Pillow build can encode, best first."""
+    from PIL import features
+
+    wanted = getattr(settings, 'ASSET_IMAGE_FORMATS', ('avif', 'webp'))
+    return tuple(fmt for fmt in wanted if features.check(fmt))
+
+
+def source_dirs():
+    out = build_dir().resolve()
+    for entry in settings.STATICFILES_DIRS:
+        root = Path(entry[1] if isinstance(entry, (list, tuple)) else entry).resolve()
+        if root != out and root.is_dir():
+            yield root
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _variant_name(name, width, fmt):
+    path = PurePosixPath(name)
+    return str(PurePosixPath('responsive') / path.parent / f'{path.stem}-{width}w.{fmt}')
+
+
+def _encode(image, width, fmt, target):
+    """Write ``image`` scaled to ``width`` as ``fmt`` to ``target``; returns the byte size."""
+    from PIL import Image
+
+    if width < image.width:
+        height = round(image.height * width / image.width)
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + '.tmp')
+    image.save(tmp, format=fmt.upper(), **ENCODE_OPTIONS.get(fmt, {}))
+    os.replace(tmp, target)
+    return target.stat().st_size
+
+
+def load_manifest(path=None):
+    path = Path(path) if path else build_dir() / MANIFEST_NAME
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+@lru_cache(maxsize=1)
+def manifest():
+    """The build manifest, read once per process (templates call this on every render)."""
+    return load_manifest()
+
+
+def build(force=False, progress=None):
+    """Generate missing or stale variants; returns ``(images rebuilt, images unchanged, manifest)``."""
+    from PIL import Image
+
+    out = build_dir()
+    previous = load_manifest(out / MANIFEST_NAME)
+    available = formats()
+    result = {}
+    rebuilt = unchanged = 0
+    for root in source_dirs():
+        for path in sorted(root.rglob('*')):
+            if path.suffix.lower() not in IMAGE_SUFFIXES or not path.is_file():
+                continue
+            name = path.relative_to(root).as_posix()
+            digest = _sha256(path)
+            entry = previous.get(name)
+            outputs_exist = entry and all(
+                (out / variant).exists() for variants in entry['variants'].values() for variant, _ in variants
+            )
+            if not force and entry and entry['source_sha256'] == digest and outputs_exist \
+                    and set(entry['variants']) == set(available):
+                result[name] = entry
+                unchanged += 1
+                continue
+            with Image.open(path) as image:
+                image.load()
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+                sizes = [w for w in widths() if w < image.width] + [image.width]
+                source_bytes = path.stat().st_size
+                variants = {}
+                for fmt in available:
+                    variants[fmt] = []
+                    for width in sizes:
+                        variant = _variant_name(name, width, fmt)
+                        # A variant heavier than the whole original is never worth sending.
+                        if _encode(image, width, fmt, out / variant) >= source_bytes:
+                            (out / variant).unlink()
+                            continue
+                        variants[fmt].append([variant, width])
+                result[name] = {
+                    'width': image.width,
+                    'height': image.height,
+                    'bytes': source_bytes,
+                    'source_sha256': digest,
+                    'variants': variants,
+                }
+            rebuilt += 1
+            if progress:
+                progress(name, result[name])
+    out.mkdir(parents=True, exist_ok=True)
+    tmp = out / (MANIFEST_NAME + '.tmp')
+    tmp.parent.mkdir(parents=True, exist_ok=True)
+    with open(tmp, 'w') as f:
+        json.dump(result, f, indent=1, sort_keys=True)
+    os.replace(tmp, out / MANIFEST_NAME)
+    manifest.cache_clear()
+    return rebuilt, unchanged, result
+
+
+def pick(variants, min_width):
+    """The narrowest ``[name, width]`` at least ``min_width`` wide, else the widest."""
+    for name, width in variants:
+        if width >= min_width:
+            return name, width
+    return variants[-1]
+
+
+def best_url_name(name, fmt, min_width):
+    """Static name to use for one image URL: a variant wide enough, else the original."""
+    entry = manifest().get(name)
+    variants = entry['variants'].get(fmt) if entry else None
+    if not variants:
+        return name
+    variant, width = pick(variants, min_width)
+    # Variants lighter than the original may all be narrower than needed.
+    return variant if width >= min(min_width, entry['width']) else name
@@ -0,0 +1,191 @@
+"""Field-level audit trail for models that inherit ``AuditedModel``.
+
+Instances loaded from the database remember their field values
+(``from_db``). After each save the changed fields are recorded as
+``{"changes": {field: [old, new]}}`` in ``AuditLog.details``. Creations
+record every field and deletions record the last known values. Sensitive
+fields are redacted (``REDACTED_FIELDS``) and bookkeeping fields excluded
+(``AuditedModel.audit_exclude``).
+
+Entries are not written one by one. Inside ``audit_context()`` (wrapped
+around every request by ``AuditContextMiddleware``) they are buffered and
+written with a single ``bulk_create`` when the context exits, so an admin
+action touching 1,000 rows costs one INSERT. Changes made inside a
+transaction join the buffer only when it commits (rolled-back changes are
+never audited), and a context that exits inside a transaction flushes on
+commit. Outside any context each entry is written on its own, on commit.
+
+``action('APPROVED')`` labels the entries recorded in its block, so an
+admin action records its intent and the diff in the same row.
+"""
+import contextvars
+import datetime
+import decimal
+import uuid
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import connection, models, transaction
+from django.db.models.fields.files import FieldFile
+
+REDACTED = '[redacted]'
+# field name -> how to present it: None hides the value, a callable masks it
+REDACTED_FIELDS = {
+    'password': None,
+    'password_hash': None,
+    'account_number': lambda value: f'****{value[-4:]}' if value else value,
+}
+
+_buffer = contextvars.ContextVar('audit_buffer', default=None)
+_actor = contextvars.ContextVar('audit_actor', default=None)
+_action = contextvars.ContextVar('audit_action', default=None)
+
+
+class AuditedModel(models.Model):
+    """Abstract base recording create/update/delete diffs to ``AuditLog``."""
+
+    audit_exclude = ('created_at', 'updated_at', 'last_login')
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._audit_snapshot = {
+            name: value for name, value in zip(field_names, values) if value is not models.DEFERRED
+        }
+        return instance
+
+
+def _jsonable(value):
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, FieldFile):
+        return value.name or None
+    return value
+
+
+def _present(name, value):
+    if name in REDACTED_FIELDS and value not in (None, ''):
+        mask = REDACTED_FIELDS[name]
+        return REDACTED if mask is None else mask(value)
+    return _jsonable(value)
+
+
+def _tracked_fields(instance):
+    exclude = instance.audit_exclude
+    return [f for f in instance._meta.concrete_fields if not f.primary_key and f.name not in exclude]
+
+
+def current_values(instance):
+    deferred = instance.get_deferred_fields()
+    return {f.attname: getattr(instance, f.attname) for f in _tracked_fields(instance) if f.attname not in deferred}
+
+
+def diff(instance):
+    """``{field: [old, new]}`` for fields changed since the instance was loaded (or last saved)."""
+    before = getattr(instance, '_audit_snapshot', None) or {}
+    changes = {}
+    for attname, new in current_values(instance).items():
+        if attname in before and before[attname] != new:
+            changes[attname] = [_present(attname, before[attname]), _present(attname, new)]
+    return changes
+
+
+def _entry(instance, action, details):
+    from .models import AuditLog
+
+    actor = _actor.get()
+    if callable(actor):
+        actor = actor()
+    return AuditLog(
+        admin_id=getattr(actor, 'pk', None),
+        action=_action.get() or action,
+        entity_type=type(instance).__name__,
+        entity_id=instance.pk,
+        details=details,
+    )
+
+
+def _write(entries):
+    from .models import AuditLog
+
+    if entries:
+        AuditLog.objects.bulk_create(entries, batch_size=1000)
+
+
+def record(entry):
+    """Buffer (or write) one ``AuditLog`` entry, deferring it to commit inside a transaction."""
+    buffer = _buffer.get()
+    sink = buffer.append if buffer is not None else (lambda e: _write([e]))
+    if connection.in_atomic_block:
+        transaction.on_commit(partial(sink, entry))
+    else:
+        sink(entry)
+
+
+def record_save(instance, created):
+    if created:
+        details = {'changes': {attname: [None, _present(attname, value)] for attname, value in current_values(instance).items()}}
+        record(_entry(instance, 'CREATED', details))
+    else:
+        changes = diff(instance)
+        if changes:
+            record(_entry(instance, 'UPDATED', {'changes': changes}))
+    instance._audit_snapshot = current_values(instance)
+
+
+def record_delete(instance):
+    details = {'deleted': {attname: _present(attname, value) for attname, value in current_values(instance).items()}}
+    record(_entry(instance, 'DELETED', details))
+
+
+@contextmanager
+def audit_context(actor=None):
+    """Buffer audit entries and write them with one INSERT when the block exits.
+
+    ``actor`` is a user, or a callable returning one, resolved only if something is recorded.
+    """
+    buffer = []
+    buffer_token = _buffer.set(buffer)
+    actor_token = _actor.set(actor)
+    try:
+        yield buffer
+    finally:
+        _buffer.reset(buffer_token)
+        _actor.reset(actor_token)
+        if connection.in_atomic_block:
+            # Entries already committed are in the buffer; on_commit ones arrive later, so
+            # keep appending to the same list and write it once this transaction commits.
+            transaction.on_commit(partial(_write, buffer))
+        else:
+            _write(buffer)
+
+
+@contextmanager
+def action(name):
+    """Record saves in this block under ``name`` (e.g. ``'APPROVED'``) instead of ``UPDATED``."""
+    token = _action.set(name)
+    try:
+        yield
+    finally:
+        _action.reset(token)
+
+
+class AuditContextMiddleware:
+    """Buffer a request's audit entries and attribute them to the signed-in user."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with audit_context(partial(self.actor, request)):
+            return self.get_response(request)
+
+    @staticmethod
+    def actor(request):
+        user = getattr(request, 'user', None)
+        return user if user is not None and user.is_authenticated else None
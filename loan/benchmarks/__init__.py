@@ -0,0 +1,50 @@
+"""Microbenchmarks for the project's hot paths.
+
+Benchmarks are kept apart from functional tests and run with
+``python manage.py benchmark``. Each case is a setup function decorated
+with ``@benchmark(name)``; it receives a ``BenchContext`` and returns the
+zero-argument callable to time. Setup work (fixtures, objects) is not timed.
+
+Cases are grouped: ``core`` runs by default, ``scale`` cases build
+production-sized datasets and only run when asked for.
+"""
+import importlib
+
+BENCHMARKS = []
+
+# Modules that register cases; imported lazily by ``load()``.
+BENCHMARK_MODULES = [
+    'loan.benchmarks.core',
+    'loan.benchmarks.amortization',
+    'loan.benchmarks.funnel',
+    'loan.benchmarks.storage',
+    'loan.benchmarks.api',
+    'loan.benchmarks.compression',
+    'loan.benchmarks.accrual',
+    'loan.benchmarks.search',
+]
+
+
+class SkipBenchmark(Exception):
+    """Raised by a setup function when a case cannot run in this environment."""
+
+
+class Benchmark:
+    def __init__(self, name, setup, group='core', max_number=100000):
+        self.name = name
+        self.setup = setup
+        self.group = group
+        self.max_number = max_number
+
+
+def benchmark(name, group='core', max_number=100000):
+    def decorator(setup):
+        BENCHMARKS.append(Benchmark(name, setup, group=group, max_number=max_number))
+        return setup
+    return decorator
+
+
+def load():
+    for module in BENCHMARK_MODULES:
+        importlib.import_module(module)
+    return BENCHMARKS
@@ -0,0 +1,43 @@
+import random
+
+from loan import accrual
+
+from . import SkipBenchmark, benchmark
+
+
+def _book(size, seed=0):
+    rng = random.Random(seed)
+    principal = [rng.randrange(10000, 16860001) for _ in range(size)]
+    first_day = [rng.randint(1, 365) for _ in range(size)]
+    return principal, first_day
+
+
+def _verify(result, principal, first_day, rate, basis, samples=500):
+    """Exactness guard: sampled entries must match the single-loan closed form to the cent."""
+    index, offset, _, cents = result
+    rng = random.Random(1)
+    for n in rng.sample(range(len(cents)), min(samples, len(cents))):
+        i, day = int(index[n]), first_day[int(index[n])] + int(offset[n])
+        want = accrual.accrued_to_day(principal[i], rate, day, basis) - accrual.accrued_to_day(principal[i], rate, day - 1, basis)
+        if int(cents[n]) != want:
+            raise AssertionError(f'accrual mismatch for loan {i} day {day}: {int(cents[n])} != {want}')
+
+
+@benchmark('accrual.daily.book', group='scale', max_number=20)
+def daily_book(ctx):
+    """One day's accrual for ``ctx.scale`` loans (the array pass, no database).
+
+    Each loan drew its whole principal on day 1, so entries can be checked against the
+    constant-principal closed form.
+    """
+    if accrual.np is None:
+        raise SkipBenchmark('NumPy is not installed')
+    principal, first_day = _book(ctx.scale)
+    rate = accrual.scaled_rate(accrual.default_rate())
+    basis = accrual.day_count()
+    days = [1] * len(principal)
+    draw_loan, draw_day = list(range(len(principal))), [1] * len(principal)
+    _verify(accrual.daily_accruals(draw_loan, draw_day, principal, rate, first_day, days, basis), principal, first_day, rate, basis)
+    arrays = [accrual.np.asarray(values) for values in (draw_loan, draw_day, principal)]
+    first_day, days = accrual.np.asarray(first_day), accrual.np.asarray(days)
+    return lambda: accrual.daily_accruals(*arrays, rate, first_day, days, basis)
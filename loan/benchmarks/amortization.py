@@ -0,0 +1,48 @@
+import random
+from decimal import Decimal
+
+from loan import amortization
+
+from . import SkipBenchmark, benchmark
+
+
+def _book(size, seed=0):
+    rng = random.Random(seed)
+    principal = [rng.randrange(10000, 16860001) for _ in range(size)]
+    terms = [rng.randint(1, 12) for _ in range(size)]
+    income = [rng.choice((0, rng.randrange(100000, 2500001))) for _ in range(size)]
+    return principal, terms, income
+
+
+def _verify(book, principal, terms, income, samples=500):
+    """Exactness guard: sampled loans must match the single-loan Decimal path to the cent."""
+    rng = random.Random(1)
+    for i in rng.sample(range(len(terms)), min(samples, len(terms))):
+        q = amortization.quote(
+            amortization.from_cents(principal[i]),
+            terms[i],
+            monthly_income=amortization.from_cents(income[i]) if income[i] else None,
+            schedule=False,
+        )
+        expected_dti = -1 if q.debt_to_income is None else int(q.debt_to_income / amortization.DTI_QUANTUM)
+        got = (int(book['installment'][i]), int(book['total_interest'][i]), int(book['dti'][i]))
+        want = (amortization.to_cents(q.installment), amortization.to_cents(q.total_interest), expected_dti)
+        if got != want:
+            raise AssertionError(f'book/quote mismatch for loan {i}: {got} != {want}')
+
+
+@benchmark('amortization.quote')
+def single_quote(ctx):
+    return lambda: amortization.quote(Decimal('12000.00'), 12, monthly_income=Decimal('5200.00'))
+
+
+@benchmark('amortization.book', group='scale', max_number=20)
+def whole_book(ctx):
+    if amortization.np is None:
+        raise SkipBenchmark('NumPy is not installed')
+    principal, terms, income = _book(ctx.scale)
+    _verify(amortization.amortize_book(principal, terms, income_cents=income), principal, terms, income)
+    principal = amortization.np.asarray(principal)
+    terms = amortization.np.asarray(terms)
+    income = amortization.np.asarray(income)
+    return lambda: amortization.amortize_book(principal, terms, income_cents=income)
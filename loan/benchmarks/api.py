@@ -0,0 +1,31 @@
+"""Borrower status API: a conditional 304 poll vs a full 200 response.
+
+Per-call times convert directly to requests/second per worker (1 / seconds).
+"""
+from loan.views import loan_status_api
+
+from . import benchmark
+
+
+def _borrower(ctx, withdrawals=200):
+    user = ctx.create_user()
+    loan = ctx.create_loan(user, status='APPROVED')
+    ctx.add_withdrawals(loan, withdrawals)
+    return user
+
+
+@benchmark('api.loan_status.200', max_number=5000)
+def loan_status_full(ctx):
+    user = _borrower(ctx)
+    request = ctx.request('/api/loan/status/', user=user)
+    return lambda: loan_status_api(request)
+
+
+@benchmark('api.loan_status.304', max_number=20000)
+def loan_status_not_modified(ctx):
+    user = _borrower(ctx)
+    etag = loan_status_api(ctx.request('/api/loan/status/', user=user))['ETag']
+    request = ctx.request('/api/loan/status/', user=user, HTTP_IF_NONE_MATCH=etag)
+    response = loan_status_api(request)
+    assert response.status_code == 304, response.status_code
+    return lambda: loan_status_api(request)
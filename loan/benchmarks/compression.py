@@ -0,0 +1,41 @@
+"""CPU cost of minifying and compressing a large page per request (the agreement form)."""
+from django.http import HttpResponse
+
+from loan.compression import ResponseCompressionMiddleware, _brotli, compress, minify_html
+from loan.views import loan_agreement
+
+from . import SkipBenchmark, benchmark
+
+
+def _agreement_html(ctx):
+    user = ctx.create_user()
+    loan = ctx.create_loan(user)
+    return loan_agreement(ctx.request(f'/loan/{loan.pk}/agreement/', user=user), loan.pk).content.decode()
+
+
+@benchmark('compression.minify_html.agreement', max_number=2000)
+def minify_agreement(ctx):
+    html = _agreement_html(ctx)
+    return lambda: minify_html(html)
+
+
+@benchmark('compression.gzip.agreement', max_number=2000)
+def gzip_agreement(ctx):
+    data = minify_html(_agreement_html(ctx)).encode()
+    return lambda: compress(data, 'gzip')
+
+
+@benchmark('compression.brotli.agreement', max_number=2000)
+def brotli_agreement(ctx):
+    if _brotli() is None:
+        raise SkipBenchmark('Brotli is not installed')
+    data = minify_html(_agreement_html(ctx)).encode()
+    return lambda: compress(data, 'br')
+
+
+@benchmark('compression.middleware.agreement', max_number=2000)
+def middleware_agreement(ctx):
+    html = _agreement_html(ctx)
+    middleware = ResponseCompressionMiddleware(lambda request: HttpResponse(html))
+    request = ctx.request('/', HTTP_ACCEPT_ENCODING='br, gzip')
+    return lambda: middleware(request)
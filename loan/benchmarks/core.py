@@ -0,0 +1,187 @@
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from loan import fragments
+from loan.forms import LoanForm, ProfileForm, UserRegistrationForm
+from loan.instrumentation import RequestTimingMiddleware
+from loan.middleware import BlockFlyDevHostMiddleware, MobileOnlyMiddleware, ProfileCompletionMiddleware
+from loan.models import LoanAgreement, WithdrawalRequest
+from loan.views import build_agreement_html, loan_balance, loan_dashboard, render_agreement_pdf
+
+from . import SkipBenchmark, benchmark
+
+
+def _ok(request):
+    return HttpResponse('ok')
+
+
+@benchmark('middleware.block_fly_dev_host')
+def block_fly_dev_host(ctx):
+    middleware = BlockFlyDevHostMiddleware(_ok)
+    request = ctx.request('/loan/dashboard/')
+    return lambda: middleware(request)
+
+
+@benchmark('middleware.mobile_only.mobile')
+def mobile_only_mobile(ctx):
+    middleware = MobileOnlyMiddleware(_ok)
+    request = ctx.request('/loan/dashboard/')
+    return lambda: middleware(request)
+
+
+@benchmark('middleware.mobile_only.desktop_block')
+def mobile_only_desktop(ctx):
+    middleware = MobileOnlyMiddleware(_ok)
+    request = ctx.request('/loan/dashboard/', HTTP_USER_AGENT='Mozilla/5.0 (X11; Linux x86_64)')
+    request.user = AnonymousUser()
+    return lambda: middleware(request)
+
+
+@benchmark('middleware.profile_completion.anonymous')
+def profile_completion_anonymous(ctx):
+    middleware = ProfileCompletionMiddleware(_ok)
+    request = ctx.request('/loan/dashboard/', user=AnonymousUser())
+    return lambda: middleware(request)
+
+
+@benchmark('middleware.profile_completion.onboarded')
+def profile_completion_onboarded(ctx):
+    middleware = ProfileCompletionMiddleware(_ok)
+    user = ctx.create_user()
+    request = ctx.request('/loan/dashboard/', user=user)
+
+    def call():
+        # Drop cached profile/bank_detail so each call pays the real lookups.
+        user._state.fields_cache.clear()
+        return middleware(request)
+    return call
+
+
+@benchmark('middleware.request_timing')
+def request_timing(ctx):
+    middleware = RequestTimingMiddleware(_ok)
+    request = ctx.request('/loan/dashboard/', user=AnonymousUser())
+    return lambda: middleware(request)
+
+
+@benchmark('forms.loan_form')
+def loan_form(ctx):
+    data = {
+        'requested_amount': '12000.00',
+        'loan_purpose': 'Car repair',
+        'term_months': '12',
+        'monthly_income': '5200.00',
+        'note': '',
+    }
+    return lambda: LoanForm(data).is_valid()
+
+
+@benchmark('forms.profile_form')
+def profile_form(ctx):
+    data = {
+        'street_address': '1 Main St',
+        'city': 'Austin',
+        'state': 'TX',
+        'postal_code': '73301',
+        'nationality': 'US',
+        'marital_status': 'SINGLE',
+        'housing_status': 'RENT',
+        'dob': '1990-01-01',
+        'employment_status': 'FULL_TIME',
+        'monthly_income': '5200.00',
+    }
+    return lambda: ProfileForm(data).is_valid()
+
+
+@benchmark('forms.user_registration_form')
+def user_registration_form(ctx):
+    data = {
+        'full_name': 'Jane Borrower',
+        'email': 'jane.new@example.test',
+        'phone': '5551234567',
+        'password': 'correct horse battery staple',
+        'confirm_password': 'correct horse battery staple',
+    }
+    return lambda: UserRegistrationForm(data).is_valid()
+
+
+def _dashboard_case(withdrawals):
+    def setup(ctx):
+        user = ctx.create_user()
+        loan = ctx.create_loan(user)
+        ctx.add_withdrawals(loan, withdrawals)
+        request = ctx.request('/loan/dashboard/', user=user)
+        _, approved_total, available = loan_balance(loan)
+
+        def render():
+            # Full render every time; the cached path is timed by views.loan_dashboard.cached.
+            fragments.cache().delete(fragments.fragment_key('dashboard', loan))
+            context = {
+                'loan': loan,
+                'balance': available,
+                'available_balance': available,
+                'approved_withdrawals_total': approved_total,
+                'withdrawal_requests': WithdrawalRequest.objects.filter(loan=loan).order_by('-created_at'),
+            }
+            return render_to_string('loan/loan_dashboard.html', context, request)
+        return render
+    return setup
+
+
+for _count in (0, 10, 1000):
+    benchmark(f'templates.loan_dashboard.{_count}_withdrawals', max_number=10000)(_dashboard_case(_count))
+
+
+def _cached_dashboard_case(withdrawals):
+    def setup(ctx):
+        user = ctx.create_user()
+        loan = ctx.create_loan(user)
+        ctx.add_withdrawals(loan, withdrawals)
+        request = ctx.request('/loan/dashboard/', user=user)
+        loan_dashboard(request)  # warm the 'dashboard' fragment
+        return lambda: loan_dashboard(request)
+    return setup
+
+
+for _count in (10, 1000):
+    benchmark(f'views.loan_dashboard.cached.{_count}_withdrawals', max_number=10000)(_cached_dashboard_case(_count))
+
+
+@benchmark('views.loan_balance')
+def balance(ctx):
+    user = ctx.create_user()
+    loan = ctx.create_loan(user)
+    ctx.add_withdrawals(loan, 50)
+    ctx.add_withdrawals(loan, 20, status='PENDING')
+    return lambda: loan_balance(loan)
+
+
+def _agreement(ctx):
+    user = ctx.create_user()
+    loan = ctx.create_loan(user)
+    return LoanAgreement.objects.create(
+        loan=loan,
+        user=user,
+        borrower_name=user.full_name,
+        requested_amount=loan.requested_amount,
+        account_last4='6789',
+        signature_text=user.full_name,
+        signed_at=timezone.now(),
+        terms_version='bench',
+    )
+
+
+@benchmark('agreement.build_html')
+def agreement_html(ctx):
+    agreement = _agreement(ctx)
+    return lambda: build_agreement_html(agreement)
+
+
+@benchmark('agreement.build_pdf', max_number=200)
+def agreement_pdf(ctx):
+    html = build_agreement_html(_agreement(ctx))
+    if render_agreement_pdf('<p>probe</p>') is None:
+        raise SkipBenchmark('WeasyPrint is not installed')
+    return lambda: render_agreement_pdf(html)
@@ -0,0 +1,15 @@
+from loan import funnel, synthetic
+
+from . import benchmark
+
+
+def _cohorts_case(users, tag):
+    def setup(ctx):
+        synthetic.generate(ctx.scale if users is None else users, tag=tag, days=365)
+        return funnel.cohorts
+    return setup
+
+
+# Distinct synthetic tags keep the two datasets from colliding when both groups run.
+benchmark('funnel.cohorts.1k_users', max_number=1000)(_cohorts_case(1000, tag=9001))
+benchmark('funnel.cohorts', group='scale', max_number=20)(_cohorts_case(None, tag=9002))
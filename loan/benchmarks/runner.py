@@ -0,0 +1,186 @@
+import itertools
+import json
+import platform
+import statistics
+import tempfile
+import timeit
+from contextlib import contextmanager
+from decimal import Decimal
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from loan.models import BankDetail, Loan, Profile, User, WithdrawalRequest
+
+from . import SkipBenchmark
+
+MOBILE_UA = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148'
+
+
+@contextmanager
+def scratch_metrics_dir():
+    """Point ``METRICS_DIR`` at a temporary directory so synthetic traffic never reaches a metrics scrape."""
+    with tempfile.TemporaryDirectory(prefix='loan-metrics-') as directory, override_settings(METRICS_DIR=directory):
+        yield directory
+
+
+class BenchContext:
+    """Shared fixtures for benchmark setup functions."""
+
+    def __init__(self, scale=1_000_000):
+        self.scale = scale
+        self.factory = RequestFactory(HTTP_USER_AGENT=MOBILE_UA)
+        self._seq = itertools.count(1)
+        # Hash once: fixture users never log in, and PBKDF2 per user would dominate setup.
+        self.password_hash = make_password(None)
+
+    def create_user(self, profile=True, bank=True, **extra):
+        n = next(self._seq)
+        user = User.objects.create(
+            email=f'bench{n}@example.test',
+            phone=f'+1999{n:07d}',
+            full_name=f'Bench User {n}',
+            password=self.password_hash,
+            password_hash=self.password_hash,
+            email_verified=True,
+            **extra,
+        )
+        if profile:
+            Profile.objects.create(
+                user=user,
+                street_address='1 Bench St',
+                city='Austin',
+                state='TX',
+                postal_code='73301',
+                nationality='US',
+                marital_status='SINGLE',
+                housing_status='RENT',
+                dob='1990-01-01',
+                employment_status='FULL_TIME',
+                monthly_income=Decimal('5200.00'),
+                completed=True,
+            )
+        if bank:
+            BankDetail.objects.create(user=user, bank_name='Bench Bank', account_name=user.full_name, account_number='000123456789')
+        return user
+
+    def create_loan(self, user, status='APPROVED', amount=Decimal('12000.00')):
+        return Loan.objects.create(
+            user=user,
+            requested_amount=amount,
+            approved_amount=amount if status in ('APPROVED', 'ACTIVE', 'CLOSED') else None,
+            term_months=12,
+            status=status,
+            loan_purpose='Benchmark',
+            monthly_income=Decimal('5200.00'),
+        )
+
+    def add_withdrawals(self, loan, count, status='APPROVED', amount=Decimal('5.00')):
+        now = timezone.now()
+        WithdrawalRequest.objects.bulk_create(
+            [
+                WithdrawalRequest(user_id=loan.user_id, loan=loan, amount=amount, status=status, note='', processed_at=now)
+                for _ in range(count)
+            ],
+            batch_size=1000,
+        )
+
+    def request(self, path='/', user=None, method='get', **extra):
+        request = getattr(self.factory, method)(path, **extra)
+        if user is not None:
+            request.user = user
+        return request
+
+
+def measure(fn, repeat=5, min_time=0.2, max_number=100000):
+    """Time ``fn`` and return per-call seconds (best and median of ``repeat`` runs)."""
+    fn()  # warm caches (template loader, validators) before calibrating
+    timer = timeit.Timer(fn)
+    number = 1
+    for multiplier in itertools.cycle((2, 2.5, 2)):
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= max_number:
+            break
+        number = min(max_number, int(number * multiplier))
+    runs = [t / number for t in timer.repeat(repeat, number)]
+    return {
+        'number': number,
+        'repeat': repeat,
+        'best': min(runs),
+        'median': statistics.median(runs),
+    }
+
+
+def run(benchmarks, ctx, repeat=5, min_time=0.2, stdout=None):
+    results = {}
+    for case in benchmarks:
+        try:
+            fn = case.setup(ctx)
+        except SkipBenchmark as exc:
+            results[case.name] = {'group': case.group, 'skipped': str(exc)}
+            if stdout:
+                stdout.write(f'{case.name}: skipped ({exc})')
+            continue
+        result = measure(fn, repeat=repeat, min_time=min_time, max_number=case.max_number)
+        result['group'] = case.group
+        results[case.name] = result
+        if stdout:
+            stdout.write(f"{case.name}: {format_seconds(result['best'])} per call (x{result['number']})")
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Compare best timings against a baseline; returns rows and the regressed names."""
+    rows = []
+    regressions = []
+    base_results = baseline.get('results', {})
+    for name, result in sorted(results.items()):
+        if 'best' not in result:
+            continue
+        base = base_results.get(name, {}).get('best')
+        if not base:
+            rows.append((name, result['best'], None, None, 'new'))
+            continue
+        ratio = result['best'] / base
+        status = 'ok'
+        if ratio > 1 + tolerance:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            status = 'faster'
+        rows.append((name, result['best'], base, ratio, status))
+    return rows, regressions
+
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return '-'
+    for unit, factor in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * factor >= 1:
+            return f'{seconds * factor:.2f} {unit}'
+    return f'{seconds * 1e9:.0f} ns'
@@ -0,0 +1,45 @@
+from django.contrib import admin
+from django.test import RequestFactory
+
+from loan import synthetic
+from loan.models import BankDetail, Loan, User
+
+from . import benchmark
+
+PAGE = 100
+
+
+def _dataset(ctx, users, tag):
+    """Generate the synthetic borrowers once per size; every search case shares them."""
+    datasets = ctx.__dict__.setdefault('search_datasets', {})
+    if tag not in datasets:
+        synthetic.generate(users, tag=tag, days=365)
+        middle = users // 2
+        datasets[tag] = {
+            'email': f'synth-{tag}-{middle}@',
+            'phone': f'+8{tag:04d}{middle:09d}'[:-2],
+            'name': 'mei tana',
+            'last4': BankDetail.objects.filter(user__email__startswith=f'synth-{tag}-').values_list('account_last4', flat=True)[middle // 2],
+            'loan_id': str(Loan.objects.filter(user__email__startswith=f'synth-{tag}-').order_by('pk').values_list('pk', flat=True)[middle // 2]),
+        }
+    return datasets[tag]
+
+
+def _search_case(kind, model, users, tag):
+    """What a changelist search costs: the filtered count plus the first page."""
+    def setup(ctx):
+        term = _dataset(ctx, ctx.scale if users is None else users, tag)[kind]
+        model_admin = admin.site._registry[model]
+        request = RequestFactory().get('/', {'q': term})
+
+        def run():
+            queryset, _ = model_admin.get_search_results(request, model_admin.get_queryset(request), term)
+            return queryset.count(), list(queryset.order_by('-pk')[:PAGE])
+        return run
+    return setup
+
+
+# Distinct synthetic tags keep the two datasets from colliding when both groups run.
+for kind, model in (('email', User), ('phone', User), ('name', User), ('last4', User), ('loan_id', Loan)):
+    benchmark(f'search.admin.{kind}.10k_users', max_number=1000)(_search_case(kind, model, 10000, tag=9101))
+    benchmark(f'search.admin.{kind}', group='scale', max_number=200)(_search_case(kind, model, None, tag=9102))
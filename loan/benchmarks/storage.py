@@ -0,0 +1,106 @@
+"""Signature storage: content-addressed sharded layout vs the old flat directory.
+
+The scale cases fill a temporary directory with ``ctx.scale`` small files in
+each layout (once per run) and then time a lookup (``exists`` + read) of a
+random stored file and the save of a new one.
+"""
+import atexit
+import hashlib
+import itertools
+import os
+import random
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+from loan.storage import ContentAddressedStorage, hashed_name
+
+from . import benchmark
+
+PREFIX = 'agreements/signatures'
+_filled = {}
+
+
+def _signature_bytes(n):
+    # Small, distinct payloads; the size of a real drawn-signature PNG does not change lookup cost.
+    return b'\x89PNG\r\n\x1a\n' + n.to_bytes(8, 'big') * 32
+
+
+def _temp_root():
+    root = tempfile.mkdtemp(prefix='bench-signatures-')
+    atexit.register(shutil.rmtree, root, ignore_errors=True)
+    return root
+
+
+def _flat_name(n):
+    return f'{PREFIX}/agreement_sig_{n}.png'
+
+
+def _sharded_name(n):
+    return hashed_name(f'{PREFIX}/sig.png', hashlib.sha256(_signature_bytes(n)).hexdigest())
+
+
+def _fill(layout, count):
+    """Storage holding ``count`` files in ``layout``; written directly, without the storage API, for speed."""
+    key = (layout, count)
+    if key not in _filled:
+        root = _temp_root()
+        name_for = _flat_name if layout == 'flat' else _sharded_name
+        made = set()
+        for n in range(count):
+            path = os.path.join(root, name_for(n))
+            directory = os.path.dirname(path)
+            if directory not in made:
+                os.makedirs(directory, exist_ok=True)
+                made.add(directory)
+            with open(path, 'wb') as f:
+                f.write(_signature_bytes(n))
+        storage = FileSystemStorage(location=root) if layout == 'flat' else ContentAddressedStorage(location=root)
+        _filled[key] = storage
+    return _filled[key]
+
+
+def _lookup_case(layout):
+    def setup(ctx):
+        storage = _fill(layout, ctx.scale)
+        name_for = _flat_name if layout == 'flat' else _sharded_name
+        names = [name_for(n) for n in random.Random(37).sample(range(ctx.scale), min(ctx.scale, 10000))]
+        cycle = itertools.cycle(names)
+
+        def run():
+            name = next(cycle)
+            if storage.exists(name):
+                with storage.open(name, 'rb') as f:
+                    f.read()
+        return run
+    return setup
+
+
+def _write_case(layout):
+    def setup(ctx):
+        storage = _fill(layout, ctx.scale)
+        counter = itertools.count(ctx.scale)
+
+        def run():
+            n = next(counter)
+            storage.save(_flat_name(n), ContentFile(_signature_bytes(n)))
+        return run
+    return setup
+
+
+def _save_small_case(ctx):
+    storage = ContentAddressedStorage(location=_temp_root())
+    counter = itertools.count()
+
+    def run():
+        n = next(counter)
+        storage.save(_flat_name(n), ContentFile(_signature_bytes(n)))
+    return run
+
+
+benchmark('signature_storage.save', max_number=2000)(_save_small_case)
+for _layout in ('sharded', 'flat'):
+    benchmark(f'signature_storage.lookup.{_layout}', group='scale', max_number=10000)(_lookup_case(_layout))
+    benchmark(f'signature_storage.write.{_layout}', group='scale', max_number=2000)(_write_case(_layout))
@@ -0,0 +1,233 @@
+"""Minified, Brotli/gzip-compressed dynamic responses.
+
+``ResponseCompressionMiddleware`` (near the top of MIDDLEWARE) post-processes
+what the views return; WhiteNoise already serves static files precompressed.
+
+* HTML is minified (``minify_html``): comments are dropped and whitespace
+  runs between and inside text nodes collapse to one character. In
+  ``<style>`` only indentation goes (runs containing a line break, which
+  cannot occur inside a CSS string). ``<pre>``, ``<textarea>`` and
+  ``<script>`` bodies and all tags, including their attribute values, are
+  left byte for byte as rendered.
+* Text responses (HTML, JSON, CSS, JS, SVG, XML) of at least
+  ``RESPONSE_COMPRESSION_MIN_SIZE`` bytes are compressed with the best
+  encoding the client accepts: Brotli (``RESPONSE_BROTLI_QUALITY``, when the
+  ``Brotli`` package is installed), else gzip. Streaming responses are
+  compressed chunk by chunk. Responses that are already encoded, file
+  downloads (PDFs, signatures), partial content and ``no-transform`` ones are
+  passed through.
+* BREACH: Django masks the CSRF token differently on every response; on top
+  of that, pages that used a token get a comment of random length and
+  content, so their compressed size no longer tracks how well
+  attacker-reflected input matches a secret.
+
+Bodies that change get a weak ETag, so conditional requests keep matching.
+"""
+import re
+import secrets
+import zlib
+
+from django.conf import settings
+from django.http import FileResponse
+from django.utils.cache import patch_vary_headers
+
+COMPRESSIBLE_TYPES = (
+    'text/html',
+    'text/plain',
+    'text/css',
+    'text/csv',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'text/xml',
+    'image/svg+xml',
+)
+# Elements whose bodies the minifier leaves alone (<style> only loses indentation).
+RAW_TEXT_RE = re.compile(r'(<(pre|textarea|script|style)\b.*?</\2\s*>)', re.IGNORECASE | re.DOTALL)
+LINE_BREAK_RUN_RE = re.compile(r'\s*\n\s*')
+# A tag, allowing quoted attribute values that contain '>'.
+TAG_RE = re.compile(r'''(<[a-zA-Z/!?][^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*>)''')
+# Comments, except conditional comments and ones asking to be kept (<!--! ... -->).
+COMMENT_RE = re.compile(r'<!--(?!\[if|!).*?-->', re.DOTALL)
+WHITESPACE_RE = re.compile(r'\s+')
+BREACH_PADDING_BYTES = 100
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _collapse(text):
+    # A run with a line break becomes one, so view-source keeps its line structure.
+    return WHITESPACE_RE.sub(lambda m: '\n' if '\n' in m.group() else ' ', text)
+
+
+def minify_html(html):
+    """``html`` without comments and redundant whitespace; tags and raw-text bodies kept."""
+    out = []
+    for i, part in enumerate(RAW_TEXT_RE.split(html)):
+        # split() yields text, raw block, tag name, text, ...
+        if i % 3 == 1:
+            out.append(LINE_BREAK_RUN_RE.sub('\n', part) if part[:6].lower() == '<style' else part)
+        elif i % 3 == 0 and part:
+            part = COMMENT_RE.sub('', part)
+            out.extend(
+                piece if j % 2 else _collapse(piece)
+                for j, piece in enumerate(TAG_RE.split(part))
+            )
+    return ''.join(out)
+
+
+def accepted_encodings(header):
+    """``{coding: q}`` from an ``Accept-Encoding`` header."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def available_encodings():
+    return ('br', 'gzip') if _brotli() is not None else ('gzip',)
+
+
+def negotiate(header):
+    """The preferred encoding the client accepts (``'br'``, ``'gzip'``), or ``None``."""
+    accepted = accepted_encodings(header or '')
+    for coding in available_encodings():
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+class Compressor:
+    """Incremental Brotli or gzip compressor with one interface."""
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            quality = getattr(settings, 'RESPONSE_BROTLI_QUALITY', 5)
+            compressor = _brotli().Compressor(quality=quality)
+            self.compress, self._finish = compressor.process, compressor.finish
+        else:
+            level = getattr(settings, 'RESPONSE_GZIP_LEVEL', 6)
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress, self._finish = compressor.compress, compressor.flush
+
+    def finish(self):
+        return self._finish()
+
+
+def compress(data, encoding):
+    compressor = Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_chunks(chunks, encoding):
+    compressor = Compressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_chunks(chunks, encoding):
+    compressor = Compressor(encoding)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def breach_padding():
+    """An HTML comment of random length (up to ``BREACH_PADDING_BYTES``) and content."""
+    return f'<!--{secrets.token_urlsafe(secrets.randbelow(BREACH_PADDING_BYTES))}-->'.encode()
+
+
+def _weaken_etag(response):
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+
+
+def content_type(response):
+    return response.get('Content-Type', '').split(';', 1)[0].strip().lower()
+
+
+class ResponseCompressionMiddleware:
+    """Minify HTML and compress text responses (see module docstring)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.compress_enabled = getattr(settings, 'RESPONSE_COMPRESSION', True)
+        self.minify = getattr(settings, 'HTML_MINIFY', True)
+        self.min_size = getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE', 1024)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        mime = content_type(response)
+        if (
+            mime not in COMPRESSIBLE_TYPES
+            or isinstance(response, FileResponse)
+            or response.has_header('Content-Encoding')
+            or response.status_code == 206
+            or 'no-transform' in response.get('Cache-Control', '')
+        ):
+            return response
+        if response.streaming:
+            return self.compress_stream(request, response) if self.compress_enabled else response
+
+        changed = False
+        if self.minify and mime == 'text/html' and response.content:
+            charset = response.charset or 'utf-8'
+            minified = minify_html(response.content.decode(charset)).encode(charset)
+            changed = len(minified) != len(response.content)
+            response.content = minified
+        if self.compress_enabled:
+            patch_vary_headers(response, ('Accept-Encoding',))
+            encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING'))
+            if encoding and len(response.content) >= self.min_size:
+                content = response.content
+                if mime == 'text/html' and request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                    content += breach_padding()
+                compressed = compress(content, encoding)
+                if len(compressed) < len(response.content):
+                    response.content = compressed
+                    response['Content-Encoding'] = encoding
+                    changed = True
+        if changed:
+            response['Content-Length'] = str(len(response.content))
+            _weaken_etag(response)
+        return response
+
+    def compress_stream(self, request, response):
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if not encoding:
+            return response
+        if response.is_async:
+            response.streaming_content = acompress_chunks(response.streaming_content, encoding)
+        else:
+            response.streaming_content = compress_chunks(response.streaming_content, encoding)
+        # The compressed length is unknown until the stream ends.
+        del response['Content-Length']
+        response['Content-Encoding'] = encoding
+        _weaken_etag(response)
+        return response
@@ -0,0 +1,411 @@
+"""Per-user push events for loan and withdrawal status changes (server-sent events).
+
+Status changes are published after their transaction commits (signals in
+loan/signals.py for saves, ``publish_many`` for set-based updates) as
+``{"user": id, "event": "loan" | "withdrawal", "data": {...}}``.
+``stream()`` turns a user's messages into ``text/event-stream`` frames for
+``/api/loan/events/``.
+
+Delivery goes through a broker chosen by ``EVENTS_BACKEND``:
+
+* ``'local'``: fan-out inside the current process only. Fine for a single
+  worker, ``runserver`` and tests;
+* ``'postgres'``: ``pg_notify`` on ``EVENTS_CHANNEL``; every worker process
+  runs one ``LISTEN`` connection in a thread and fans the notifications out
+  to its own subscribers, so an admin action in one process reaches browsers
+  connected to another;
+* ``''`` (default): ``'postgres'`` when the default database is PostgreSQL,
+  else ``'local'``.
+
+A connected browser costs one ``asyncio.Queue`` and a suspended coroutine,
+not a thread or a database connection, so one ASGI worker holds thousands
+(``manage.py sse_load_test`` measures it). That needs ``EventStreamRouter``
+(installed in core/asgi.py): Django gives every ASGI request that passes
+through sync middleware its own thread until the response ends, so the
+router serves the stream path itself, authenticating from the session
+cookie, and hands everything else to Django. The ``loan_events`` view is
+the fallback for deployments without it. Queues are bounded
+(``EVENTS_QUEUE_SIZE``); a subscriber that falls behind, or any subscriber
+after the listener reconnected, gets a ``resync`` marker and the stream
+resends the current loan status instead of the lost messages.
+"""
+import asyncio
+import io
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from functools import partial
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.exceptions import DisallowedHost, ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections, connection, connections, transaction
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('', 'local', 'postgres')
+RESYNC = {'event': 'resync'}
+
+
+def channel():
+    return getattr(settings, 'EVENTS_CHANNEL', 'loan_events')
+
+
+def queue_size():
+    return getattr(settings, 'EVENTS_QUEUE_SIZE', 100)
+
+
+class Subscription:
+    """One stream's inbox: a bounded queue on the event loop that created it."""
+
+    def __init__(self, user_id, loop, maxsize):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def put(self, message):
+        # Runs on self.loop.
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Drop the backlog; the stream rereads the current state instead.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """In-process fan-out from ``send`` (any thread) to the subscriptions of one user."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        """Subscription for ``user_id``; call from the event loop that will read it."""
+        subscription = Subscription(user_id, asyncio.get_running_loop(), queue_size())
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def deliver(self, messages):
+        """Hand each message to the subscribers of its ``user`` (``RESYNC``: to all of them).
+
+        One wakeup per event loop, however many subscriptions the messages reach.
+        """
+        by_loop = defaultdict(list)
+        with self._lock:
+            for message in messages:
+                if message is RESYNC:
+                    targets = [s for subscribers in self._subscribers.values() for s in subscribers]
+                else:
+                    targets = self._subscribers.get(message['user'], ())
+                for subscription in targets:
+                    by_loop[subscription.loop].append((subscription, message))
+        for loop, pairs in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_put_all, pairs)
+            except RuntimeError:
+                # Loop closed under streams that never unsubscribed.
+                for subscription, _ in pairs:
+                    self.unsubscribe(subscription)
+
+    def send(self, messages):
+        self.deliver(messages)
+
+
+def _put_all(pairs):
+    for subscription, message in pairs:
+        subscription.put(message)
+
+
+class PostgresBroker(LocalBroker):
+    """Cross-process fan-out over ``LISTEN``/``NOTIFY`` (psycopg2).
+
+    ``send`` issues ``pg_notify`` on the default connection. The first
+    ``subscribe`` in a process starts a daemon thread holding one extra
+    connection that listens on the channel and calls ``deliver``.
+    """
+
+    reconnect_delay = 1.0
+
+    def __init__(self, alias='default'):
+        super().__init__()
+        self.alias = alias
+        self._listener = None
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='loan-events-listener', daemon=True)
+                self._listener.start()
+        return subscription
+
+    def send(self, messages):
+        # NOTIFY payloads are limited to 8000 bytes; these are well under that.
+        with connections[self.alias].cursor() as cursor:
+            for message in messages:
+                cursor.execute('SELECT pg_notify(%s, %s)', [channel(), json.dumps(message, default=str)])
+
+    def _connect(self):
+        wrapper = connections[self.alias]
+        conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{channel()}"')
+        return conn
+
+    def _listen(self):
+        first = True
+        while True:
+            try:
+                conn = self._connect()
+            except Exception:
+                logger.exception('Events listener could not connect; retrying')
+                time.sleep(self.reconnect_delay)
+                continue
+            if not first:
+                # Notifications sent while disconnected are lost.
+                self.deliver([RESYNC])
+            first = False
+            try:
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    messages = []
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            messages.append(json.loads(notify.payload))
+                        except ValueError:
+                            logger.warning('Ignoring malformed event payload %r', notify.payload)
+                    self.deliver(messages)
+            except Exception:
+                logger.exception('Events listener lost its connection; reconnecting')
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                time.sleep(self.reconnect_delay)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def backend_name():
+    value = getattr(settings, 'EVENTS_BACKEND', '')
+    if value not in BACKENDS:
+        raise ImproperlyConfigured(f'EVENTS_BACKEND must be one of {BACKENDS!r}, not {value!r}.')
+    if value == '':
+        return 'postgres' if connections['default'].vendor == 'postgresql' else 'local'
+    return value
+
+
+def broker():
+    """The process-wide broker (created on first use)."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = PostgresBroker() if backend_name() == 'postgres' else LocalBroker()
+    return _broker
+
+
+def message(user_id, event, data):
+    return {'user': user_id, 'event': event, 'data': data}
+
+
+def _send(messages):
+    try:
+        broker().send(messages)
+    except Exception:
+        # The change is committed; a lost notification only delays the borrower's update.
+        logger.exception('Could not publish %d loan events', len(messages))
+
+
+def publish_many(messages):
+    """Publish messages once the current transaction (if any) commits."""
+    messages = list(messages)
+    if not messages:
+        return
+    if connection.in_atomic_block:
+        transaction.on_commit(partial(_send, messages))
+    else:
+        _send(messages)
+
+
+def publish(user_id, event, data):
+    publish_many([message(user_id, event, data)])
+
+
+def loan_message(user_id, loan_id, status, previous=None):
+    return message(user_id, 'loan', {'id': loan_id, 'status': status, 'previous': previous})
+
+
+def withdrawal_message(user_id, withdrawal_id, loan_id, status, previous=None):
+    return message(user_id, 'withdrawal', {'id': withdrawal_id, 'loan': loan_id, 'status': status, 'previous': previous})
+
+
+def format_event(event, data):
+    """One ``text/event-stream`` frame."""
+    return f'event: {event}\ndata: {json.dumps(data, default=str, separators=(",", ":"))}\n\n'
+
+
+def _loan_state(user_id):
+    from .models import Loan
+
+    # Executor threads never see request_started/request_finished, so do their connection
+    # upkeep here: drop connections past CONN_MAX_AGE or broken by a database restart.
+    close_old_connections()
+    try:
+        return Loan.objects.filter(user_id=user_id).order_by('-created_at').values('id', 'status', 'version').first()
+    finally:
+        close_old_connections()
+
+
+def _session_user(request):
+    # Same connection upkeep as _loan_state: this runs outside Django's request handler.
+    close_old_connections()
+    try:
+        return get_user(request)
+    finally:
+        close_old_connections()
+
+
+# Status reads and stream logins run on the shared executor, whose threads keep a bounded
+# number of connections, rather than queueing on the single thread-sensitive thread.
+loan_state = sync_to_async(_loan_state, thread_sensitive=False)
+session_user = sync_to_async(_session_user, thread_sensitive=False)
+
+
+async def stream(user_id):
+    """``text/event-stream`` frames for one user until the consumer stops (cancels) it."""
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 20)
+    subscription = broker().subscribe(user_id)
+    try:
+        yield f"retry: {getattr(settings, 'EVENTS_RETRY_MS', 5000)}\n\n"
+        message = RESYNC
+        while True:
+            if message is RESYNC:
+                # On connect and after lost messages: the current state, which clients compare
+                # with the loan version they rendered.
+                yield format_event('status', {'loan': await loan_state(user_id)})
+            elif message is not None:
+                yield format_event(message['event'], message['data'])
+            else:
+                # Comment frame: keeps proxies and mobile carriers from closing an idle stream.
+                yield ': keepalive\n\n'
+            try:
+                async with asyncio.timeout(heartbeat):
+                    message = await subscription.get()
+            except TimeoutError:
+                message = None
+    finally:
+        broker().unsubscribe(subscription)
+
+
+STREAM_HEADERS = {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    # Tell nginx not to buffer the stream.
+    'X-Accel-Buffering': 'no',
+}
+
+
+def stream_response(user_id):
+    response = StreamingHttpResponse(stream(user_id))
+    for header, value in STREAM_HEADERS.items():
+        response[header] = value
+    return response
+
+
+class EventStreamRouter:
+    """ASGI app serving the ``loan_events`` path directly and everything else through Django.
+
+    Only the session and user lookup runs in a thread (``session_user``, on the executor),
+    so an open stream holds no thread and no database connection.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self._path = None
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = reverse('loan_events')
+        return self._path
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            return await self.application(scope, receive, send)
+        request = ASGIRequest(scope, io.BytesIO())
+        try:
+            request.get_host()
+        except DisallowedHost:
+            return await self.reject(send, 400)
+        if request.method != 'GET':
+            return await self.reject(send, 405, [(b'allow', b'GET')])
+        engine = import_module(settings.SESSION_ENGINE)
+        request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+        user = await session_user(request)
+        if not user.is_authenticated:
+            # EventSource gives up on non-200 responses instead of retrying.
+            return await self.reject(send, 401)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(k.lower().encode(), v.encode()) for k, v in STREAM_HEADERS.items()],
+        })
+        frames = asyncio.ensure_future(self.forward(stream(user.pk), send))
+        disconnect = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            await asyncio.wait([frames, disconnect], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (frames, disconnect):
+                task.cancel()
+            await asyncio.gather(frames, disconnect, return_exceptions=True)
+
+    @staticmethod
+    async def forward(frames, send):
+        try:
+            async for frame in frames:
+                await send({'type': 'http.response.body', 'body': frame.encode(), 'more_body': True})
+        finally:
+            await frames.aclose()
+
+    @staticmethod
+    async def wait_for_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    async def reject(send, status, headers=()):
+        await send({'type': 'http.response.start', 'status': status, 'headers': list(headers)})
+        await send({'type': 'http.response.body', 'body': b''})
@@ -1,7 +1,8 @@
 from django import forms
 from django.conf import settings
-from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.forms import AuthenticationForm, PasswordResetForm
 from django.core.exceptions import ValidationError
+from . import identity
 from .models import Loan, Profile, User, BankDetail, WithdrawalRequest
 
 
@@ -49,6 +50,12 @@ class InviteEmailForm(forms.Form):
         if default_sender:
             self.fields['inviter_name'].initial = default_sender
 
+    def clean_recipient_email(self):
+        email = identity.normalize_email(self.cleaned_data['recipient_email'])
+        if identity.email_taken(email):
+            raise ValidationError('This person already has an account.')
+        return email
+
 
 # Loan application form
 class LoanForm(forms.ModelForm):
@@ -223,20 +230,19 @@ class UserRegistrationForm(forms.ModelForm):
         return self.cleaned_data['full_name'].strip()
 
     def clean_email(self):
-        email = self.cleaned_data['email'].strip().lower()
-        if User.objects.filter(email=email).exists():
+        email = identity.normalize_email(self.cleaned_data['email'])
+        if identity.email_taken(email):
             raise ValidationError('An account with this email already exists.')
         return email
 
     def clean_phone(self):
-        phone_raw = self.cleaned_data.get('phone', '').strip()
-        if not phone_raw:
-            raise ValidationError('Enter a valid mobile number.')
-        digits = ''.join(filter(str.isdigit, phone_raw))
-        if len(digits) < 10:
+        try:
+            phone = identity.normalize_phone(self.cleaned_data.get('phone', ''))
+        except identity.InvalidPhoneNumber:
             raise ValidationError('Enter a valid mobile number.')
-        normalized = '+' + digits
-        return normalized
+        if identity.phone_taken(phone):
+            raise ValidationError('An account with this mobile number already exists.')
+        return phone
 
     def clean(self):
         cleaned_data = super().clean()
@@ -276,6 +282,13 @@ class UserLoginForm(AuthenticationForm):
             raise ValidationError('Please verify your email before signing in.')
         super().confirm_login_allowed(user)
 
+class IdentityPasswordResetForm(PasswordResetForm):
+    # One exact lookup on the stored email instead of Django's email__iexact scan
+    def get_users(self, email):
+        user = identity.user_by_email(email)
+        if user is not None and user.is_active and user.has_usable_password():
+            yield user
+
 class BankDetailForm(forms.ModelForm):
     class Meta:
         model = BankDetail
@@ -314,3 +327,16 @@ class WithdrawalRequestForm(forms.ModelForm):
                 'rows': 3
             }),
         }
+
+class AuditArchiveSearchForm(forms.Form):
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    action = forms.CharField(required=False, max_length=100)
+    entity_type = forms.CharField(required=False, max_length=100)
+    entity_id = forms.IntegerField(required=False, min_value=0)
+    admin_id = forms.IntegerField(required=False, min_value=1, label='Admin user id')
+    include_live = forms.BooleanField(required=False, initial=True, label='Include live table')
+
+    def filters(self):
+        data = self.cleaned_data
+        return {key: data.get(key) for key in ('action', 'entity_type', 'entity_id', 'admin_id') if data.get(key) not in (None, '')}
@@ -0,0 +1,64 @@
+"""Template fragments cached per loan version.
+
+``{% loan_fragment 'name' loan %}...{% endloan_fragment %}`` (loan/templatetags/
+fragments.py) stores the rendered block under
+``fragment:<name>:<loan id>:<loan version>:<pricing>``. ``Loan.version`` moves
+on every write to the loan or its withdrawals (loan/signals.py; bulk paths
+bump it with ``version=F('version') + 1``), so a changed loan simply misses
+and old entries expire on their own: nothing is deleted or scanned.
+``pricing`` covers the settings repayment figures depend on.
+
+Views pass the figures that only fragments need through ``deferred`` so a
+hit also skips their queries. The loan row is read before the fragment
+renders, so a cached body is never older than the version in its key.
+
+Hits, misses, render time and the render time saved by hits go to the
+metrics registry (loan/instrumentation.py).
+"""
+import functools
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .amortization import default_rate, dti_limit
+from .instrumentation import registry
+
+registry.describe('loan_fragment_cache_requests_total', 'counter', 'Loan fragment cache lookups by fragment and result.')
+registry.describe('loan_fragment_cache_saved_seconds_total', 'counter', 'Render time saved by loan fragment cache hits.')
+registry.describe('loan_fragment_render_seconds', 'histogram', 'Render time of loan fragments on a cache miss.')
+
+
+def cache():
+    return caches[getattr(settings, 'FRAGMENT_CACHE', 'default')]
+
+
+def timeout():
+    return getattr(settings, 'FRAGMENT_CACHE_SECONDS', 86400)
+
+
+def fragment_key(name, loan):
+    return f'fragment:{name}:{loan.pk}:{loan.version}:{default_rate()}:{dti_limit()}'
+
+
+def deferred(compute):
+    """``compute`` as a memoized callable; templates call it only where it is rendered."""
+    return functools.cache(compute)
+
+
+def render(name, loan, render_block):
+    """Cached output of ``render_block()`` for ``loan`` at its current version."""
+    key = fragment_key(name, loan)
+    cached = cache().get(key)
+    if cached is not None:
+        content, seconds = cached
+        registry.inc('loan_fragment_cache_requests_total', fragment=name, result='hit')
+        registry.inc('loan_fragment_cache_saved_seconds_total', seconds, fragment=name)
+        return content
+    started = time.perf_counter()
+    content = render_block()
+    seconds = time.perf_counter() - started
+    cache().set(key, (str(content), seconds), timeout())
+    registry.inc('loan_fragment_cache_requests_total', fragment=name, result='miss')
+    registry.observe('loan_fragment_render_seconds', seconds, fragment=name)
+    return content
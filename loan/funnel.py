@@ -0,0 +1,96 @@
+"""Onboarding funnel by signup-week cohort.
+
+Every stage is counted in one GROUP BY over ``User``: profile and bank
+details are one-to-one LEFT JOINs, and loans and agreements are ``EXISTS``
+semi-joins, so users with several loans are not double counted and no
+per-user queries are issued. Staff accounts are excluded.
+
+``report`` caches the result for ``FUNNEL_REPORT_CACHE_SECONDS``.
+"""
+import csv
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Q
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from .models import Loan, LoanAgreement, User
+
+# (key, label, filter) in funnel order; ``None`` counts every user in the cohort.
+STAGES = [
+    ('registered', 'Registered', None),
+    ('verified', 'Email verified', Q(email_verified_at__isnull=False) | Q(email_verified=True)),
+    ('profile', 'Profile completed', Q(profile__completed=True)),
+    ('bank', 'Bank details', Q(bank_detail__isnull=False)),
+    ('applied', 'Applied for a loan', Q(Exists(Loan.objects.filter(user=OuterRef('pk'))))),
+    ('signed', 'Signed agreement', Q(Exists(LoanAgreement.objects.filter(user=OuterRef('pk'), signed_at__isnull=False)))),
+]
+
+REPORT_WEEKS = (4, 12, 26, 52)
+
+
+def cohorts(since=None):
+    """One row per signup week (newest first) with a count for each stage."""
+    users = User.objects.filter(is_staff=False)
+    if since is not None:
+        users = users.filter(created_at__gte=since)
+    annotations = {key: Count('pk', filter=condition) for key, _, condition in STAGES}
+    rows = list(
+        users.annotate(week=TruncWeek('created_at'))
+        .values('week')
+        .annotate(**annotations)
+        .order_by('-week')
+    )
+    for row in rows:
+        if isinstance(row['week'], datetime.datetime):
+            row['week'] = row['week'].date()
+    return rows
+
+
+def with_rates(row):
+    """Stage list for a cohort row: ``(label, count, share of previous stage, share of registered)``."""
+    stages = []
+    registered = row['registered']
+    previous = None
+    for key, label, _ in STAGES:
+        count = row[key]
+        step = count / previous if previous else None
+        overall = count / registered if registered else None
+        stages.append({'key': key, 'label': label, 'count': count, 'step': step, 'overall': overall})
+        previous = count
+    return stages
+
+
+def totals(rows):
+    total = {key: sum(row[key] for row in rows) for key, _, _ in STAGES}
+    total['week'] = None
+    return total
+
+
+def report(weeks=12):
+    key = f'onboarding-funnel:{weeks}'
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    today = timezone.localdate()
+    start = today - datetime.timedelta(days=today.weekday(), weeks=weeks - 1)
+    since = timezone.make_aware(datetime.datetime.combine(start, datetime.time.min))
+    rows = cohorts(since)
+    result = {
+        'since': start,
+        'generated_at': timezone.now(),
+        'cohorts': [{'week': row['week'], 'stages': with_rates(row)} for row in rows],
+        'total': with_rates(totals(rows)),
+    }
+    cache.set(key, result, getattr(settings, 'FUNNEL_REPORT_CACHE_SECONDS', 600))
+    return result
+
+
+def write_csv(report, stream):
+    writer = csv.writer(stream)
+    writer.writerow(['week'] + [label for _, label, _ in STAGES])
+    for cohort in report['cohorts']:
+        writer.writerow([cohort['week'].isoformat()] + [stage['count'] for stage in cohort['stages']])
+    writer.writerow(['total'] + [stage['count'] for stage in report['total']])
@@ -0,0 +1,135 @@
+"""Idempotency keys for the borrower POST endpoints.
+
+Forms posting to ``loan_application``, ``withdrawal_request`` and
+``loan_agreement`` carry a one-time token (``{% idempotency_field %}``,
+loan/templatetags/idempotency.py; API clients may send an
+``Idempotency-Key`` header instead). ``@idempotent`` keys the request by
+user and token in the ``IDEMPOTENCY_CACHE`` cache alias:
+
+* the first request claims the key with ``cache.add`` (atomic on the
+  database, Redis and memcached backends) and runs the view;
+* a successful outcome (a redirect, or a page marked with ``replay_as``) is
+  stored as ``(status, location)`` for ``IDEMPOTENCY_TTL_SECONDS``. Any
+  other outcome (validation errors, estimates, exceptions) releases the key
+  so the borrower can correct and resend;
+* a duplicate replays the stored redirect without running the view: no
+  validation, no balance aggregation, no insert, no signature decoding;
+* a duplicate that arrives while the first is still running waits up to
+  ``IDEMPOTENCY_WAIT_SECONDS`` for its outcome (a double tap shows the
+  response of the second request), then answers 409.
+
+A claim expires after ``IDEMPOTENCY_LOCK_SECONDS`` so a worker killed
+mid-request does not block the key for the whole TTL. Like the throttles,
+this needs a cache shared by every worker: production settings point
+``IDEMPOTENCY_CACHE`` at a ``DatabaseCache`` (``add`` is an INSERT against
+its primary key). With the per-process LocMemCache used locally it only
+deduplicates within one worker. POSTs without a token run as before.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponseRedirect
+from django.shortcuts import render
+
+from .instrumentation import registry
+
+FIELD_NAME = 'idempotency_key'
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_TOKEN_LENGTH = 200
+POLL_SECONDS = 0.1
+
+PENDING = 'PENDING'
+DONE = 'DONE'
+
+registry.describe('loan_idempotency_requests_total', 'counter', 'Keyed POSTs by endpoint and outcome.')
+
+
+def cache():
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE', 'default')]
+
+
+def request_token(request):
+    token = request.POST.get(FIELD_NAME) or request.META.get(HEADER, '')
+    return token.strip()[:MAX_TOKEN_LENGTH]
+
+
+def cache_key(user_id, token):
+    return f'idempotency:{user_id}:{hashlib.sha256(token.encode()).hexdigest()[:32]}'
+
+
+def replay_as(response, url):
+    """Mark a successful non-redirect ``response``: duplicates are redirected to ``url``."""
+    response.idempotent_location = url
+    return response
+
+
+def outcome(response):
+    """``(status, location)`` to store for ``response``, or ``None`` when it should not be replayed."""
+    location = getattr(response, 'idempotent_location', None)
+    if location:
+        return 303, location
+    if 300 <= response.status_code < 400 and response.has_header('Location'):
+        return response.status_code, response['Location']
+    return None
+
+
+def replay(entry):
+    _, _, status, location = entry
+    response = HttpResponseRedirect(location, status=status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def conflict(request, message):
+    return render(request, 'loan/request_conflict.html', {'message': message}, status=409)
+
+
+def wait_for(key):
+    """Poll ``key`` until it is no longer pending; returns the entry, ``None`` if released, or the pending entry on timeout."""
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 10)
+    entry = cache().get(key)
+    while entry is not None and entry[0] == PENDING and time.monotonic() < deadline:
+        time.sleep(POLL_SECONDS)
+        entry = cache().get(key)
+    return entry
+
+
+def idempotent(view):
+    """Run keyed POSTs at most once per (user, token); see the module docstring."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = request_token(request) if request.method == 'POST' else ''
+        if not token:
+            return view(request, *args, **kwargs)
+        endpoint = request.resolver_match.url_name if request.resolver_match else view.__name__
+        key = cache_key(request.user.pk, token)
+        store = cache()
+        while not store.add(key, (PENDING, request.path), timeout=getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60)):
+            entry = wait_for(key)
+            if entry is None:
+                continue  # the first attempt failed and released the key: this one runs
+            if entry[1] != request.path:
+                registry.inc('loan_idempotency_requests_total', endpoint=endpoint, result='conflict')
+                return conflict(request, 'This form was already submitted elsewhere. Please reload the page.')
+            if entry[0] == PENDING:
+                registry.inc('loan_idempotency_requests_total', endpoint=endpoint, result='conflict')
+                return conflict(request, 'Your request is still being processed. Please check again in a moment.')
+            registry.inc('loan_idempotency_requests_total', endpoint=endpoint, result='replayed')
+            return replay(entry)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            store.delete(key)
+            raise
+        result = outcome(response)
+        if result is None:
+            store.delete(key)
+        else:
+            store.set(key, (DONE, request.path, *result), timeout=getattr(settings, 'IDEMPOTENCY_TTL_SECONDS', 86400))
+        registry.inc('loan_idempotency_requests_total', endpoint=endpoint, result='stored' if result else 'released')
+        return response
+    return wrapper
@@ -0,0 +1,92 @@
+"""Canonical email and phone forms, and the one way to look users up by them.
+
+``User.email`` and ``User.phone`` are stored canonical (``User.save`` calls
+``normalize_email``/``normalize_phone``), so every lookup is an exact match
+on a unique index; ``iexact`` (an ``UPPER()`` scan on PostgreSQL) is never
+needed. A functional unique index on ``LOWER(email)`` additionally stops
+case variants written by raw SQL or ``QuerySet.update``.
+
+* email: surrounding whitespace removed and the whole address lowercased
+  (mailbox providers treat local parts case-insensitively in practice);
+* phone: E.164, ``+`` and 8 to 15 digits. Input with ``+`` or ``00`` is
+  taken as international; anything else is a national number in
+  ``PHONE_DEFAULT_COUNTRY_CODE`` (one trunk ``0`` dropped).
+
+Registration, login (``UserManager.get_by_natural_key``), password reset and
+invites all go through ``user_by_email``/``email_taken``/``phone_taken``.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+E164_MIN_DIGITS = 8
+E164_MAX_DIGITS = 15
+
+
+class InvalidPhoneNumber(ValueError):
+    pass
+
+
+def default_country_code():
+    return str(getattr(settings, 'PHONE_DEFAULT_COUNTRY_CODE', '1')).lstrip('+')
+
+
+def normalize_email(value):
+    return (value or '').strip().lower()
+
+
+def normalize_phone(value, country_code=None):
+    """``value`` in E.164 (``+15551234567``); raises ``InvalidPhoneNumber``."""
+    raw = (value or '').strip()
+    digits = ''.join(ch for ch in raw if ch.isdigit())
+    if raw.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    else:
+        country_code = country_code or default_country_code()
+        national = digits[1:] if digits.startswith('0') else digits
+        # "1 555 123 4567" typed without the plus already carries the country code.
+        if not (digits.startswith(country_code) and len(digits) > 10):
+            digits = country_code + national
+    if not E164_MIN_DIGITS <= len(digits) <= E164_MAX_DIGITS or digits.startswith('0'):
+        raise InvalidPhoneNumber(f'{value!r} is not a valid phone number.')
+    return '+' + digits
+
+
+def normalize_phone_or_raw(value):
+    """Canonical phone when ``value`` parses, else ``value`` stripped (admin/legacy input)."""
+    try:
+        return normalize_phone(value)
+    except InvalidPhoneNumber:
+        return (value or '').strip()
+
+
+def account_last4(account_number):
+    """Last four digits of a bank account number (what staff search by)."""
+    digits = ''.join(ch for ch in account_number or '' if ch.isdigit())
+    return digits[-4:]
+
+
+def users():
+    return get_user_model()._default_manager
+
+
+def user_by_email(email):
+    """The user with this email (any case/whitespace), or ``None``."""
+    email = normalize_email(email)
+    if not email:
+        return None
+    try:
+        return users().get(email=email)
+    except get_user_model().DoesNotExist:
+        return None
+
+
+def email_taken(email, exclude_pk=None):
+    email = normalize_email(email)
+    return bool(email) and users().filter(email=email).exclude(pk=exclude_pk).exists()
+
+
+def phone_taken(phone, exclude_pk=None):
+    """Whether a user has ``phone``; pass it canonical (``normalize_phone``)."""
+    return users().filter(phone=phone).exclude(pk=exclude_pk).exists()
@@ -0,0 +1,354 @@
+"""Per-request performance instrumentation.
+
+``RequestTimingMiddleware`` times every request, counts DB queries through
+``connection.execute_wrapper`` and collects named phases recorded with
+``timed()`` (SMTP, WeasyPrint). Every Django template render (``render()``,
+``TemplateResponse``, ``render_to_string``, the admin) is timed as
+``render`` once the middleware is loaded. Staff users get the
+breakdown in a ``Server-Timing`` header; everyone's timings are folded into
+per-URL-name histograms exposed in Prometheus text format by the
+``metrics`` view.
+
+Each gunicorn worker keeps its own in-memory registry and periodically
+writes it to ``METRICS_DIR/worker-<pid>.json`` (atomic rename). The metrics
+endpoint merges the files of live workers, so a scrape sees the whole
+instance no matter which worker answers it; files of exited workers are
+deleted (like prometheus_client's ``mark_process_dead``). Commands that
+generate synthetic traffic run inside
+``loan.benchmarks.runner.scratch_metrics_dir()``.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+# Prometheus ``le`` bounds, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Phases reported in Server-Timing, in display order.
+PHASES = ('mw', 'db', 'render', 'smtp', 'pdf')
+
+PHASE_DESCRIPTIONS = {
+    'mw': 'middleware',
+    'db': 'database',
+    'render': 'templates',
+    'smtp': 'email',
+    'pdf': 'weasyprint',
+}
+
+METRIC_HELP = {
+    'loan_request_duration_seconds': ('histogram', 'Request latency by URL name.'),
+    'loan_request_phase_seconds': ('histogram', 'Time spent per request phase by URL name.'),
+    'loan_request_db_queries_total': ('counter', 'Database queries issued by URL name.'),
+}
+
+_current = contextvars.ContextVar('loan_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Timings collected for the request currently being served."""
+
+    __slots__ = ('started', 'view_started', 'phases', 'db_queries')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.phases = {}
+        self.db_queries = 0
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.add('db', time.perf_counter() - start)
+
+
+def current_metrics():
+    """Return the ``RequestMetrics`` of the active request, or None."""
+    return _current.get()
+
+
+@contextmanager
+def timed(phase):
+    """Attribute the wrapped block's wall time to ``phase`` of the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(phase, time.perf_counter() - start)
+
+
+_rendering = contextvars.ContextVar('loan_template_rendering', default=False)
+_template_timing_installed = False
+
+
+def install_template_timing():
+    """Time every Django-backend template render as the ``render`` phase.
+
+    Wraps ``django.template.backends.django.Template.render``, which
+    ``render()``, ``TemplateResponse`` and ``render_to_string`` all go
+    through. Renders nested inside another (a template rendered from a
+    template tag) are counted once, as part of the outer one.
+    """
+    global _template_timing_installed
+    if _template_timing_installed:
+        return
+    from django.template.backends.django import Template
+
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        if _current.get() is None or _rendering.get():
+            return original(self, context, request)
+        token = _rendering.set(True)
+        try:
+            with timed('render'):
+                return original(self, context, request)
+        finally:
+            _rendering.reset(token)
+
+    Template.render = render
+    _template_timing_installed = True
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """Process-local histograms and counters, flushed to disk for cross-worker scrapes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._last_flush = 0.0
+
+    def describe(self, name, kind, help_text):
+        METRIC_HELP.setdefault(name, (kind, help_text))
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'histograms': [[name, dict(labels), list(values)] for (name, labels), values in self._histograms.items()],
+                'counters': [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+            }
+
+    def _worker_path(self):
+        return os.path.join(_metrics_dir(), f'worker-{os.getpid()}.json')
+
+    def flush(self):
+        directory = _metrics_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = self._worker_path()
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0)
+        if time.monotonic() - self._last_flush >= interval:
+            try:
+                self.flush()
+            except OSError:
+                # Metrics must never break a request; the next flush retries.
+                self._last_flush = time.monotonic()
+
+
+registry = MetricsRegistry()
+
+
+def _metrics_dir():
+    return str(getattr(settings, 'METRICS_DIR', '/tmp/loan-metrics'))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect():
+    """Merge the snapshots written by the live workers on this instance; drop those of exited ones."""
+    try:
+        registry.flush()
+    except OSError:
+        pass
+    histograms = {}
+    counters = {}
+    directory = _metrics_dir()
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        names = []
+    for filename in names:
+        if not (filename.startswith('worker-') and filename.endswith('.json')):
+            continue
+        try:
+            pid = int(filename[len('worker-'):-len('.json')])
+        except ValueError:
+            continue
+        if not _pid_alive(pid):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, values in data.get('histograms', []):
+            key = (name, _label_key(labels))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = list(values)
+            else:
+                histograms[key] = [a + b for a, b in zip(merged, values)]
+        for name, labels, value in data.get('counters', []):
+            key = (name, _label_key(labels))
+            counters[key] = counters.get(key, 0) + value
+    return histograms, counters
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ''
+    escaped = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items)
+    return '{' + escaped + '}'
+
+
+def render_prometheus():
+    """Render the merged registry in the Prometheus text exposition format."""
+    histograms, counters = collect()
+    lines = []
+    described = set()
+
+    def header(name, default_kind):
+        if name in described:
+            return
+        described.add(name)
+        kind, help_text = METRIC_HELP.get(name, (default_kind, name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), values in sorted(histograms.items()):
+        header(name, 'histogram')
+        for bound, count in zip(LATENCY_BUCKETS, values):
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+        lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {values[-1]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {values[-2]:.6f}')
+        lines.append(f'{name}_count{_format_labels(labels)} {values[-1]}')
+    for (name, labels), value in sorted(counters.items()):
+        header(name, 'counter')
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _wants_server_timing(request):
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and getattr(user, 'is_staff', False))
+
+
+def _server_timing_header(metrics, total):
+    parts = []
+    for phase in PHASES:
+        seconds = metrics.phases.get(phase)
+        if seconds is None:
+            continue
+        desc = PHASE_DESCRIPTIONS[phase]
+        if phase == 'db':
+            desc = f'{metrics.db_queries} queries'
+        parts.append(f'{phase};dur={seconds * 1000:.1f};desc="{desc}"')
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+class RequestTimingMiddleware:
+    """Time each request and record per-URL-name latency histograms.
+
+    Keep this first in MIDDLEWARE so ``mw`` covers the rest of the stack.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PERF_INSTRUMENTATION', True)
+        if self.enabled:
+            install_template_timing()
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(metrics.db_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total = time.perf_counter() - metrics.started
+        if metrics.view_started is not None:
+            metrics.add('mw', metrics.view_started - metrics.started)
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unresolved'
+        registry.observe('loan_request_duration_seconds', total, view=view)
+        for phase, seconds in metrics.phases.items():
+            registry.observe('loan_request_phase_seconds', seconds, view=view, phase=phase)
+        if metrics.db_queries:
+            registry.inc('loan_request_db_queries_total', metrics.db_queries, view=view)
+        registry.maybe_flush()
+
+        if _wants_server_timing(request):
+            response['Server-Timing'] = _server_timing_header(metrics, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None and metrics.view_started is None:
+            metrics.view_started = time.perf_counter()
+        return None
@@ -0,0 +1,169 @@
+"""Scheduled loan lifecycle transitions (``manage.py sweep_loan_lifecycle``).
+
+Nothing in the request cycle moves a loan past APPROVED; the sweeper does,
+in this order:
+
+* ``activate``: APPROVED loans with a signed agreement become ACTIVE
+  (``approved_at`` is backfilled for loans approved before it was stamped);
+* ``close``: ACTIVE loans that owe nothing become CLOSED, stamped with
+  ``closed_at``: nothing drawn (no approved or pending withdrawals) and the
+  term has run out (``term_months`` after ``approved_at``, to the day).
+  Loans with drawn principal stay ACTIVE and keep accruing interest
+  (loan/accrual.py); there are no recorded repayments to settle them yet.
+
+Each transition walks candidate loans in primary-key (keyset) chunks. Per
+chunk, the rows still matching are locked ``SKIP LOCKED`` and moved with one
+UPDATE, one bulk ``AuditLog`` insert, portfolio summary deltas and status
+events, in one transaction. The last committed id of every transition is
+kept in ``LOAN_LIFECYCLE_STATE_FILE``, so an interrupted run resumes where
+it stopped; a completed transition resets its cursor for the next run.
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Value
+from django.db.models.functions import Coalesce, ExtractDay, ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from . import events, summaries
+from .models import AuditLog, Loan, LoanAgreement, WithdrawalRequest
+
+# Snapshot read per loan: summary contribution fields, then the owner for events.
+ROW_FIELDS = ('pk', 'created_at', 'requested_amount', 'approved_amount', 'user_id')
+
+
+def _signed():
+    return Exists(LoanAgreement.objects.filter(loan=OuterRef('pk'), signed_at__isnull=False))
+
+
+def _settled(queryset):
+    """Loans with nothing drawn or requested whose term has ended."""
+    owing = WithdrawalRequest.objects.filter(loan=OuterRef('pk'), status__in=('APPROVED', 'PENDING'))
+    today = timezone.localdate()
+    month = today.year * 12 + today.month - 1
+    # Month arithmetic in SQL on every backend: the term ends on the approval day of month
+    # approved + term_months (a day later when that month is shorter).
+    return queryset.filter(approved_at__isnull=False).exclude(Exists(owing)).annotate(
+        term_end_month=ExtractYear('approved_at') * 12 + ExtractMonth('approved_at') - 1 + F('term_months'),
+        approved_day=ExtractDay('approved_at'),
+    ).filter(Q(term_end_month__lt=month) | Q(term_end_month=month, approved_day__lte=today.day))
+
+
+def _activate_updates(now):
+    return {'status': 'ACTIVE', 'approved_at': Coalesce(F('approved_at'), Value(now))}
+
+
+def _close_updates(now):
+    return {'status': 'CLOSED', 'closed_at': now}
+
+
+# name: (from status, candidate filter, fields set by the UPDATE, audit action)
+TRANSITIONS = {
+    'activate': ('APPROVED', lambda qs: qs.filter(_signed()), _activate_updates, 'ACTIVATED'),
+    'close': ('ACTIVE', _settled, _close_updates, 'CLOSED'),
+}
+
+
+def state_path():
+    return Path(getattr(settings, 'LOAN_LIFECYCLE_STATE_FILE', Path(settings.BASE_DIR) / 'var' / 'loan-lifecycle.json'))
+
+
+def load_state():
+    try:
+        with open(state_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(state):
+    path = state_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def candidates(name, queryset=None):
+    from_status, narrow, _, _ = TRANSITIONS[name]
+    queryset = Loan.objects.all() if queryset is None else queryset
+    return narrow(queryset.filter(status=from_status))
+
+
+def apply_chunk(name, pks, admin=None):
+    """Move the loans in ``pks`` that still qualify; returns the ids changed."""
+    from_status, _, updates, action = TRANSITIONS[name]
+    now = timezone.now()
+    with transaction.atomic():
+        # Re-check under lock: loans changed since they were read, or held by another run, are skipped.
+        rows = list(
+            candidates(name, Loan.objects.select_for_update(skip_locked=True, of=('self',)).filter(pk__in=pks))
+            .values_list(*ROW_FIELDS)
+        )
+        if not rows:
+            return []
+        ids = [row[0] for row in rows]
+        values = updates(now)
+        to_status = values['status']
+        Loan.objects.filter(pk__in=ids).update(**values, version=F('version') + 1)
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                admin=admin,
+                action=action,
+                entity_type='Loan',
+                entity_id=pk,
+                details={'engine': 'lifecycle', 'from': from_status, 'to': to_status},
+            )
+            for pk in ids
+        ], batch_size=1000)
+        deltas = []
+        for pk, created_at, requested, approved, _ in rows:
+            before = summaries.contribution('LOAN', (created_at, from_status, requested, approved))
+            after = summaries.contribution('LOAN', (created_at, to_status, requested, approved))
+            deltas.extend(summaries.diff(before, after))
+        summaries.apply_deltas(deltas)
+        events.publish_many(events.loan_message(user_id, pk, to_status, from_status) for pk, *_, user_id in rows)
+    return ids
+
+
+def sweep(names=None, *, chunk_size=5000, admin=None, dry_run=False, restart=False, limit=None, progress=None):
+    """Run the transitions in ``names`` (all by default); returns per-transition stats.
+
+    Stats are ``{'scanned', 'changed', 'seconds', 'rate', 'resumed_from'}``; ``rate`` is loans
+    scanned per second. ``limit`` stops each transition after that many scanned loans, leaving
+    its cursor for the next run.
+    """
+    state = {} if restart else load_state()
+    results = {}
+    for name in names or TRANSITIONS:
+        last_pk = state.get(name, 0)
+        stats = {'scanned': 0, 'changed': 0, 'resumed_from': last_pk}
+        started = time.perf_counter()
+        pending = candidates(name).order_by('pk').values_list('pk', flat=True)
+        finished = False
+        while limit is None or stats['scanned'] < limit:
+            take = chunk_size if limit is None else min(chunk_size, limit - stats['scanned'])
+            pks = list(pending.filter(pk__gt=last_pk)[:take])
+            if not pks:
+                finished = True
+                break
+            stats['scanned'] += len(pks)
+            stats['changed'] += len(pks) if dry_run else len(apply_chunk(name, pks, admin=admin))
+            last_pk = pks[-1]
+            if not dry_run:
+                state[name] = last_pk
+                save_state(state)
+            if progress:
+                progress(name, stats)
+        if finished and not dry_run:
+            state.pop(name, None)
+            save_state(state)
+        stats['seconds'] = time.perf_counter() - started
+        stats['rate'] = stats['scanned'] / stats['seconds'] if stats['seconds'] else 0.0
+        results[name] = stats
+    return results
@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from loan import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move AuditLog rows older than the retention window into compressed JSONL segments "
+        "under AUDIT_ARCHIVE_DIR and delete them from the table in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=getattr(settings, 'AUDIT_RETENTION_DAYS', 365),
+                            help="Archive whole days older than this (default: AUDIT_RETENTION_DAYS).")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows deleted per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be archived.")
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 1:
+            raise CommandError('--older-than-days must be at least 1.')
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        started = time.perf_counter()
+
+        def progress(day, written, deleted):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{day}: {written:,} archived, {deleted:,} deleted')
+
+        totals = archive.archive_before(cutoff, batch_size=options['batch_size'], dry_run=options['dry_run'], progress=progress)
+        elapsed = time.perf_counter() - started
+        if options['dry_run']:
+            self.stdout.write(f"Dry run: {totals['written']:,} rows over {totals['days']:,} days before {timezone.localdate(cutoff)} would be archived.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {totals['written']:,} rows and deleted {totals['deleted']:,} over {totals['days']:,} days "
+            f"in {elapsed:.1f}s to {archive.archive_dir()}."
+        ))
@@ -0,0 +1,84 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from loan import benchmarks
+from loan.benchmarks import runner
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the microbenchmark suite in a throwaway test database, write JSON results "
+        "and fail when a case is slower than the stored baseline by more than --tolerance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', action='append', dest='groups', help="Benchmark group to run (repeatable, default: core).")
+        parser.add_argument('--filter', default='', help="Only run cases whose name contains this string.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--min-time', type=float, default=0.2, help="Minimum seconds per timing run.")
+        parser.add_argument('--scale', type=int, default=1_000_000, help="Dataset size used by 'scale' cases.")
+        parser.add_argument('--output', help="Write JSON results to this path.")
+        parser.add_argument('--baseline', default=str(getattr(settings, 'BENCHMARK_BASELINE', Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json')))
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%).")
+        parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline.")
+        parser.add_argument('--no-baseline', action='store_true', help="Only time the cases; do not compare against a baseline.")
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the benchmark database between runs.")
+
+    def handle(self, *args, **options):
+        groups = set(options['groups'] or ['core'])
+        cases = [
+            case for case in benchmarks.load()
+            if case.group in groups and options['filter'] in case.name
+        ]
+        if not cases:
+            raise CommandError('No benchmarks match the given --group/--filter.')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'])
+        try:
+            with runner.scratch_metrics_dir():
+                ctx = runner.BenchContext(scale=options['scale'])
+                results = runner.run(cases, ctx, repeat=options['repeat'], min_time=options['min_time'], stdout=self.stdout)
+            report = {'environment': runner.environment(), 'results': results}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if options['output']:
+            runner.write_json(options['output'], report)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            merged = runner.load_json(baseline_path) if baseline_path.exists() else {'results': {}}
+            merged['environment'] = report['environment']
+            merged['results'].update({k: v for k, v in results.items() if 'best' in v})
+            runner.write_json(baseline_path, merged)
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {baseline_path}'))
+            return
+
+        if options['no_baseline']:
+            return
+        if not baseline_path.exists():
+            # A missing baseline must not read as "no regressions".
+            raise CommandError(
+                f'No baseline at {baseline_path}; run with --save-baseline to create one, or pass --no-baseline.'
+            )
+
+        rows, regressions = runner.compare(results, runner.load_json(baseline_path), options['tolerance'])
+        self.stdout.write('')
+        self.stdout.write(f"{'benchmark':<50} {'now':>12} {'baseline':>12} {'ratio':>7}  status")
+        for name, best, base, ratio, status in rows:
+            ratio_text = f'{ratio:.2f}' if ratio is not None else '-'
+            line = f'{name:<50} {runner.format_seconds(best):>12} {runner.format_seconds(base):>12} {ratio_text:>7}  {status}'
+            self.stdout.write(self.style.ERROR(line) if status == 'REGRESSION' else line)
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} benchmark(s) regressed beyond {options['tolerance']:.0%}: {', '.join(regressions)}"
+            )
+        self.stdout.write(self.style.SUCCESS('No regressions against baseline.'))
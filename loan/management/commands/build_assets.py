@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loan import assets
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate AVIF/WebP width variants of the static images and their manifest in ASSET_BUILD_DIR. "
+        "Run before collectstatic, which hashes and precompresses the output."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rebuild every image, even unchanged ones.")
+
+    def handle(self, *args, **options):
+        if not assets.formats():
+            raise CommandError('This Pillow build can encode none of ASSET_IMAGE_FORMATS.')
+        started = time.perf_counter()
+
+        def progress(name, entry):
+            if options['verbosity'] > 1:
+                counts = ', '.join(f'{len(v)} {fmt}' for fmt, v in entry['variants'].items())
+                self.stdout.write(f"{name} ({entry['width']}x{entry['height']}): {counts}")
+
+        rebuilt, unchanged, _ = assets.build(force=options['force'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"{rebuilt} images built, {unchanged} unchanged in {time.perf_counter() - started:.1f}s "
+            f"({', '.join(assets.formats())}) -> {assets.build_dir()}"
+        ))
@@ -0,0 +1,174 @@
+import gzip
+from html.parser import HTMLParser
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from loan import assets
+from loan.benchmarks.runner import scratch_metrics_dir
+
+MOBILE_UA = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148'
+TEXT_SUFFIXES = ('.css', '.js', '.svg', '.html', '.json', '.txt', '.ico')
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def compressed_size(data, name=''):
+    """Bytes on the wire for a text asset: Brotli when available, else gzip."""
+    if name and not name.endswith(TEXT_SUFFIXES):
+        return len(data)
+    brotli = _brotli()
+    if brotli is not None:
+        return len(brotli.compress(data, quality=11))
+    return len(gzip.compress(data, 9))
+
+
+class AssetParser(HTMLParser):
+    """Collect what a browser fetches on first load: stylesheets, icons, scripts, images, video."""
+
+    def __init__(self):
+        super().__init__()
+        self.found = []  # (kind, url or candidates, eager)
+        self._picture = None
+        self._video_preload = None  # inside <video>: its effective preload
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'link' and attrs.get('href') and {'stylesheet', 'icon'} & set((attrs.get('rel') or '').split()):
+            self.found.append(('css' if 'stylesheet' in attrs['rel'] else 'icon', attrs['href'], True))
+        elif tag == 'script' and attrs.get('src'):
+            self.found.append(('script', attrs['src'], True))
+        elif tag == 'picture':
+            self._picture = []
+        elif tag == 'source' and self._picture is not None:
+            self._picture.append((attrs.get('type'), attrs.get('srcset', ''), attrs.get('sizes', '100vw')))
+        elif tag == 'img' and attrs.get('src'):
+            eager = attrs.get('loading') != 'lazy'
+            if self._picture:
+                # Modern browsers take the first <source> (AVIF); report the image it would pick.
+                self.found.append(('picture', (attrs['src'], self._picture[0]), eager))
+            else:
+                self.found.append(('img', attrs['src'], eager))
+        elif tag == 'video':
+            if attrs.get('poster'):
+                self.found.append(('poster', attrs['poster'], True))
+            self._video_preload = 'auto' if 'autoplay' in attrs else attrs.get('preload', 'auto')
+        elif tag == 'source' and self._video_preload is not None:
+            self.found.append(('video', attrs.get('src'), self._video_preload == 'auto'))
+
+    def handle_endtag(self, tag):
+        if tag == 'picture':
+            self._picture = None
+        elif tag == 'video':
+            self._video_preload = None
+
+
+class Command(BaseCommand):
+    help = (
+        "Bytes a first-time mobile visitor downloads for a page: the original assets uncompressed "
+        "(before) vs what is shipped now (responsive variants, Brotli/gzip text, deferred video)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths', help="Page to measure (repeatable, default: /).")
+        parser.add_argument('--viewport-width', type=int, default=390, help="CSS pixels.")
+        parser.add_argument('--dpr', type=float, default=3.0, help="Device pixel ratio.")
+
+    def handle(self, *args, **options):
+        self.viewport = options['viewport_width']
+        self.dpr = options['dpr']
+        self.unhashed = {hashed: name for name, hashed in getattr(staticfiles_storage, 'hashed_files', {}).items()}
+        manifest = assets.manifest()
+        self.variant_source = {
+            variant: name
+            for name, entry in manifest.items()
+            for variants in entry['variants'].values()
+            for variant, _ in variants
+        }
+        client = Client(HTTP_USER_AGENT=MOBILE_UA)
+        grand = [0, 0]
+        for path in options['paths'] or ['/']:
+            with override_settings(ALLOWED_HOSTS=['*']), scratch_metrics_dir():
+                response = client.get(path)
+            html = response.content
+            parser = AssetParser()
+            parser.feed(html.decode(response.charset or 'utf-8', 'replace'))
+            rows = [('document', path, len(html), compressed_size(html, '.html'), '')]
+            seen = set()
+            for kind, ref, eager in parser.found:
+                key = repr(ref)
+                if key not in seen:  # fetched once however often it is referenced
+                    seen.add(key)
+                    rows.append(self.measure(kind, ref, eager))
+            self.stdout.write(f'\n{path} (viewport {self.viewport}px @{self.dpr:g}x)')
+            before = after = 0
+            for kind, name, old, new, note in rows:
+                self.stdout.write(f'  {kind:<8} {name:<46} {self.kb(old):>10} -> {self.kb(new):>10}  {note}')
+                before += old or 0
+                after += new or 0
+            saved = 1 - after / before if before else 0
+            self.stdout.write(self.style.SUCCESS(f'  total    {self.kb(before):>57} -> {self.kb(after):>10}  ({saved:.0%} less)'))
+            grand[0] += before
+            grand[1] += after
+        if len(options['paths'] or []) > 1:
+            self.stdout.write(self.style.SUCCESS(f'\nAll pages: {self.kb(grand[0])} -> {self.kb(grand[1])}'))
+
+    @staticmethod
+    def kb(size):
+        return '-' if size is None else f'{size / 1024:,.1f} KiB'
+
+    def static_name(self, url):
+        if not url or not url.startswith(settings.STATIC_URL):
+            return None
+        name = url[len(settings.STATIC_URL):].split('?')[0]
+        return self.unhashed.get(name, name)
+
+    def read(self, name, collected=True):
+        """Bytes of a static file: the collected copy when present, else the source."""
+        if collected and settings.STATIC_ROOT:
+            hashed = getattr(staticfiles_storage, 'hashed_files', {}).get(name, name)
+            path = Path(settings.STATIC_ROOT) / hashed
+            if path.is_file():
+                return path.read_bytes()
+        found = finders.find(name)
+        return Path(found).read_bytes() if found else None
+
+    def measure(self, kind, ref, eager):
+        if kind == 'picture':
+            src, (mime, srcset, sizes) = ref
+            original = self.static_name(src)
+            candidates = [c.split() for c in srcset.split(',') if c.strip()]
+            css_width = self.viewport
+            if sizes.endswith('px'):
+                css_width = float(sizes[:-2])
+            elif sizes.endswith('vw'):
+                css_width = self.viewport * float(sizes[:-2]) / 100
+            chosen = assets.pick([(url, int(w[:-1])) for url, w in candidates], css_width * self.dpr)[0]
+            data = self.read(self.static_name(chosen))
+            source = self.read(original, collected=False)
+            return ('image', original, len(source) if source else None,
+                    len(data) if data and eager else 0, f'{mime}' + ('' if eager else ', lazy: after first paint'))
+        name = self.static_name(ref)
+        if name is None:
+            return (kind, (ref or '')[:46], None, None, 'external, not counted')
+        original = self.variant_source.get(name, name)
+        source = self.read(original, collected=False)
+        if source is None:
+            return (kind, name, None, None, 'file not found')
+        if kind == 'video':
+            return (kind, name, len(source), len(source) if eager else 0, '' if eager else 'preload=none: on play')
+        shipped = self.read(name)
+        new = compressed_size(shipped, name) if eager else 0
+        note = 'variant of ' + original if original != name else ''
+        return (kind, original, len(source), new, note)
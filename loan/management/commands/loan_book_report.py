@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from loan import amortization
+from loan.models import Loan
+
+
+class Command(BaseCommand):
+    help = "Print repayment totals (installments, interest, debt-to-income) for the loan book."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status', action='append', dest='statuses',
+            help="Loan status to include (repeatable, default: APPROVED and ACTIVE).",
+        )
+        parser.add_argument('--rate', help="Annual rate override, e.g. 0.18 (default: LOAN_ANNUAL_RATE).")
+
+    def handle(self, *args, **options):
+        statuses = options['statuses'] or ['APPROVED', 'ACTIVE']
+        started = time.perf_counter()
+        summary = amortization.book_summary(Loan.objects.filter(status__in=statuses), annual_rate=options['rate'])
+        elapsed = time.perf_counter() - started
+        if not summary['loans']:
+            self.stdout.write('No loans match.')
+            return
+        for key, value in summary.items():
+            self.stdout.write(f"{key.replace('_', ' '):<24} {value}")
+        self.stdout.write(f"computed in {elapsed:.2f}s")
@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from loan.models import LoanAgreement
+from loan.storage import content_hash, hashed_name, is_hashed
+
+
+class Command(BaseCommand):
+    help = (
+        "Move agreement signature images saved under the old flat names into the content-addressed, "
+        "sharded layout (see loan/storage.py). Safe to rerun: rows already migrated are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Agreements updated per transaction.")
+        parser.add_argument('--keep-originals', action='store_true', help="Do not delete the old files after moving them.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the files that would be moved.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        storage = LoanAgreement._meta.get_field('signature_image').storage
+        agreements = LoanAgreement.objects.exclude(signature_image='').exclude(signature_image__isnull=True)
+        started = time.perf_counter()
+        stats = {'moved': 0, 'deduplicated': 0, 'missing': 0, 'bytes_saved': 0}
+
+        last_pk = 0
+        while True:
+            rows = list(agreements.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'signature_image')[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            pending = [(pk, name) for pk, name in rows if not is_hashed(name)]
+            if options['dry_run']:
+                stats['moved'] += len(pending)
+                continue
+
+            renamed = {}
+            originals = []
+            for pk, name in pending:
+                if not storage.exists(name):
+                    stats['missing'] += 1
+                    continue
+                size = storage.size(name)
+                with storage.open(name, 'rb') as handle:
+                    # The target exists already when identical bytes were stored before: save() reuses it.
+                    duplicate = storage.exists(hashed_name(name, content_hash(handle)))
+                    new_name = storage.save(name, handle)
+                renamed[pk] = new_name
+                originals.append(name)
+                stats['moved'] += 1
+                if duplicate:
+                    stats['deduplicated'] += 1
+                    stats['bytes_saved'] += size
+
+            if renamed:
+                # Set-based rewrite: a storage move is not a business change, so it is not audited per row.
+                with transaction.atomic():
+                    objs = [LoanAgreement(pk=pk, signature_image=name) for pk, name in renamed.items()]
+                    LoanAgreement.objects.bulk_update(objs, ['signature_image'], batch_size=batch_size)
+                if not options['keep_originals']:
+                    for name in originals:
+                        storage.delete(name)
+            if options['verbosity'] > 1:
+                self.stdout.write(f"up to #{last_pk}: {stats['moved']:,} moved, {stats['deduplicated']:,} duplicates")
+
+        elapsed = time.perf_counter() - started
+        if options['dry_run']:
+            self.stdout.write(f"Dry run: {stats['moved']:,} signature files would be moved.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {stats['moved']:,} signature files in {elapsed:.1f}s "
+            f"({stats['deduplicated']:,} duplicates, {stats['bytes_saved']:,} bytes saved; {stats['missing']:,} missing)."
+        ))
@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loan import identity, payouts
+from loan.models import PayoutBatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Payout batches for approved withdrawals. 'create' claims unbatched withdrawals (skipping rows "
+        "a concurrent run holds) and writes the bank file; 'paid' confirms a generated batch; "
+        "'cancel' releases an unpaid batch's withdrawals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['create', 'paid', 'cancel'])
+        parser.add_argument('--batch', type=int, help="Batch id (paid, cancel).")
+        parser.add_argument('--format', dest='file_format', choices=['CSV', 'FIXED'], default='CSV', help="File format (create).")
+        parser.add_argument('--limit', type=int, help="Claim at most this many withdrawals (create).")
+        parser.add_argument('--chunk-size', type=int, help="Rows per transaction (default: PAYOUT_CHUNK_SIZE).")
+        parser.add_argument('--admin-email', help="Attribute the batch and audit rows to this staff user.")
+
+    def handle(self, *args, **options):
+        admin = None
+        if options['admin_email']:
+            admin = identity.user_by_email(options['admin_email'])
+            if admin is None or not admin.is_staff:
+                raise CommandError(f"No staff user with email {options['admin_email']}.")
+        if options['action'] == 'create':
+            return self.create(options, admin)
+        if not options['batch']:
+            raise CommandError(f"{options['action']} needs --batch.")
+        batch = PayoutBatch.objects.filter(pk=options['batch']).first()
+        if batch is None:
+            raise CommandError(f"No payout batch {options['batch']}.")
+        started = time.perf_counter()
+        try:
+            if options['action'] == 'paid':
+                count = payouts.mark_paid(batch, admin=admin, chunk_size=options['chunk_size'])
+                verb = 'marked paid'
+            else:
+                count = payouts.cancel(batch)
+                verb = 'released'
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Batch {batch.pk}: {count:,} withdrawals {verb} in {time.perf_counter() - started:.2f}s."
+        ))
+
+    def create(self, options, admin):
+        started = time.perf_counter()
+        batch = payouts.create_batch(
+            file_format=options['file_format'], limit=options['limit'], created_by=admin, chunk_size=options['chunk_size'],
+        )
+        if batch is None:
+            self.stdout.write('No withdrawals to pay out.')
+            return
+        claimed = time.perf_counter()
+        payouts.generate_file(batch, chunk_size=options['chunk_size'])
+        written = time.perf_counter()
+        rate = batch.withdrawal_count / (written - claimed) if written > claimed else 0
+        self.stdout.write(f"Claimed {batch.withdrawal_count:,} withdrawals in {claimed - started:.2f}s; "
+                          f"file written in {written - claimed:.2f}s ({rate:,.0f} rows/s).")
+        self.stdout.write(self.style.SUCCESS(
+            f"Batch {batch.pk}: {batch.total_amount} total, {batch.file.name} sha256 {batch.file_sha256}, entry hash {batch.entry_hash}."
+        ))
@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+
+def purge_expired(cache, chunk_size):
+    """Delete the expired rows of a ``DatabaseCache`` table, ``chunk_size`` per transaction."""
+    db = router.db_for_write(cache.cache_model_class)
+    connection = connections[db]
+    table = connection.ops.quote_name(cache._table)
+    key, expires = connection.ops.quote_name('cache_key'), connection.ops.quote_name('expires')
+    now = connection.ops.adapt_datetimefield_value(timezone.now().replace(microsecond=0))
+    deleted = 0
+    while True:
+        with transaction.atomic(using=db), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {key} IN (SELECT {key} FROM {table} WHERE {expires} < %s LIMIT %s)',
+                [now, chunk_size],
+            )
+            count = cursor.rowcount
+        deleted += count
+        if count < chunk_size:
+            return deleted
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired rows (idempotency keys, throttle buckets, reports) from the database cache "
+        "tables. DatabaseCache only removes them when a table reaches MAX_ENTRIES, so run this on a "
+        "schedule, e.g. hourly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cache', dest='aliases', action='append',
+                            help="Cache alias to purge (repeatable; default: every DatabaseCache alias).")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows deleted per transaction.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        aliases = options['aliases'] or list(settings.CACHES)
+        for alias in aliases:
+            if alias not in settings.CACHES:
+                raise CommandError(f'No cache alias {alias!r}.')
+            cache = caches[alias]
+            if not isinstance(cache, DatabaseCache):
+                if options['aliases']:
+                    raise CommandError(f'Cache {alias!r} is not a DatabaseCache; its backend expires keys itself.')
+                continue
+            started = time.perf_counter()
+            deleted = purge_expired(cache, options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{alias}: deleted {deleted:,} expired rows from {cache._table} in {time.perf_counter() - started:.1f}s.'
+            ))
@@ -0,0 +1,28 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loan import summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the DailySummary portfolio table from loans and withdrawals. Signals keep it "
+        "current afterwards; rerun after bulk imports or set-based updates that bypass them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Only rebuild days on or after this date (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format.')
+        started = time.perf_counter()
+        rows = summaries.rebuild(since=since)
+        summaries.clear_report_cache()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows:,} summary rows in {time.perf_counter() - started:.1f}s.'))
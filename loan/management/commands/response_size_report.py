@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from loan.benchmarks import runner
+from loan.compression import available_encodings
+
+PUBLIC_PATHS = ['/', '/login/', '/register/', '/terms/']
+
+
+class Command(BaseCommand):
+    help = (
+        "Bytes on the wire per URL before and after ResponseCompressionMiddleware: original HTML, "
+        "minified, gzip and Brotli. Runs against fixtures in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths', help="Extra anonymous page to measure (repeatable).")
+        parser.add_argument('--withdrawals', type=int, default=25, help="Withdrawals on the fixture loan.")
+        parser.add_argument('--loans', type=int, default=100, help="Loans shown in the admin changelists.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with runner.scratch_metrics_dir():
+                rows = self.measure_all(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        encodings = available_encodings()
+        header = f"{'url':<40} {'original':>10} {'minified':>10}" + ''.join(f' {e:>10}' for e in encodings) + '   saved'
+        self.stdout.write(header)
+        totals = [0] * (2 + len(encodings))
+        for path, sizes in rows:
+            best = min(sizes[1:])
+            saved = 1 - best / sizes[0] if sizes[0] else 0
+            self.stdout.write(f'{path:<40}' + ''.join(f' {self.kb(s):>10}' for s in sizes) + f'  {saved:>5.0%}')
+            totals = [t + s for t, s in zip(totals, sizes)]
+        saved = 1 - min(totals[1:]) / totals[0] if totals[0] else 0
+        self.stdout.write(self.style.SUCCESS(f"{'total':<40}" + ''.join(f' {self.kb(s):>10}' for s in totals) + f'  {saved:>5.0%}'))
+
+    @staticmethod
+    def kb(size):
+        return f'{size / 1024:,.1f}K'
+
+    def measure_all(self, options):
+        ctx = runner.BenchContext()
+        borrower = ctx.create_user()
+        loan = ctx.create_loan(borrower)
+        ctx.add_withdrawals(loan, options['withdrawals'])
+        staff = ctx.create_user(is_staff=True, is_superuser=True)
+        for _ in range(options['loans']):
+            other = ctx.create_loan(ctx.create_user(profile=False, bank=False), status='PENDING')
+            ctx.add_withdrawals(other, 1, status='PENDING')
+
+        pages = [(None, path) for path in PUBLIC_PATHS + (options['paths'] or [])]
+        pages += [(borrower, path) for path in (
+            '/loan/dashboard/', f'/loan/{loan.pk}/agreement/', '/withdrawal/request/', '/api/loan/status/',
+        )]
+        pages += [(staff, path) for path in ('/admin/loan/loan/', '/admin/loan/withdrawalrequest/', '/admin/loan/auditlog/')]
+        rows = []
+        for user, path in pages:
+            sizes = [
+                len(self.fetch(user, path, 'identity', HTML_MINIFY=False, RESPONSE_COMPRESSION=False)),
+                len(self.fetch(user, path, 'identity')),
+            ]
+            sizes += [len(self.fetch(user, path, encoding)) for encoding in available_encodings()]
+            rows.append((path, sizes))
+        return rows
+
+    def fetch(self, user, path, encoding, **settings):
+        # Middleware reads its settings when the handler is built, so use a fresh client.
+        with override_settings(ALLOWED_HOSTS=['*'], **settings):
+            client = Client(HTTP_USER_AGENT=runner.MOBILE_UA, HTTP_ACCEPT_ENCODING=encoding)
+            if user is not None:
+                client.force_login(user)
+            response = client.get(path)
+        if response.status_code != 200:
+            self.stderr.write(f'{path}: HTTP {response.status_code}')
+        return response.content
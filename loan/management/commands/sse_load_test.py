@@ -0,0 +1,205 @@
+import asyncio
+import gc
+import os
+import statistics
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from loan import events
+from loan.models import User
+
+MOBILE_UA = 'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148'
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux), or None."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+class Tally:
+    """Frames received across all streams, with waiters for a target count."""
+
+    def __init__(self):
+        self.counts = {'status': 0, 'load_test': 0, 'failed': 0}
+        self._waiters = []
+
+    def add(self, kind):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        for waiter in list(self._waiters):
+            kinds, target, done = waiter
+            if sum(self.counts.get(k, 0) for k in kinds) >= target:
+                done.set()
+                self._waiters.remove(waiter)
+
+    async def wait(self, kinds, target, timeout):
+        if sum(self.counts.get(k, 0) for k in kinds) >= target:
+            return
+        done = asyncio.Event()
+        self._waiters.append((kinds, target, done))
+        await asyncio.wait_for(done.wait(), timeout)
+
+
+class Stream:
+    """One simulated ``EventSource`` speaking ASGI to the application in this process."""
+
+    def __init__(self, app, scope, tally):
+        self.app = app
+        self.scope = scope
+        self.tally = tally
+        self.disconnected = asyncio.Event()
+        self.requested = False
+        self.buffer = b''
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.app(self.scope, self.receive, self.send))
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            if message['status'] != 200:
+                self.tally.add('failed')
+        elif message['type'] == 'http.response.body':
+            self.buffer += message.get('body', b'')
+            while b'\n\n' in self.buffer:
+                frame, self.buffer = self.buffer.split(b'\n\n', 1)
+                if frame.startswith(b'event: '):
+                    self.tally.add(frame[7:].split(b'\n', 1)[0].decode())
+
+    async def close(self):
+        self.disconnected.set()
+        try:
+            await asyncio.wait_for(self.task, 10)
+        except (asyncio.CancelledError, TimeoutError):
+            pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold many /api/loan/events/ streams open against the ASGI application in this process "
+        "(one worker) and report connect time, memory per connection and event fan-out latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200, help="Distinct borrowers the streams are spread over.")
+        parser.add_argument('--rounds', type=int, default=5, help="Times one event is published to every user.")
+        parser.add_argument('--timeout', type=float, default=120.0, help="Seconds to wait for each phase.")
+        parser.add_argument(
+            '--without-router', action='store_true',
+            help="Send streams through the Django middleware stack (the loan_events view) instead of EventStreamRouter.",
+        )
+
+    def handle(self, *args, **options):
+        users = list(
+            User.objects.filter(profile__completed=True, bank_detail__isnull=False)
+            .order_by('pk')[:options['users']]
+        )
+        if not users:
+            raise CommandError('No borrowers with a completed profile and bank details; run generate_synthetic_data first.')
+        cookies = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            cookies.append(f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}")
+        self.stdout.write(
+            f"{options['connections']:,} streams over {len(users)} users, backend {events.backend_name()!r}, "
+            f"{'Django view' if options['without_router'] else 'EventStreamRouter'}"
+        )
+        with override_settings(ALLOWED_HOSTS=['*']):
+            asyncio.run(self.run([u.pk for u in users], cookies, options))
+
+    def scope(self, cookie):
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': reverse('loan_events'),
+            'raw_path': reverse('loan_events').encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [
+                (b'host', b'localhost'),
+                (b'user-agent', MOBILE_UA.encode()),
+                (b'accept', b'text/event-stream'),
+                (b'cookie', cookie.encode()),
+            ],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+
+    async def run(self, user_ids, cookies, options):
+        app = get_asgi_application()
+        if not options['without_router']:
+            app = events.EventStreamRouter(app)
+        count = options['connections']
+        timeout = options['timeout']
+        tally = Tally()
+        # Warm up (imports, URL resolver, thread pool) so RSS growth is the connections' own.
+        warmup = Stream(app, self.scope(cookies[0]), Tally())
+        warmup.start()
+        await warmup.tally.wait(('status', 'failed'), 1, timeout)
+        await warmup.close()
+        gc.collect()
+        rss_before = rss_bytes()
+
+        started = time.perf_counter()
+        streams = [Stream(app, self.scope(cookies[i % len(cookies)]), tally) for i in range(count)]
+        for stream in streams:
+            stream.start()
+        await tally.wait(('status', 'failed'), count, timeout)
+        connect_seconds = time.perf_counter() - started
+        if tally.counts['failed']:
+            raise CommandError(f"{tally.counts['failed']} streams were refused (not 200); are the users' profiles complete?")
+        gc.collect()
+        rss_after = rss_bytes()
+        self.stdout.write(
+            f"connected {count:,} in {connect_seconds:.2f}s ({count / connect_seconds:,.0f}/s), "
+            f"{events.broker().subscriber_count():,} subscriptions"
+        )
+        if rss_before and rss_after:
+            self.stdout.write(
+                f"RSS {rss_before / 2**20:,.1f} -> {rss_after / 2**20:,.1f} MiB "
+                f"({(rss_after - rss_before) / count / 1024:,.1f} KiB per connection)"
+            )
+
+        latencies = []
+        send = sync_to_async(events.broker().send)
+        for round_number in range(1, options['rounds'] + 1):
+            messages = [events.message(pk, 'load_test', {'round': round_number}) for pk in user_ids]
+            started = time.perf_counter()
+            await send(messages)
+            await tally.wait(('load_test',), count * round_number, timeout)
+            latencies.append(time.perf_counter() - started)
+        if latencies:
+            self.stdout.write(
+                f"fan-out of {len(user_ids)} events to {count:,} streams: "
+                f"median {statistics.median(latencies) * 1000:,.1f} ms, max {max(latencies) * 1000:,.1f} ms "
+                f"({count / statistics.median(latencies):,.0f} deliveries/s)"
+            )
+
+        started = time.perf_counter()
+        await asyncio.gather(*(stream.close() for stream in streams))
+        remaining = events.broker().subscriber_count()
+        self.stdout.write(self.style.SUCCESS(
+            f"closed in {time.perf_counter() - started:.2f}s, {remaining} subscriptions left"
+        ))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from loan import identity, lifecycle
+
+
+class Command(BaseCommand):
+    help = (
+        "Move loans through their lifecycle: APPROVED loans with a signed agreement become ACTIVE, "
+        "ACTIVE loans that owe nothing become CLOSED once their term ends. Meant for a scheduler (cron, fly "
+        "machines); an interrupted run resumes from LOAN_LIFECYCLE_STATE_FILE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', choices=list(lifecycle.TRANSITIONS), dest='names',
+                            help="Run only this transition (repeatable, default: all in order).")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Loans scanned and updated per transaction.")
+        parser.add_argument('--limit', type=int, help="Stop each transition after this many loans; the next run continues.")
+        parser.add_argument('--restart', action='store_true', help="Ignore the saved cursor and scan from the first loan.")
+        parser.add_argument('--dry-run', action='store_true', help="Count candidates without writing.")
+        parser.add_argument('--admin-email', help="Attribute audit rows to this staff user instead of the system.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        admin = None
+        if options['admin_email']:
+            admin = identity.user_by_email(options['admin_email'])
+            if admin is None or not admin.is_staff:
+                raise CommandError(f"No staff user with email {options['admin_email']}.")
+
+        def progress(name, stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{name}: {stats['scanned']:,} scanned, {stats['changed']:,} changed")
+
+        results = lifecycle.sweep(
+            options['names'],
+            chunk_size=options['chunk_size'],
+            admin=admin,
+            dry_run=options['dry_run'],
+            restart=options['restart'],
+            limit=options['limit'],
+            progress=progress,
+        )
+        for name, stats in results.items():
+            resumed = f" (resumed after loan {stats['resumed_from']})" if stats['resumed_from'] else ''
+            verb = 'would change' if options['dry_run'] else 'changed'
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: {stats['scanned']:,} loans scanned, {stats['changed']:,} {verb} in "
+                f"{stats['seconds']:.2f}s ({stats['rate']:,.0f} loans/s){resumed}."
+            ))
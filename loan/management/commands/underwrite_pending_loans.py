@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from loan import identity, underwriting
+
+
+class Command(BaseCommand):
+    help = (
+        "Evaluate every PENDING loan against the underwriting rules and write the automatic "
+        "approvals/rejections. --dry-run only reports throughput and the decision distribution."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Evaluate without writing decisions.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Loans fetched and written per batch.")
+        parser.add_argument('--workers', type=int, default=1, help="Evaluate chunks in this many processes.")
+        parser.add_argument('--limit', type=int, help="Stop after this many loans.")
+        parser.add_argument('--auto-approve', action='store_true', default=None,
+                            help="Approve loans passing every rule (default: UNDERWRITING_AUTO_APPROVE).")
+        parser.add_argument('--admin-email', help="Attribute audit rows to this staff user instead of the system.")
+
+    def handle(self, *args, **options):
+        admin = None
+        if options['admin_email']:
+            admin = identity.user_by_email(options['admin_email'])
+            if admin is None or not admin.is_staff:
+                raise CommandError(f"No staff user with email {options['admin_email']}.")
+        specs = underwriting.load_specs()
+        if not specs:
+            raise CommandError('No underwriting rules: add UnderwritingRule rows or set UNDERWRITING_RULES.')
+        try:
+            underwriting.compile_rules(specs)
+        except (KeyError, TypeError, ValueError) as exc:
+            raise CommandError(f'Invalid underwriting rule: {exc}')
+
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{stats['evaluated']:,} evaluated, {stats['written']:,} written")
+
+        stats = underwriting.underwrite(
+            specs=specs,
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            dry_run=options['dry_run'],
+            admin=admin,
+            auto_approve=options['auto_approve'],
+            limit=options['limit'],
+            progress=progress,
+        )
+        evaluated = stats['evaluated']
+        self.stdout.write(f"{'Dry run: ' if options['dry_run'] else ''}{evaluated:,} pending loans evaluated "
+                          f"in {stats['seconds']:.2f}s ({stats['rate']:,.0f} loans/s) with {len(specs)} rules.")
+        for decision in underwriting.DECISIONS:
+            count = stats['decisions'][decision]
+            share = count / evaluated if evaluated else 0
+            self.stdout.write(f'  {decision:<8} {count:>10,} {share:>7.1%}')
+        if stats['failed_rules']:
+            self.stdout.write('Failed rules:')
+            for name, count in stats['failed_rules'].most_common():
+                self.stdout.write(f'  {name:<24} {count:>10,}')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"{stats['written']:,} loans decided."))
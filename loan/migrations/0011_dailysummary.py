@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0010_profiledump'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('kind', models.CharField(choices=[('LOAN', 'Loan'), ('WITHDRAWAL', 'Withdrawal')], max_length=10)),
+                ('status', models.CharField(max_length=10)),
+                ('count', models.BigIntegerField(default=0)),
+                ('amount_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('approved_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'daily summaries',
+                'ordering': ['-day', 'kind', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'kind', 'status'), name='loan_dailysummary_day_kind_status')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0011_dailysummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnderwritingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('kind', models.CharField(choices=[('MAX_INCOME_MULTIPLE', 'Requested amount at most N x monthly income'), ('MIN_INCOME', 'Monthly income at least N'), ('MAX_AMOUNT', 'Requested amount at most N'), ('MAX_TERM', 'Term at most N months'), ('MIN_AGE', 'Borrower at least N years old'), ('MAX_AGE', 'Borrower at most N years old'), ('MAX_DTI', 'Installment / monthly income at most N'), ('EMPLOYMENT_IN', 'Employment status is one of values'), ('EMPLOYMENT_NOT_IN', 'Employment status is not one of values')], max_length=30)),
+                ('threshold', models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True)),
+                ('values', models.CharField(blank=True, help_text='Comma-separated, for employment rules.', max_length=255)),
+                ('outcome', models.CharField(choices=[('REJECT', 'Reject'), ('REVIEW', 'Send to manual review')], default='REVIEW', max_length=10)),
+                ('priority', models.PositiveIntegerField(default=100)),
+                ('active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['priority', 'name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='details',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='admin',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='admin_logs', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
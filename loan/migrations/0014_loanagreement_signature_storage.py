@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:05
+
+import loan.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0013_auditlog_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loanagreement',
+            name='signature_image',
+            field=models.ImageField(blank=True, null=True, storage=loan.storage.signature_storage, upload_to='agreements/signatures/'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0016_payout_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='accrued_through',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='InterestAccrual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('principal', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('annual_rate', models.DecimalField(decimal_places=8, max_digits=10)),
+                ('interest', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('fee', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accruals', to='loan.loan')),
+            ],
+            options={
+                'ordering': ['loan', 'date'],
+                'constraints': [models.UniqueConstraint(fields=('loan', 'date'), name='loan_interestaccrual_loan_date')],
+            },
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 6.0.1 on 2026-10-19 18:10
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import IntegrityError, migrations, models, transaction
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+BATCH_SIZE = 1000
+E164_MIN_DIGITS = 8
+E164_MAX_DIGITS = 15
+
+
+# Frozen copies of loan.identity's normalizers as of this migration: later changes
+# to the app code must not change what this data migration writes.
+def normalize_email(value):
+    return (value or '').strip().lower()
+
+
+def normalize_phone_or_raw(value):
+    raw = (value or '').strip()
+    digits = ''.join(ch for ch in raw if ch.isdigit())
+    if raw.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    else:
+        country_code = str(getattr(settings, 'PHONE_DEFAULT_COUNTRY_CODE', '1')).lstrip('+')
+        national = digits[1:] if digits.startswith('0') else digits
+        if not (digits.startswith(country_code) and len(digits) > 10):
+            digits = country_code + national
+    if not E164_MIN_DIGITS <= len(digits) <= E164_MAX_DIGITS or digits.startswith('0'):
+        return raw
+    return '+' + digits
+
+
+def _collisions(User):
+    rows = (
+        User.objects.annotate(key=Lower('email')).values('key')
+        .annotate(n=Count('pk')).filter(n__gt=1).values_list('key', flat=True)[:20]
+    )
+    return ', '.join(rows) or 'phone numbers that share an E.164 form'
+
+
+def normalize_identities(apps, schema_editor):
+    """Rewrite emails lowercase and phones in E.164, one primary-key batch per UPDATE round."""
+    User = apps.get_model('loan', 'User')
+    rows = User.objects.order_by('pk').values_list('pk', 'email', 'phone')
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        changed = [
+            User(pk=pk, email=normalize_email(email), phone=normalize_phone_or_raw(phone))
+            for pk, email, phone in batch
+            if (email, phone) != (normalize_email(email), normalize_phone_or_raw(phone))
+        ]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_update(changed, ['email', 'phone'])
+        except IntegrityError:
+            # The existing unique indexes catch accounts that only differ by case or phone format.
+            raise RuntimeError(
+                f'Accounts collide once normalized ({_collisions(User)}); merge or edit them, then migrate again.'
+            )
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('loan', '0017_interest_accrual'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_identities, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='loan_user_email_lower'),
+        ),
+    ]
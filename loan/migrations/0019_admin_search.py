@@ -0,0 +1,84 @@
+# Generated by Django 6.0.1 on 2026-10-19 19:00
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Frozen copy of loan.search's index SQL as of this migration (the module may change later).
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS loan_user_search USING fts5("
+    "full_name, content='loan_user', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+    "CREATE TRIGGER IF NOT EXISTS loan_user_search_ai AFTER INSERT ON loan_user BEGIN "
+    "INSERT INTO loan_user_search(rowid, full_name) VALUES (new.id, new.full_name); END",
+    "CREATE TRIGGER IF NOT EXISTS loan_user_search_ad AFTER DELETE ON loan_user BEGIN "
+    "INSERT INTO loan_user_search(loan_user_search, rowid, full_name) VALUES ('delete', old.id, old.full_name); END",
+    "CREATE TRIGGER IF NOT EXISTS loan_user_search_au AFTER UPDATE OF full_name ON loan_user BEGIN "
+    "INSERT INTO loan_user_search(loan_user_search, rowid, full_name) VALUES ('delete', old.id, old.full_name); "
+    "INSERT INTO loan_user_search(rowid, full_name) VALUES (new.id, new.full_name); END",
+    "INSERT INTO loan_user_search(loan_user_search) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS loan_user_search_ai',
+    'DROP TRIGGER IF EXISTS loan_user_search_ad',
+    'DROP TRIGGER IF EXISTS loan_user_search_au',
+    'DROP TABLE IF EXISTS loan_user_search',
+]
+POSTGRES_INSTALL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS loan_user_full_name_trgm ON loan_user USING gin (UPPER(full_name::text) gin_trgm_ops)',
+]
+POSTGRES_DROP = ['DROP INDEX IF EXISTS loan_user_full_name_trgm']
+
+
+def account_last4(account_number):
+    digits = ''.join(ch for ch in account_number or '' if ch.isdigit())
+    return digits[-4:]
+
+
+def fill_account_last4(apps, schema_editor):
+    BankDetail = apps.get_model('loan', 'BankDetail')
+    rows = BankDetail.objects.order_by('pk').values_list('pk', 'account_number')
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        BankDetail.objects.bulk_update(
+            [BankDetail(pk=pk, account_last4=account_last4(number)) for pk, number in batch], ['account_last4'],
+        )
+        last_pk = batch[-1][0]
+
+
+def create_search_indexes(apps, schema_editor):
+    # Trigram GIN index on PostgreSQL, FTS5 table on SQLite (when compiled in), nothing elsewhere.
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            if 'ENABLE_FTS5' not in {row[0] for row in cursor.fetchall()}:
+                return
+    for sql in {'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for sql in {'postgresql': POSTGRES_DROP, 'sqlite': SQLITE_DROP}.get(vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0018_user_email_lower'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankdetail',
+            name='account_last4',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=4),
+        ),
+        migrations.RunPython(fill_account_last4, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
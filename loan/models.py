@@ -1,20 +1,28 @@
 
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 
+from . import identity
+from .audit import AuditedModel
+from .storage import signature_storage
+
 # Audit log model
 class AuditLog(models.Model):
-	admin = models.ForeignKey('User', on_delete=models.CASCADE, related_name='admin_logs')
+	# admin is empty for automated decisions (e.g. the underwriting engine)
+	admin = models.ForeignKey('User', on_delete=models.CASCADE, related_name='admin_logs', null=True, blank=True)
 	action = models.CharField(max_length=100)
 	entity_type = models.CharField(max_length=100)
 	entity_id = models.PositiveIntegerField()
-	timestamp = models.DateTimeField(auto_now_add=True)
+	details = models.JSONField(default=dict, blank=True)
+	timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
 
 	def __str__(self):
-		return f"{self.admin.email} {self.action} {self.entity_type} {self.entity_id} at {self.timestamp}"
+		actor = self.admin.email if self.admin_id else "system"
+		return f"{actor} {self.action} {self.entity_type} {self.entity_id} at {self.timestamp}"
 
 # Loan model
-class Loan(models.Model):
+class Loan(AuditedModel):
 	STATUS_CHOICES = [
 		("PENDING", "Pending"),
 		("APPROVED", "Approved"),
@@ -33,12 +41,25 @@ class Loan(models.Model):
 	created_at = models.DateTimeField(auto_now_add=True)
 	approved_at = models.DateTimeField(null=True, blank=True)
 	closed_at = models.DateTimeField(null=True, blank=True)
+	# Bumped on every write to the loan or its withdrawals (loan/signals.py); the status API's ETag
+	version = models.PositiveBigIntegerField(default=0, editable=False)
+	# Last day posted to the InterestAccrual ledger (loan/accrual.py)
+	accrued_through = models.DateField(null=True, blank=True, editable=False)
+
+	audit_exclude = AuditedModel.audit_exclude + ('version', 'accrued_through')
+
+	def save(self, *args, **kwargs):
+		# Every save moves the version (bump_loan_version), partial saves included: a stale
+		# version would keep serving old status-API 304s and cached dashboard fragments.
+		if kwargs.get('update_fields') is not None:
+			kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+		super().save(*args, **kwargs)
 
 	def __str__(self):
 		return f"Loan {self.id} for {self.user.email} ({self.status})"
 
 
-class WithdrawalRequest(models.Model):
+class WithdrawalRequest(AuditedModel):
 	STATUS_CHOICES = [
 		("PENDING", "Pending"),
 		("APPROVED", "Approved"),
@@ -51,9 +72,53 @@ class WithdrawalRequest(models.Model):
 	note = models.TextField(blank=True)
 	created_at = models.DateTimeField(auto_now_add=True)
 	processed_at = models.DateTimeField(null=True, blank=True)
+	# Set when the withdrawal is claimed into a payout file / when that file is confirmed paid (loan/payouts.py)
+	payout_batch = models.ForeignKey('PayoutBatch', on_delete=models.SET_NULL, null=True, blank=True, related_name='withdrawals')
+	paid_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		indexes = [
+			# Approved withdrawals waiting for a payout batch, claimed in id order.
+			models.Index(
+				fields=['id'],
+				condition=models.Q(status='APPROVED', payout_batch__isnull=True),
+				name='loan_withdrawal_unbatched',
+			),
+		]
 
 	def __str__(self):
 		return f"Withdrawal {self.id} for Loan {self.loan_id} ({self.status})"
+
+# Bank-transfer file for a set of approved withdrawals (see loan/payouts.py)
+class PayoutBatch(AuditedModel):
+	STATUS_CHOICES = [
+		("OPEN", "Open"),
+		("GENERATED", "File generated"),
+		("PAID", "Paid"),
+		("CANCELLED", "Cancelled"),
+	]
+	FORMAT_CHOICES = [
+		("CSV", "CSV"),
+		("FIXED", "Fixed width"),
+	]
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="OPEN")
+	file_format = models.CharField(max_length=5, choices=FORMAT_CHOICES, default="CSV")
+	withdrawal_count = models.PositiveIntegerField(default=0)
+	total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+	file = models.FileField(upload_to='payouts/', blank=True)
+	file_sha256 = models.CharField(max_length=64, blank=True)
+	entry_hash = models.CharField(max_length=10, blank=True)
+	created_by = models.ForeignKey('User', on_delete=models.SET_NULL, null=True, blank=True, related_name='payout_batches')
+	created_at = models.DateTimeField(auto_now_add=True)
+	generated_at = models.DateTimeField(null=True, blank=True)
+	paid_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		ordering = ['-created_at']
+		verbose_name_plural = "payout batches"
+
+	def __str__(self):
+		return f"Payout batch {self.id} ({self.withdrawal_count} withdrawals, {self.get_status_display()})"
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 
@@ -63,7 +128,6 @@ class UserManager(BaseUserManager):
 			raise ValueError('Users must have an email address')
 		if not phone:
 			raise ValueError('Users must have a phone number')
-		email = self.normalize_email(email)
 		user = self.model(email=email, phone=phone, full_name=full_name, role=role, **extra_fields)
 		user.set_password(password)
 		user.save(using=self._db)
@@ -75,8 +139,12 @@ class UserManager(BaseUserManager):
 		extra_fields.setdefault('is_superuser', True)
 		return self.create_user(email, phone, full_name, password, **extra_fields)
 
+	def get_by_natural_key(self, username):
+		# Login and password checks look the email up in its stored (canonical) form
+		return self.get(email=identity.normalize_email(username))
+
 
-class User(AbstractBaseUser, PermissionsMixin):
+class User(AuditedModel, AbstractBaseUser, PermissionsMixin):
 	ROLE_CHOICES = (
 		('USER', 'User'),
 		('ADMIN', 'Admin'),
@@ -97,7 +165,15 @@ class User(AbstractBaseUser, PermissionsMixin):
 	USERNAME_FIELD = 'email'
 	REQUIRED_FIELDS = ['phone', 'full_name']
 
+	class Meta:
+		constraints = [
+			# Stored emails are lowercase (loan/identity.py); this also rejects case variants written around save()
+			models.UniqueConstraint(Lower('email'), name='loan_user_email_lower'),
+		]
+
 	def save(self, *args, **kwargs):
+		self.email = identity.normalize_email(self.email)
+		self.phone = identity.normalize_phone_or_raw(self.phone)
 		if self.password and not self.password_hash:
 			self.set_password(self.password)
 		super().save(*args, **kwargs)
@@ -111,7 +187,7 @@ class User(AbstractBaseUser, PermissionsMixin):
 
 
 # User profile model
-class Profile(models.Model):
+class Profile(AuditedModel):
 	MARITAL_STATUS_CHOICES = [
 		('SINGLE', 'Single'),
 		('MARRIED', 'Married'),
@@ -146,13 +222,13 @@ class Profile(models.Model):
 
 
 # Signed agreement record for loans
-class LoanAgreement(models.Model):
+class LoanAgreement(AuditedModel):
 	loan = models.ForeignKey('Loan', on_delete=models.CASCADE, related_name='agreements')
 	user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='agreements')
 	borrower_name = models.CharField(max_length=255)
 	requested_amount = models.DecimalField(max_digits=12, decimal_places=2)
 	account_last4 = models.CharField(max_length=8, blank=True, default='')
-	signature_image = models.ImageField(upload_to='agreements/signatures/', null=True, blank=True)
+	signature_image = models.ImageField(upload_to='agreements/signatures/', storage=signature_storage, null=True, blank=True)  # content-addressed, see loan/storage.py
 	signature_text = models.CharField(max_length=255, blank=True)
 	signed_at = models.DateTimeField(null=True, blank=True)
 	ip_address = models.GenericIPAddressField(null=True, blank=True)
@@ -164,12 +240,127 @@ class LoanAgreement(models.Model):
 		return f"Agreement {self.id} for Loan {self.loan_id} by {self.user.email}"
 
 # Bank details model
-class BankDetail(models.Model):
+class BankDetail(AuditedModel):
 	user = models.OneToOneField('User', on_delete=models.CASCADE, related_name='bank_detail')
 	bank_name = models.CharField(max_length=100)
 	account_name = models.CharField(max_length=100)
 	account_number = models.CharField(max_length=64)  # Placeholder for encrypted field
+	# Indexed for admin search (loan/search.py) without reading the account number
+	account_last4 = models.CharField(max_length=4, blank=True, db_index=True, editable=False)
 	created_at = models.DateTimeField(auto_now_add=True)
 
+	audit_exclude = AuditedModel.audit_exclude + ('account_last4',)
+
 	def __str__(self):
 		return f"Bank details for {self.user.email}"
+
+	def save(self, *args, **kwargs):
+		self.account_last4 = identity.account_last4(self.account_number)
+		if kwargs.get('update_fields') is not None and 'account_number' in kwargs['update_fields']:
+			kwargs['update_fields'] = {*kwargs['update_fields'], 'account_last4'}
+		super().save(*args, **kwargs)
+
+
+# cProfile dump captured for a single request (see loan/profiling.py)
+class ProfileDump(models.Model):
+	TRIGGER_CHOICES = [
+		("STAFF", "Staff request"),
+		("SAMPLE", "Sampled"),
+	]
+	user = models.ForeignKey('User', on_delete=models.SET_NULL, null=True, blank=True, related_name='profile_dumps')
+	url_name = models.CharField(max_length=200, blank=True)
+	path = models.CharField(max_length=500)
+	method = models.CharField(max_length=10)
+	status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+	duration_ms = models.FloatField()
+	query_count = models.PositiveIntegerField(default=0)
+	query_log = models.TextField(blank=True)
+	trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+	file_name = models.CharField(max_length=255)
+	size_bytes = models.PositiveIntegerField(default=0)
+	created_at = models.DateTimeField(auto_now_add=True)
+	last_accessed = models.DateTimeField(auto_now_add=True, db_index=True)
+
+	class Meta:
+		ordering = ['-created_at']
+
+	def __str__(self):
+		return f"Profile {self.id} of {self.url_name or self.path} ({self.duration_ms:.0f} ms)"
+
+
+# Per-day, per-status portfolio totals maintained by loan/summaries.py
+class DailySummary(models.Model):
+	KIND_CHOICES = [
+		("LOAN", "Loan"),
+		("WITHDRAWAL", "Withdrawal"),
+	]
+	day = models.DateField()
+	kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+	status = models.CharField(max_length=10)
+	count = models.BigIntegerField(default=0)
+	amount_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+	approved_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		ordering = ['-day', 'kind', 'status']
+		constraints = [
+			models.UniqueConstraint(fields=['day', 'kind', 'status'], name='loan_dailysummary_day_kind_status'),
+		]
+		verbose_name_plural = "daily summaries"
+
+	def __str__(self):
+		return f"{self.day} {self.kind} {self.status}: {self.count}"
+
+
+# One day of interest and fees on an active loan, posted by loan/accrual.py
+class InterestAccrual(models.Model):
+	loan = models.ForeignKey('Loan', on_delete=models.CASCADE, related_name='accruals')
+	date = models.DateField()
+	principal = models.DecimalField(max_digits=12, decimal_places=2)
+	annual_rate = models.DecimalField(max_digits=10, decimal_places=8)
+	interest = models.DecimalField(max_digits=12, decimal_places=2)
+	fee = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		ordering = ['loan', 'date']
+		constraints = [
+			models.UniqueConstraint(fields=['loan', 'date'], name='loan_interestaccrual_loan_date'),
+		]
+
+	def __str__(self):
+		return f"Loan {self.loan_id} {self.date}: {self.interest} interest, {self.fee} fee"
+
+
+# Declarative underwriting rule evaluated by loan/underwriting.py
+class UnderwritingRule(AuditedModel):
+	KIND_CHOICES = [
+		("MAX_INCOME_MULTIPLE", "Requested amount at most N x monthly income"),
+		("MIN_INCOME", "Monthly income at least N"),
+		("MAX_AMOUNT", "Requested amount at most N"),
+		("MAX_TERM", "Term at most N months"),
+		("MIN_AGE", "Borrower at least N years old"),
+		("MAX_AGE", "Borrower at most N years old"),
+		("MAX_DTI", "Installment / monthly income at most N"),
+		("EMPLOYMENT_IN", "Employment status is one of values"),
+		("EMPLOYMENT_NOT_IN", "Employment status is not one of values"),
+	]
+	OUTCOME_CHOICES = [
+		("REJECT", "Reject"),
+		("REVIEW", "Send to manual review"),
+	]
+	name = models.CharField(max_length=100, unique=True)
+	kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+	threshold = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+	values = models.CharField(max_length=255, blank=True, help_text="Comma-separated, for employment rules.")
+	outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES, default="REVIEW")
+	priority = models.PositiveIntegerField(default=100)
+	active = models.BooleanField(default=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		ordering = ['priority', 'name']
+
+	def __str__(self):
+		return f"{self.name} ({self.get_kind_display()})"
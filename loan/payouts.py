@@ -0,0 +1,284 @@
+"""Payout batches: bank-transfer files for approved withdrawals.
+
+A batch moves through ``OPEN`` -> ``GENERATED`` -> ``PAID`` (or ``CANCELLED``):
+
+* ``create_batch`` claims approved withdrawals that are in no batch yet and
+  whose borrower has bank details, ``chunk_size`` rows per transaction. Each
+  chunk is selected ``FOR UPDATE SKIP LOCKED`` and stamped with the batch in
+  one UPDATE, so concurrent runs (command, admin action) never claim the
+  same row and never wait on each other;
+* ``generate_file`` writes the file to ``MEDIA_ROOT/payouts/`` (private,
+  served to staff through loan/protected_media.py) while reading the batch
+  in keyset-paginated chunks, so memory stays flat for 100k-row batches. It
+  records the file's SHA-256 and an entry hash (sum of the account numbers'
+  last 10 digits, mod 10**10, as in NACHA files) that the bank can check
+  against the trailer record;
+* ``mark_paid`` stamps ``paid_at`` with one UPDATE per chunk and bumps the
+  loans' versions; ``cancel`` releases unpaid rows for the next batch.
+
+Formats: ``CSV`` (header, one row per withdrawal, ``TRAILER`` row) and
+``FIXED`` (94-character records: ``1`` header, ``6`` entries, ``9`` trailer).
+"""
+import csv
+import hashlib
+import io
+import os
+import unicodedata
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import events, protected_media
+from .models import AuditLog, Loan, PayoutBatch, WithdrawalRequest
+
+ZERO = Decimal('0.00')
+RECORD_LENGTH = 94
+CSV_HEADER = ('withdrawal_id', 'loan_id', 'account_name', 'bank_name', 'account_number', 'amount')
+# Columns read per withdrawal when writing a file.
+ROW_FIELDS = (
+    'pk', 'loan_id', 'amount',
+    'user__bank_detail__account_name', 'user__bank_detail__bank_name', 'user__bank_detail__account_number',
+)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def default_chunk_size():
+    return getattr(settings, 'PAYOUT_CHUNK_SIZE', 5000)
+
+
+def claimable():
+    """Withdrawals a new batch may take."""
+    return WithdrawalRequest.objects.filter(
+        status='APPROVED', payout_batch__isnull=True, paid_at__isnull=True, user__bank_detail__isnull=False,
+    )
+
+
+def _digits(value):
+    return ''.join(ch for ch in value or '' if ch.isdigit())
+
+
+def _ascii(value):
+    """Bank files are plain ASCII: strip accents and anything else outside printable ASCII."""
+    text = unicodedata.normalize('NFKD', value or '').encode('ascii', 'ignore').decode()
+    return ''.join(ch for ch in text if ' ' <= ch <= '~')
+
+
+def _cents(amount):
+    return int((amount * 100).to_integral_value())
+
+
+def _csv_cell(value):
+    # Finance opens these in spreadsheets: never let a name start a formula.
+    value = str(value)
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def _field(value, width, align='<', fill=' '):
+    return f'{str(value)[:width]:{fill}{align}{width}}'
+
+
+def create_batch(queryset=None, *, file_format='CSV', limit=None, created_by=None, chunk_size=None):
+    """Claim up to ``limit`` withdrawals (all claimable ones by default) into a new batch.
+
+    ``queryset`` narrows the candidates (e.g. an admin selection). Returns the batch, or
+    ``None`` when nothing could be claimed.
+    """
+    size = chunk_size or default_chunk_size()
+    candidates = claimable() if queryset is None else queryset & claimable()
+    batch = PayoutBatch.objects.create(file_format=file_format, created_by=created_by)
+    count = 0
+    total = ZERO
+    last_pk = 0
+    while limit is None or count < limit:
+        take = size if limit is None else min(size, limit - count)
+        with transaction.atomic():
+            rows = list(
+                candidates.select_for_update(skip_locked=True, of=('self',))
+                .filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'amount')[:take]
+            )
+            if not rows:
+                break
+            ids = [pk for pk, _ in rows]
+            # payout_batch__isnull guards databases without row locks (SQLite serializes writers instead).
+            claimed = WithdrawalRequest.objects.filter(pk__in=ids, payout_batch__isnull=True).update(payout_batch=batch)
+            if claimed != len(ids):
+                # Lost a race on a lock-less backend: count what this batch really holds.
+                rows = list(WithdrawalRequest.objects.filter(pk__in=ids, payout_batch=batch).values_list('pk', 'amount'))
+        last_pk = ids[-1]
+        count += len(rows)
+        total += sum((amount for _, amount in rows), ZERO)
+    if not count:
+        batch.delete()
+        return None
+    batch.withdrawal_count = count
+    batch.total_amount = total
+    batch.save(update_fields=['withdrawal_count', 'total_amount'])
+    return batch
+
+
+def iter_rows(batch, chunk_size=None):
+    """The batch's withdrawals as ``ROW_FIELDS`` tuples, in id order, ``chunk_size`` per query."""
+    size = chunk_size or default_chunk_size()
+    rows = WithdrawalRequest.objects.filter(payout_batch=batch).order_by('pk').values_list(*ROW_FIELDS)
+    last_pk = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_pk)[:size])
+        if not chunk:
+            return
+        yield from chunk
+        last_pk = chunk[-1][0]
+
+
+class _Totals:
+    def __init__(self):
+        self.count = 0
+        self.cents = 0
+        self.entry_hash = 0
+
+    def add(self, amount, account_number):
+        self.count += 1
+        self.cents += _cents(amount)
+        self.entry_hash = (self.entry_hash + int(_digits(account_number)[-10:] or 0)) % 10**10
+
+
+def iter_csv(batch, rows, totals):
+    """CSV file chunks (one per row, plus header and trailer)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+
+    def take():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(CSV_HEADER)
+    yield take()
+    for pk, loan_id, amount, account_name, bank_name, account_number in rows:
+        totals.add(amount, account_number)
+        writer.writerow((pk, loan_id, _csv_cell(account_name), _csv_cell(bank_name), _csv_cell(account_number), amount))
+        yield take()
+    writer.writerow(('TRAILER', batch.pk, totals.count, f'{Decimal(totals.cents) / 100:.2f}', f'{totals.entry_hash:010d}'))
+    yield take()
+
+
+def iter_fixed_width(batch, rows, totals):
+    """Fixed-width file chunks: 94-character records terminated by CRLF."""
+    created = timezone.localtime(batch.created_at).strftime('%Y%m%d')
+    header = '1' + _field(batch.pk, 10, '>', '0') + created + _field(_ascii(settings.PAYOUT_ORIGINATOR_NAME).upper(), 23)
+    yield _field(header, RECORD_LENGTH) + '\r\n'
+    for pk, loan_id, amount, account_name, bank_name, account_number in rows:
+        totals.add(amount, account_number)
+        yield _field(
+            '6'
+            + _field(totals.count, 8, '>', '0')
+            + _field(_digits(account_number), 20)
+            + _field(_ascii(account_name).upper(), 35)
+            + _field(_cents(amount), 12, '>', '0')
+            + _field(pk, 12, '>', '0'),
+            RECORD_LENGTH,
+        ) + '\r\n'
+    trailer = '9' + _field(totals.count, 8, '>', '0') + _field(totals.cents, 14, '>', '0') + f'{totals.entry_hash:010d}'
+    yield _field(trailer, RECORD_LENGTH) + '\r\n'
+
+
+# Writer, file extension and encoding per format (fixed-width records are ASCII already).
+WRITERS = {'CSV': (iter_csv, '.csv', 'utf-8'), 'FIXED': (iter_fixed_width, '.txt', 'ascii')}
+
+
+def iter_file(batch, totals=None, chunk_size=None):
+    """The batch file as a stream of ``str`` chunks."""
+    writer = WRITERS[batch.file_format][0]
+    return writer(batch, iter_rows(batch, chunk_size), totals if totals is not None else _Totals())
+
+
+def file_name(batch):
+    return f'payouts/payout-batch-{batch.pk}{WRITERS[batch.file_format][1]}'
+
+
+def generate_file(batch, chunk_size=None):
+    """Write the batch file under MEDIA_ROOT and record its checksums; returns the batch."""
+    if batch.status not in ('OPEN', 'GENERATED'):
+        raise ValueError(f'Batch {batch.pk} is {batch.status}; only open batches get a file.')
+    name = file_name(batch)
+    target = protected_media.media_root() / name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + '.tmp')
+    digest = hashlib.sha256()
+    encoding = WRITERS[batch.file_format][2]
+    totals = _Totals()
+    with open(tmp, 'wb') as f:
+        for chunk in iter_file(batch, totals, chunk_size):
+            data = chunk.encode(encoding)
+            digest.update(data)
+            f.write(data)
+    os.replace(tmp, target)
+    if totals.count != batch.withdrawal_count or Decimal(totals.cents) / 100 != batch.total_amount:
+        raise ValueError(
+            f'Batch {batch.pk} file has {totals.count} entries / {Decimal(totals.cents) / 100}, '
+            f'expected {batch.withdrawal_count} / {batch.total_amount}.'
+        )
+    batch.file.name = name
+    batch.file_sha256 = digest.hexdigest()
+    batch.entry_hash = f'{totals.entry_hash:010d}'
+    batch.status = 'GENERATED'
+    batch.generated_at = timezone.now()
+    batch.save(update_fields=['file', 'file_sha256', 'entry_hash', 'status', 'generated_at'])
+    return batch
+
+
+def mark_paid(batch, admin=None, chunk_size=None):
+    """Confirm the bank executed the file; returns the number of withdrawals stamped.
+
+    Works through the batch in id-ordered chunks, one transaction each: a set-based UPDATE of
+    ``paid_at``, a version bump on the affected loans (status API ETags), one ``AuditLog`` row
+    per withdrawal and a live event per borrower. An interrupted run is resumed by calling it
+    again; the batch turns ``PAID`` once every row is stamped.
+    """
+    if batch.status != 'GENERATED':
+        raise ValueError(f'Batch {batch.pk} is {batch.status}; only generated batches can be marked paid.')
+    size = chunk_size or default_chunk_size()
+    now = timezone.now()
+    unpaid = WithdrawalRequest.objects.filter(payout_batch=batch, paid_at__isnull=True).order_by('pk')
+    updated = 0
+    while True:
+        with transaction.atomic():
+            rows = list(unpaid.select_for_update().values_list('pk', 'user_id', 'loan_id')[:size])
+            if not rows:
+                break
+            ids = [pk for pk, _, _ in rows]
+            # Status and amount are unchanged, so portfolio summaries need no deltas.
+            updated += WithdrawalRequest.objects.filter(pk__in=ids).update(paid_at=now)
+            Loan.objects.filter(pk__in={loan_id for _, _, loan_id in rows}).update(version=F('version') + 1)
+            AuditLog.objects.bulk_create([
+                AuditLog(
+                    admin=admin,
+                    action='WITHDRAWAL_PAID',
+                    entity_type='WithdrawalRequest',
+                    entity_id=pk,
+                    details={'payout_batch': batch.pk},
+                )
+                for pk in ids
+            ], batch_size=1000)
+            events.publish_many(
+                events.withdrawal_message(user_id, pk, loan_id, 'PAID', 'APPROVED') for pk, user_id, loan_id in rows
+            )
+    batch.status = 'PAID'
+    batch.paid_at = now
+    batch.save(update_fields=['status', 'paid_at'])
+    return updated
+
+
+def cancel(batch):
+    """Abandon a batch that was not paid; its withdrawals become claimable again."""
+    with transaction.atomic():
+        batch = PayoutBatch.objects.select_for_update().get(pk=batch.pk)
+        if batch.status == 'PAID' or batch.withdrawals.filter(paid_at__isnull=False).exists():
+            raise ValueError(f'Batch {batch.pk} is (partly) paid and cannot be cancelled.')
+        released = batch.withdrawals.update(payout_batch=None)
+        batch.status = 'CANCELLED'
+        batch.save(update_fields=['status'])
+    return released
@@ -0,0 +1,205 @@
+"""On-demand request profiling.
+
+Staff can profile a single request by sending ``X-Profile: 1`` or adding
+``?_profile=1``; ``PROFILER_SAMPLE_RATE`` additionally profiles a random
+fraction of all traffic. The view (including deferred TemplateResponse
+rendering, which is where admin changelists run their queries) executes
+under cProfile, and the marshalled stats are stored gzip-compressed in
+``PROFILER_DIR`` alongside a ``ProfileDump`` row holding the URL name and
+query log. Dumps are browsable from the admin and evicted least-recently
+accessed first once ``PROFILER_MAX_BYTES`` is exceeded.
+"""
+import asyncio
+import cProfile
+import gzip
+import io
+import logging
+import marshal
+import os
+import pstats
+import random
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ProfileDump
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_QUERY_PARAM = '_profile'
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILER_DIR', Path(settings.BASE_DIR) / 'var' / 'profiles'))
+
+
+def profile_trigger(request):
+    """Return the ProfileDump trigger for this request, or None to skip profiling."""
+    if not getattr(settings, 'PROFILER_ENABLED', True):
+        return None
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        if request.META.get(PROFILE_HEADER) == '1' or request.GET.get(PROFILE_QUERY_PARAM) == '1':
+            return 'STAFF'
+    rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0.0)
+    if rate > 0 and random.random() < rate:
+        return 'SAMPLE'
+    return None
+
+
+class QueryLog:
+    """execute_wrapper that keeps the first ``limit`` statements with their timings."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.count = 0
+        self.entries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            if len(self.entries) < self.limit:
+                self.entries.append((time.perf_counter() - start, sql))
+
+    def render(self):
+        lines = [f'{seconds * 1000:8.2f} ms  {sql}' for seconds, sql in self.entries]
+        if self.count > len(self.entries):
+            lines.append(f'... {self.count - len(self.entries)} more queries not logged')
+        return '\n'.join(lines)
+
+
+def save_dump(request, profiler, queries, response, duration, trigger):
+    profiler.create_stats()
+    data = gzip.compress(marshal.dumps(profiler.stats))
+
+    match = getattr(request, 'resolver_match', None)
+    url_name = (match.view_name if match else '') or ''
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    safe_name = ''.join(c if c.isalnum() else '-' for c in url_name) or 'unnamed'
+    file_name = f"{timezone.now():%Y%m%d-%H%M%S}-{safe_name}-{uuid.uuid4().hex[:8]}.prof.gz"
+    (directory / file_name).write_bytes(data)
+
+    user = getattr(request, 'user', None)
+    dump = ProfileDump.objects.create(
+        user=user if user is not None and user.is_authenticated else None,
+        url_name=url_name[:200],
+        path=request.get_full_path()[:500],
+        method=request.method,
+        status_code=getattr(response, 'status_code', None),
+        duration_ms=duration * 1000,
+        query_count=queries.count,
+        query_log=queries.render(),
+        trigger=trigger,
+        file_name=file_name,
+        size_bytes=len(data),
+    )
+    enforce_quota(keep=dump.pk)
+    return dump
+
+
+def enforce_quota(keep=None):
+    """Evict least-recently-accessed dumps until the total fits PROFILER_MAX_BYTES.
+
+    ``keep`` protects the dump that was just written from its own eviction pass.
+    """
+    quota = getattr(settings, 'PROFILER_MAX_BYTES', 200 * 1024 * 1024)
+    total = ProfileDump.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+    if total <= quota:
+        return
+    for dump in ProfileDump.objects.exclude(pk=keep).order_by('last_accessed', 'id').iterator():
+        if total <= quota:
+            break
+        total -= dump.size_bytes
+        dump.delete()
+
+
+def dump_path(dump):
+    return profile_dir() / dump.file_name
+
+
+def delete_dump_file(dump):
+    try:
+        os.remove(dump_path(dump))
+    except FileNotFoundError:
+        pass
+
+
+def touch(dump):
+    ProfileDump.objects.filter(pk=dump.pk).update(last_accessed=timezone.now())
+
+
+def load_stats(dump):
+    with gzip.open(dump_path(dump), 'rb') as f:
+        raw = marshal.load(f)
+    stats = pstats.Stats(stream=io.StringIO())
+    stats.stats = raw
+    stats.get_top_level_stats()
+    return stats
+
+
+def top_functions(dump, limit=40, sort='cumulative'):
+    """Render the ``pstats`` table of the hottest functions in a dump."""
+    stats = load_stats(dump)
+    stats.sort_stats(sort).print_stats(limit)
+    return stats.stream.getvalue()
+
+
+class ProfilerMiddleware:
+    """Run the view under cProfile when ``profile_trigger`` asks for it.
+
+    Must be last in MIDDLEWARE: returning the response from process_view skips
+    the process_view hooks of any middleware listed after it (CSRF included).
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if asyncio.iscoroutinefunction(view_func):
+            return None
+        trigger = profile_trigger(request)
+        if trigger is None:
+            return None
+        if PROFILE_QUERY_PARAM in request.GET:
+            # Views such as the admin changelist reject unknown query parameters.
+            request.GET = request.GET.copy()
+            del request.GET[PROFILE_QUERY_PARAM]
+
+        queries = QueryLog(getattr(settings, 'PROFILER_MAX_QUERIES', 500))
+        profiler = cProfile.Profile()
+        response = None
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(queries))
+                profiler.enable()
+                try:
+                    response = view_func(request, *view_args, **view_kwargs)
+                    if hasattr(response, 'render') and callable(response.render):
+                        response = response.render()
+                finally:
+                    profiler.disable()
+        finally:
+            duration = time.perf_counter() - start
+            try:
+                dump = save_dump(request, profiler, queries, response, duration, trigger)
+            except Exception:
+                logger.exception('Failed to store profile for %s', request.path)
+            else:
+                if response is not None and trigger == 'STAFF':
+                    response['X-Profile-Id'] = str(dump.pk)
+        return response
@@ -0,0 +1,120 @@
+"""Serving private files (signatures, agreement artifacts) after a permission check.
+
+Views authorize the request and call ``serve(request, path)``; the bytes are
+then sent by whatever sits in front of Django, selected by
+``PROTECTED_MEDIA_SERVER``:
+
+* ``'nginx'``: empty response with ``X-Accel-Redirect:
+  <PROTECTED_MEDIA_INTERNAL_URL><path relative to MEDIA_ROOT>``; nginx needs
+  an ``internal`` location aliasing MEDIA_ROOT (see README);
+* ``'sendfile'``: empty response with ``X-Sendfile: <absolute path>``
+  (Apache mod_xsendfile, lighttpd, Caddy);
+* ``''`` (default): a ``FileResponse``. Under WSGI, gunicorn's
+  ``wsgi.file_wrapper`` sends it with ``sendfile(2)``; the ASGI workers used
+  in production read it through Python in chunks, so prefer ``'nginx'`` there.
+
+``ProtectedMediaEmulationMiddleware`` stands in for nginx when running
+without one (DEBUG, tests). It checks that offload responses are well formed
+and serves the file they point at, and it returns 404 for direct requests to
+the internal URL, as an ``internal`` location would.
+"""
+import mimetypes
+import os
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, Http404, HttpResponse
+
+SERVERS = ('', 'nginx', 'sendfile')
+
+
+def media_root():
+    return Path(settings.MEDIA_ROOT).resolve()
+
+
+def internal_url():
+    return getattr(settings, 'PROTECTED_MEDIA_INTERNAL_URL', '/protected-media/')
+
+
+def server():
+    value = getattr(settings, 'PROTECTED_MEDIA_SERVER', '')
+    if value not in SERVERS:
+        raise ImproperlyConfigured(f'PROTECTED_MEDIA_SERVER must be one of {SERVERS!r}, not {value!r}.')
+    return value
+
+
+def resolve(path):
+    """Absolute path of a file under MEDIA_ROOT; Http404 for missing files or paths escaping it."""
+    root = media_root()
+    full = (root / path).resolve()
+    if not full.is_relative_to(root) or not full.is_file():
+        raise Http404('File not found.')
+    return full
+
+
+def _disposition(filename, as_attachment):
+    kind = 'attachment' if as_attachment else 'inline'
+    if not filename:
+        return kind
+    return f"{kind}; filename*=UTF-8''{quote(filename)}"
+
+
+def serve(request, path, *, filename=None, as_attachment=False, content_type=None):
+    """Response delivering the MEDIA_ROOT-relative file ``path``; authorize before calling this."""
+    full = resolve(path)
+    content_type = content_type or mimetypes.guess_type(full.name)[0] or 'application/octet-stream'
+    mode = server()
+    if mode == '':
+        response = FileResponse(open(full, 'rb'), as_attachment=as_attachment, filename=filename or '', content_type=content_type)
+    else:
+        response = HttpResponse(content_type=content_type)
+        if mode == 'nginx':
+            response['X-Accel-Redirect'] = internal_url() + quote(full.relative_to(media_root()).as_posix())
+        else:
+            response['X-Sendfile'] = str(full)
+        if filename or as_attachment:
+            response['Content-Disposition'] = _disposition(filename, as_attachment)
+    # Per-user content: never cache it in shared caches.
+    response['Cache-Control'] = 'private, max-age=3600'
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def serve_field_file(request, field_file, **kwargs):
+    if not field_file:
+        raise Http404('No file.')
+    return serve(request, field_file.name, **kwargs)
+
+
+class ProtectedMediaEmulationMiddleware:
+    """Do what the front server would with offload headers (for DEBUG and tests)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path.startswith(internal_url()):
+            raise Http404('Internal location.')
+        response = self.get_response(request)
+        if 'X-Accel-Redirect' in response:
+            location = response['X-Accel-Redirect']
+            if not location.startswith(internal_url()):
+                raise ImproperlyConfigured(f'X-Accel-Redirect {location!r} is outside {internal_url()!r}.')
+            full = resolve(unquote(location[len(internal_url()):]))
+        elif 'X-Sendfile' in response:
+            full = Path(response['X-Sendfile'])
+            if not full.is_absolute():
+                raise ImproperlyConfigured(f'X-Sendfile {full!s} is not an absolute path.')
+            full = resolve(full)
+        else:
+            return response
+        if response.content:
+            raise ImproperlyConfigured('Offload responses must have an empty body.')
+        served = FileResponse(open(full, 'rb'), content_type=response['Content-Type'])
+        for header in ('Content-Disposition', 'Cache-Control', 'X-Content-Type-Options'):
+            if header in response:
+                served[header] = response[header]
+        served['X-Protected-Media-Emulated'] = os.path.basename(full)
+        return served
@@ -0,0 +1,197 @@
+"""Read-replica routing with read-your-writes stickiness.
+
+With ``DATABASE_REPLICA_URL`` set, ``DATABASES['replica']`` is a read-only
+copy of ``default`` and ``ReplicaRouter`` is installed. Nothing reads from it
+implicitly:
+
+* only code inside ``replica_reads()`` (the ``@replica_reads_view`` views:
+  dashboards, status API, reports; admin changelists via
+  ``ReplicaChangelistMixin``) reads from the replica, and only for GET/HEAD;
+* any write routed during a request (``db_for_write``) switches the rest of
+  the request to the primary, and ``ReplicaPinningMiddleware`` then sets a
+  cookie that keeps that client's reads on the primary for
+  ``REPLICA_PIN_SECONDS``, so a borrower who just asked for a withdrawal
+  never sees the page from before it;
+* a view that finds the replica older than what the client has already
+  seen (e.g. the dashboard reloading for a pushed status change) calls
+  ``read_primary()`` to move the rest of the request to the primary;
+* reads inside a transaction on ``default`` stay on it;
+* the replica is skipped while its replay lag exceeds
+  ``REPLICA_MAX_LAG_SECONDS`` (checked at most every
+  ``REPLICA_LAG_CHECK_SECONDS`` per process on PostgreSQL).
+
+Keep ``REPLICA_PIN_SECONDS`` above ``REPLICA_MAX_LAG_SECONDS``: a pinned
+client then only returns to the replica once it has replayed the write.
+Locally, point ``DATABASE_REPLICA_URL`` at the same database as
+``DATABASE_URL`` to exercise the routing with two aliases; tests mirror the
+replica onto ``default`` (``TEST['MIRROR']``).
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+PIN_COOKIE = 'db_pin'
+SAFE_METHODS = ('GET', 'HEAD')
+# DatabaseCache's table: claims and throttle buckets are read back at once, so never from a replica.
+CACHE_APP_LABEL = 'django_cache'
+
+
+class RequestRouting:
+    """Routing state of one request: may it use the replica, and has it written?"""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica = False
+        self.wrote = False
+
+
+_routing = contextvars.ContextVar('db_routing', default=None)
+_health = {'checked': float('-inf'), 'ok': False}
+
+
+def configured():
+    return REPLICA in connections.databases
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+
+def replica_lag():
+    """Seconds the replica is behind the primary (0 when caught up or not replicating)."""
+    if connections[REPLICA].vendor != 'postgresql':
+        return 0.0
+    with connections[REPLICA].cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+def replica_healthy():
+    now = time.monotonic()
+    if now - _health['checked'] < getattr(settings, 'REPLICA_LAG_CHECK_SECONDS', 5):
+        return _health['ok']
+    try:
+        lag = replica_lag()
+        ok = lag <= getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 5)
+        if not ok:
+            logger.warning('Replica is %.1fs behind; reading from the primary', lag)
+    except DatabaseError:
+        logger.exception('Replica lag check failed; reading from the primary')
+        ok = False
+    _health.update(checked=now, ok=ok)
+    return ok
+
+
+@contextmanager
+def replica_reads():
+    """Let reads in this block go to the replica (unless the client is pinned or has written)."""
+    state = _routing.get()
+    token = None
+    if state is None:
+        state = RequestRouting()
+        token = _routing.set(state)
+    previous = state.replica
+    state.replica = True
+    try:
+        yield
+    finally:
+        state.replica = previous
+        if token is not None:
+            _routing.reset(token)
+
+
+def read_primary():
+    """Send the rest of this request's reads to the primary (the replica is behind the client)."""
+    state = _routing.get()
+    if state is not None:
+        state.pinned = True
+
+
+def replica_reads_view(view):
+    """View decorator: GET/HEAD requests read from the replica."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            response = view(request, *args, **kwargs)
+            # TemplateResponse querysets are evaluated when rendering: do it while routed.
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (
+            state is None
+            or model._meta.app_label == CACHE_APP_LABEL
+            or not state.replica
+            or state.pinned
+            or state.wrote
+            or not configured()
+            or connections[PRIMARY].in_atomic_block
+            or not replica_healthy()
+        ):
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None and model._meta.app_label != CACHE_APP_LABEL:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+class ReplicaPinningMiddleware:
+    """Track writes per request and pin the client to the primary for a while after one."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        state = RequestRouting(pinned=pinned_until > time.time())
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        if state.wrote and configured():
+            seconds = pin_seconds()
+            response.set_cookie(
+                PIN_COOKIE, f'{time.time() + seconds:.0f}', max_age=seconds,
+                httponly=True, samesite='Lax', secure=request.is_secure(),
+            )
+        return response
+
+
+class ReplicaChangelistMixin:
+    """ModelAdmin mixin: changelist pages (GET) read from the replica."""
+
+    def changelist_view(self, request, extra_context=None):
+        return replica_reads_view(super().changelist_view)(request, extra_context)
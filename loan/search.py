@@ -0,0 +1,216 @@
+"""Admin search for borrowers, loans and withdrawals.
+
+One box takes an email, a phone number, a name, a loan id or the last four
+digits of a bank account. The term is classified first and each class uses
+a lookup an index can answer, never a ``%term%`` scan over every column:
+
+* email (contains ``@``): prefix match on the stored lowercase email;
+* digits (``+``, spaces, dashes allowed): E.164 phone prefix (as typed,
+  and with ``PHONE_DEFAULT_COUNTRY_CODE`` for national numbers; from
+  ``MIN_PHONE_DIGITS`` digits or a leading ``+``), exact loan/row id, and
+  exact ``BankDetail.account_last4`` for four digits;
+* anything else is a name: every word must start a word of ``full_name``
+  (SQLite, FTS5 table ``loan_user_search`` with prefix indexes) or appear
+  in it (PostgreSQL, ``pg_trgm`` GIN index on ``UPPER(full_name)``, which
+  is what ``icontains`` compiles to). A single word is also tried as an
+  email prefix.
+
+Prefixes use ``startswith`` on PostgreSQL (Django's ``varchar_pattern_ops``
+``_like`` indexes on unique/indexed columns serve it) and a ``>=``/``<``
+range on SQLite, whose ``LIKE`` is case-insensitive and skips BINARY
+indexes. The indexes come from migration 0019, which keeps a frozen copy of
+the SQL below; databases without FTS5 fall back to ``icontains`` on names.
+
+Matches resolve to user ids first (``matching_users``), so each admin only
+adds ``user_id IN (...)`` and results never need ``DISTINCT``.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from . import identity
+
+FTS_TABLE = 'loan_user_search'
+MAX_ID = 2 ** 63 - 1
+MIN_PHONE_DIGITS = 5
+PHONE_LIKE = re.compile(r'^\+?[\d\s().-]+$')
+SEARCH_HELP = 'Email, phone, name, loan id or last 4 digits of the bank account.'
+
+FTS_TRIGGERS = ('loan_user_search_ai', 'loan_user_search_ad', 'loan_user_search_au')
+
+SQLITE_INSTALL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "full_name, content='loan_user', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS loan_user_search_ai AFTER INSERT ON loan_user BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, full_name) VALUES (new.id, new.full_name); END",
+    f"CREATE TRIGGER IF NOT EXISTS loan_user_search_ad AFTER DELETE ON loan_user BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, full_name) VALUES ('delete', old.id, old.full_name); END",
+    f"CREATE TRIGGER IF NOT EXISTS loan_user_search_au AFTER UPDATE OF full_name ON loan_user BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, full_name) VALUES ('delete', old.id, old.full_name); "
+    f"INSERT INTO {FTS_TABLE}(rowid, full_name) VALUES (new.id, new.full_name); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_DROP = [*(f'DROP TRIGGER IF EXISTS {name}' for name in FTS_TRIGGERS), f'DROP TABLE IF EXISTS {FTS_TABLE}']
+POSTGRES_INSTALL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS loan_user_full_name_trgm ON loan_user USING gin (UPPER(full_name::text) gin_trgm_ops)',
+]
+POSTGRES_DROP = ['DROP INDEX IF EXISTS loan_user_full_name_trgm']
+
+_fts_available = {}
+
+
+def install_indexes(schema_editor):
+    """Create the name search index for this database, as migration 0019 did; rerunning is harmless."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_INSTALL
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('PRAGMA compile_options')
+            if 'ENABLE_FTS5' not in {row[0] for row in cursor.fetchall()}:
+                return
+        statements = SQLITE_INSTALL
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+    _fts_available.clear()
+
+
+def drop_indexes(schema_editor):
+    vendor = schema_editor.connection.vendor
+    for sql in {'postgresql': POSTGRES_DROP, 'sqlite': SQLITE_DROP}.get(vendor, []):
+        schema_editor.execute(sql)
+    _fts_available.clear()
+
+
+def fts_available(using=DEFAULT_DB_ALIAS):
+    """Whether the FTS5 table and its sync triggers exist.
+
+    SQLite migrations that rebuild ``loan_user`` drop its triggers; names are then
+    searched with ``icontains`` until ``install_indexes`` runs again
+    (``with connection.schema_editor() as editor: install_indexes(editor)``).
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    if using not in _fts_available:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE (type = 'table' AND name = %s) OR (type = 'trigger' AND name IN (%s, %s, %s))",
+                (FTS_TABLE, *FTS_TRIGGERS),
+            )
+            _fts_available[using] = cursor.fetchone()[0] == 1 + len(FTS_TRIGGERS)
+    return _fts_available[using]
+
+
+def prefix_q(field, prefix, using=DEFAULT_DB_ALIAS):
+    if connections[using].vendor == 'sqlite':
+        # BINARY-collated range: the column's own index, exact-case like the stored values.
+        return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'})
+    return Q(**{f'{field}__startswith': prefix})
+
+
+def fts_query(words):
+    """FTS5 MATCH string: every word as a quoted prefix token."""
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def phone_prefixes(term):
+    digits = ''.join(ch for ch in term if ch.isdigit())
+    if len(digits) < MIN_PHONE_DIGITS and not term.lstrip().startswith('+'):
+        # Short numbers are ids or account digits; as phone prefixes they match whole countries.
+        return []
+    if term.lstrip().startswith('+'):
+        return ['+' + digits]
+    if digits.startswith('00'):
+        return ['+' + digits[2:]]
+    national = digits[1:] if digits.startswith('0') else digits
+    return list(dict.fromkeys(['+' + identity.default_country_code() + national, '+' + digits]))
+
+
+def name_q(words, using=DEFAULT_DB_ALIAS):
+    if fts_available(using):
+        return Q(pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (fts_query(words),)))
+    q = Q()
+    for word in words:
+        q &= Q(full_name__icontains=word)
+    return q
+
+
+def user_q(term, using=DEFAULT_DB_ALIAS, *, loan_owners=False):
+    """Q over ``User`` for ``term``, or ``None`` when the term is empty.
+
+    ``loan_owners`` also matches the borrower of the loan whose id is ``term``
+    (for admins listing users rather than loans).
+    """
+    from .models import BankDetail, Loan
+
+    term = term.strip()
+    if not term:
+        return None
+    if '@' in term:
+        return prefix_q('email', identity.normalize_email(term), using)
+    if PHONE_LIKE.match(term):
+        q = Q(pk__in=[])  # matches nothing until a lookup applies
+        for prefix in phone_prefixes(term):
+            q |= prefix_q('phone', prefix, using)
+        digits = ''.join(ch for ch in term if ch.isdigit())
+        if len(digits) == 4:
+            q |= Q(pk__in=BankDetail.objects.filter(account_last4=digits).values('user_id'))
+        if loan_owners and as_id(term) is not None:
+            q |= Q(pk__in=Loan.objects.filter(pk=as_id(term)).values('user_id'))
+        return q
+    words = term.split()
+    q = name_q(words, using)
+    if len(words) == 1:
+        # One word may also be the start of an email address.
+        q |= prefix_q('email', identity.normalize_email(term), using)
+    return q
+
+
+def matching_users(term, using=DEFAULT_DB_ALIAS, **kwargs):
+    """``values('pk')`` queryset of the users matching ``term`` (for ``__in``)."""
+    q = user_q(term, using, **kwargs)
+    if q is None:
+        return None
+    return identity.users().using(using).filter(q).values('pk')
+
+
+def as_id(term):
+    """``term`` as a row id, or ``None`` when it is not one."""
+    term = term.strip()
+    return int(term) if term.isdigit() and int(term) <= MAX_ID else None
+
+
+class BorrowerSearchMixin:
+    """ModelAdmin mixin: indexed borrower search (see module docstring).
+
+    ``search_user_field`` is the path to the borrower's user id (``'pk'`` on
+    ``User``); ``search_id_fields`` are matched exactly when the term is a
+    number (e.g. ``('pk', 'loan_id')``); ``search_loan_owners`` makes a
+    number also find the borrower of that loan, for admins without loan ids.
+    ``search_fields`` only turns the search box on and lists what is covered;
+    Django's own ``icontains`` search over it is never run.
+    """
+
+    search_user_field = 'user_id'
+    search_id_fields = ()
+    search_loan_owners = False
+    search_help_text = SEARCH_HELP
+    # Counting the unfiltered table next to every search result costs more than the search.
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        users = matching_users(search_term, queryset.db, loan_owners=self.search_loan_owners)
+        if users is None:
+            return queryset, False
+        q = Q(**{f'{self.search_user_field}__in': users})
+        row_id = as_id(search_term)
+        if row_id is not None:
+            for field in self.search_id_fields:
+                q |= Q(**{field: row_id})
+        return queryset.filter(q), False
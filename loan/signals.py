@@ -0,0 +1,90 @@
+from django.db.models import F
+from django.db.models.expressions import Combinable
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import audit, events, summaries
+from .models import Loan, ProfileDump, WithdrawalRequest
+from .profiling import delete_dump_file
+
+
+@receiver(post_delete, sender=ProfileDump)
+def remove_profile_dump_file(sender, instance, **kwargs):
+    delete_dump_file(instance)
+
+
+# Portfolio summaries (loan/summaries.py) follow every loan and withdrawal write.
+@receiver(pre_save, sender=Loan)
+@receiver(pre_save, sender=WithdrawalRequest)
+@receiver(pre_delete, sender=Loan)
+@receiver(pre_delete, sender=WithdrawalRequest)
+def load_summary_contribution(sender, instance, raw=False, **kwargs):
+    if not raw:
+        summaries.prepare(instance)
+
+
+@receiver(post_save, sender=Loan)
+@receiver(post_save, sender=WithdrawalRequest)
+def update_summary_on_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        summaries.record_save(instance, created)
+
+
+@receiver(post_delete, sender=Loan)
+@receiver(post_delete, sender=WithdrawalRequest)
+def update_summary_on_delete(sender, instance, **kwargs):
+    summaries.record_delete(instance)
+
+
+# Loan.version (the ETag of the borrower status API) moves on every write to a loan or its
+# withdrawals. Set-based updates of loans must bump it themselves (version=F('version') + 1).
+@receiver(pre_save, sender=Loan)
+def bump_loan_version(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Loan.save() adds 'version' to update_fields, so partial saves bump it too.
+    if not raw and not instance._state.adding and (update_fields is None or 'version' in update_fields):
+        instance.version = F('version') + 1
+
+
+@receiver(post_save, sender=Loan)
+def reload_loan_version(sender, instance, **kwargs):
+    # Drop the expression; the new value is read from the row on next access.
+    if isinstance(instance.__dict__.get('version'), Combinable):
+        del instance.__dict__['version']
+
+
+@receiver(post_save, sender=WithdrawalRequest)
+@receiver(post_delete, sender=WithdrawalRequest)
+def bump_loan_version_for_withdrawal(sender, instance, raw=False, **kwargs):
+    if not raw and instance.loan_id:
+        Loan.objects.filter(pk=instance.loan_id).update(version=F('version') + 1)
+
+
+# Status changes are pushed to the borrower's open event streams (loan/events.py).
+# Reads the stored status captured by load_summary_contribution above.
+@receiver(post_save, sender=Loan)
+@receiver(post_save, sender=WithdrawalRequest)
+def publish_status_change(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_summary_previous', None)
+    previous_status = None if created or previous is None else previous[1]
+    if previous_status == instance.status and not created:
+        return
+    if sender is Loan:
+        events.publish_many([events.loan_message(instance.user_id, instance.pk, instance.status, previous_status)])
+    else:
+        events.publish_many([events.withdrawal_message(
+            instance.user_id, instance.pk, instance.loan_id, instance.status, previous_status)])
+
+
+# Field-level audit trail (loan/audit.py) for every AuditedModel subclass.
+@receiver(post_save)
+def audit_save(sender, instance, created, raw=False, **kwargs):
+    if not raw and isinstance(instance, audit.AuditedModel):
+        audit.record_save(instance, created)
+
+
+@receiver(post_delete)
+def audit_delete(sender, instance, **kwargs):
+    if isinstance(instance, audit.AuditedModel):
+        audit.record_delete(instance)
@@ -0,0 +1,92 @@
+"""Content-addressed file storage for signature images.
+
+``ContentAddressedStorage`` ignores the uploaded file name and stores the
+bytes under their SHA-256 digest, sharded two directory levels deep::
+
+    agreements/signatures/3f/a9/3fa9...c2.png
+
+The ``upload_to`` prefix and the original extension are kept. With 65,536
+leaf directories a million signatures leave ~15 files per directory, so
+lookups and backups do not degrade the way one flat directory does, and an
+identical image (a re-sign with the same drawing) is stored once.
+
+Because files are shared, deleting one is only safe when no row references
+it any more; nothing in the project deletes signature files implicitly.
+``migrate_signature_storage`` moves files saved under the old flat names.
+"""
+import hashlib
+import os
+import re
+import uuid
+from pathlib import PurePosixPath
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+HASHED_NAME_RE = re.compile(r'(?:^|/)(?:[0-9a-f]{2}/){2}[0-9a-f]{64}(?:\.\w+)?$')
+
+
+def content_hash(content):
+    """SHA-256 hex digest of a ``File``, read in chunks; leaves it rewound."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    """``<dir of name>/ab/cd/<digest><ext>`` for an upload called ``name``."""
+    path = PurePosixPath(name)
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)]
+    return str(path.parent.joinpath(*shards, digest + path.suffix.lower()))
+
+
+def is_hashed(name):
+    return bool(name) and bool(HASHED_NAME_RE.search(name))
+
+
+@deconstructible(path='loan.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by content hash and never stores the same bytes twice."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return super().save(hashed_name(name, content_hash(content)), content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # The name is derived from the content: an existing file already holds these bytes.
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        # Write to a private name and rename: concurrent writers of the same digest
+        # write identical bytes, so whichever rename lands last is equally correct.
+        tmp_path = f'{full_path}.{uuid.uuid4().hex}.tmp'
+        if hasattr(content, 'temporary_file_path'):
+            file_move_safe(content.temporary_file_path(), tmp_path)
+        else:
+            with open(tmp_path, 'wb') as out:
+                for chunk in content.chunks():
+                    out.write(chunk)
+        if self.file_permissions_mode is not None:
+            os.chmod(tmp_path, self.file_permissions_mode)
+        os.replace(tmp_path, full_path)
+        return name
+
+
+def signature_storage():
+    return ContentAddressedStorage()
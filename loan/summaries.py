@@ -0,0 +1,256 @@
+"""Incrementally maintained portfolio summaries.
+
+``DailySummary`` holds one row per (day, kind, status): the count and money
+totals of the loans or withdrawals created that day that currently have that
+status. Rows are adjusted in place rather than recomputed:
+
+* saves and deletes of ``Loan``/``WithdrawalRequest`` (including the admin
+  approve/reject actions) go through signals in loan/signals.py: the stored
+  row is read before the write and the difference is applied after it;
+* set-based code that bypasses signals (``QuerySet.update``, ``bulk_create``)
+  must call ``apply_deltas`` with the contributions it removed and added;
+* ``rebuild`` recomputes everything with one GROUP BY per model
+  (``manage.py rebuild_portfolio_summaries``). Run it when writes are quiet:
+  saves that commit while it runs can be counted twice or not at all.
+
+``report`` reads only the summary table and is cached for
+``PORTFOLIO_REPORT_CACHE_SECONDS`` in the ``PORTFOLIO_REPORT_CACHE`` alias,
+so its cost does not grow with the loan and withdrawal tables. ``rebuild``
+clears it (``clear_report_cache``); for that to reach every worker the
+alias must be shared (prod.py uses the ``shared`` database cache).
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import DailySummary, Loan, WithdrawalRequest
+
+ZERO = Decimal('0.00')
+APPROVED_STATUSES = ('APPROVED', 'ACTIVE', 'CLOSED')
+REPORT_MONTHS = (3, 6, 12, 24)
+
+# kind, fields read for the contribution (created_at, status, amount[, approved amount])
+TRACKED = {
+    Loan: ('LOAN', ('created_at', 'status', 'requested_amount', 'approved_amount')),
+    WithdrawalRequest: ('WITHDRAWAL', ('created_at', 'status', 'amount')),
+}
+
+MISSING = object()  # snapshot of an instance with deferred fields
+
+
+def _day(created_at):
+    if timezone.is_aware(created_at):
+        return timezone.localdate(created_at)
+    return created_at.date()
+
+
+def contribution(kind, values):
+    """``(kind, day, status, amount, approved)`` for a snapshot tuple, or ``None``."""
+    if values is None or values[0] is None:
+        return None
+    created_at, status, amount = values[:3]
+    approved = values[3] if len(values) > 3 else None
+    return kind, _day(created_at), status, amount or ZERO, approved or ZERO
+
+
+def snapshot(instance):
+    """Current values of the tracked fields; ``MISSING`` when some are deferred."""
+    _, fields = TRACKED[type(instance)]
+    state = instance.__dict__
+    try:
+        return tuple(state[name] for name in fields)
+    except KeyError:
+        return MISSING
+
+
+def apply_deltas(deltas):
+    """Apply ``(kind, day, status, count, amount, approved)`` deltas to ``DailySummary``.
+
+    Deltas for the same row are merged first; rows are touched in key order
+    so concurrent writers lock them in the same order.
+    """
+    merged = defaultdict(lambda: [0, ZERO, ZERO])
+    for kind, day, status, count, amount, approved in deltas:
+        row = merged[(day, kind, status)]
+        row[0] += count
+        row[1] += amount
+        row[2] += approved
+    changes = sorted((key, value) for key, value in merged.items() if any(value))
+    if not changes:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        for (day, kind, status), (count, amount, approved) in changes:
+            rows = DailySummary.objects.filter(day=day, kind=kind, status=status)
+            updates = dict(
+                count=F('count') + count,
+                amount_total=F('amount_total') + amount,
+                approved_total=F('approved_total') + approved,
+                updated_at=now,
+            )
+            if rows.update(**updates):
+                continue
+            try:
+                with transaction.atomic():
+                    DailySummary.objects.create(
+                        day=day, kind=kind, status=status,
+                        count=count, amount_total=amount, approved_total=approved,
+                    )
+            except IntegrityError:
+                # Another writer inserted the row first.
+                rows.update(**updates)
+
+
+def diff(old, new):
+    """Deltas moving a record's contribution from ``old`` to ``new`` (either may be ``None``)."""
+    if old == new:
+        return []
+    deltas = []
+    if old is not None:
+        kind, day, status, amount, approved = old
+        deltas.append((kind, day, status, -1, -amount, -approved))
+    if new is not None:
+        kind, day, status, amount, approved = new
+        deltas.append((kind, day, status, 1, amount, approved))
+    return deltas
+
+
+def _load(instance):
+    if instance.pk is None:
+        return None
+    _, fields = TRACKED[type(instance)]
+    return type(instance)._base_manager.filter(pk=instance.pk).values_list(*fields).first()
+
+
+def prepare(instance):
+    """pre_save/pre_delete: read the stored row, which in-memory instances may not match."""
+    instance._summary_previous = _load(instance)
+
+
+def record_save(instance, created):
+    kind, _ = TRACKED[type(instance)]
+    previous = None if created else getattr(instance, '_summary_previous', None)
+    current = snapshot(instance)
+    if current is MISSING:
+        current = _load(instance)
+    apply_deltas(diff(contribution(kind, previous), contribution(kind, current)))
+
+
+def record_delete(instance):
+    kind, _ = TRACKED[type(instance)]
+    apply_deltas(diff(contribution(kind, getattr(instance, '_summary_previous', None)), None))
+
+
+def rebuild(since=None):
+    """Recompute summaries from the source tables (from ``since`` onwards when given)."""
+    aggregates = (
+        (Loan, 'LOAN', 'requested_amount', Sum('approved_amount')),
+        (WithdrawalRequest, 'WITHDRAWAL', 'amount', None),
+    )
+    rows = []
+    with transaction.atomic():
+        existing = DailySummary.objects.all()
+        if since is not None:
+            existing = existing.filter(day__gte=since)
+        existing.delete()
+        for model, kind, amount_field, approved in aggregates:
+            qs = model.objects.annotate(day=TruncDate('created_at'))
+            if since is not None:
+                qs = qs.filter(day__gte=since)
+            annotations = {'count': Count('pk'), 'amount': Sum(amount_field)}
+            if approved is not None:
+                annotations['approved'] = approved
+            for row in qs.values('day', 'status').annotate(**annotations).order_by():
+                rows.append(DailySummary(
+                    day=row['day'],
+                    kind=kind,
+                    status=row['status'],
+                    count=row['count'],
+                    amount_total=row['amount'] or ZERO,
+                    approved_total=row.get('approved') or ZERO,
+                ))
+        DailySummary.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def _month_start(day, months_back):
+    month = day.year * 12 + day.month - 1 - months_back
+    return datetime.date(month // 12, month % 12 + 1, 1)
+
+
+def report_cache():
+    return caches[getattr(settings, 'PORTFOLIO_REPORT_CACHE', 'default')]
+
+
+def clear_report_cache():
+    report_cache().delete_many([f'portfolio-report:{months}' for months in REPORT_MONTHS])
+
+
+def report(months=12):
+    """Monthly loan and withdrawal figures for the last ``months`` months, newest first."""
+    key = f'portfolio-report:{months}'
+    cached = report_cache().get(key)
+    if cached is not None:
+        return cached
+
+    since = _month_start(timezone.localdate(), months - 1)
+    rows = (
+        DailySummary.objects.filter(day__gte=since)
+        .annotate(month=TruncMonth('day'))
+        .values('month', 'kind', 'status')
+        .annotate(count=Sum('count'), amount=Sum('amount_total'), approved=Sum('approved_total'))
+        .order_by()
+    )
+    by_month = {}
+    for row in rows:
+        month = by_month.setdefault(row['month'], {
+            'month': row['month'],
+            'loans': {},
+            'withdrawals': {},
+            'loan_count': 0,
+            'requested_total': ZERO,
+            'approved_count': 0,
+            'approved_total': ZERO,
+            'rejected_count': 0,
+            'withdrawal_count': 0,
+            'withdrawn_total': ZERO,
+        })
+        figures = {'count': row['count'], 'amount': row['amount'] or ZERO}
+        if row['kind'] == 'LOAN':
+            month['loans'][row['status']] = figures
+            month['loan_count'] += row['count']
+            month['requested_total'] += figures['amount']
+            if row['status'] in APPROVED_STATUSES:
+                month['approved_count'] += row['count']
+                month['approved_total'] += row['approved'] or ZERO
+            elif row['status'] == 'REJECTED':
+                month['rejected_count'] += row['count']
+        else:
+            month['withdrawals'][row['status']] = figures
+            month['withdrawal_count'] += row['count']
+            if row['status'] == 'APPROVED':
+                month['withdrawn_total'] += figures['amount']
+
+    result = []
+    for month in sorted(by_month.values(), key=lambda m: m['month'], reverse=True):
+        decided = month['approved_count'] + month['rejected_count']
+        month['approval_rate'] = month['approved_count'] / decided if decided else None
+        month['average_approved'] = (
+            (month['approved_total'] / month['approved_count']).quantize(ZERO) if month['approved_count'] else None
+        )
+        empty = {'count': 0, 'amount': ZERO}
+        month['loan_rows'] = [(status, month['loans'].get(status, empty)) for status, _ in Loan.STATUS_CHOICES]
+        month['withdrawal_rows'] = [
+            (status, month['withdrawals'].get(status, empty)) for status, _ in WithdrawalRequest.STATUS_CHOICES
+        ]
+        result.append(month)
+    report = {'months': result, 'since': since, 'generated_at': timezone.now()}
+    report_cache().set(key, report, getattr(settings, 'PORTFOLIO_REPORT_CACHE_SECONDS', 300))
+    return report
@@ -0,0 +1,365 @@
+"""Synthetic, production-shaped data for performance work.
+
+``generate()`` creates users with the onboarding drop-off, loan status mix
+and withdrawal/audit volume we see in production. It is built for volume:
+
+* the password hash is computed once and shared by every generated user;
+* rows are inserted with ``bulk_create`` in large batches, and the leaf
+  tables nothing else references (agreements, audit rows) are streamed
+  with ``COPY`` on PostgreSQL;
+* user ranges are independent, so ``workers > 1`` fans chunks out to a
+  process pool (PostgreSQL only; SQLite serialises writers).
+
+Used by ``manage.py generate_synthetic_data`` and the ``scale`` benchmarks.
+"""
+import io
+import json
+import multiprocessing
+import random
+import secrets
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from . import identity
+from .models import AuditLog, BankDetail, Loan, LoanAgreement, Profile, User, WithdrawalRequest
+
+DEFAULT_PASSWORD = 'synthetic-pass-123'
+
+# Onboarding funnel: share of the previous step that reaches the next one.
+VERIFIED_RATE = 0.85
+PROFILE_RATE = 0.80
+BANK_RATE = 0.85
+LOAN_RATE = 0.70
+
+LOAN_STATUS_WEIGHTS = (('PENDING', 15), ('APPROVED', 25), ('ACTIVE', 35), ('CLOSED', 15), ('REJECTED', 10))
+WITHDRAWAL_STATUS_WEIGHTS = (('APPROVED', 70), ('PENDING', 20), ('REJECTED', 10))
+EMPLOYMENT_WEIGHTS = (
+    ('FULL_TIME', 55), ('PART_TIME', 12), ('SELF_EMPLOYED', 10), ('CONTRACTOR', 10),
+    ('UNEMPLOYED', 5), ('RETIRED', 5), ('STUDENT', 3),
+)
+FIRST_NAMES = ('James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'Amara', 'Chinedu', 'Fatima', 'Kwame', 'Mei', 'Carlos', 'Sofia', 'Ahmed', 'Priya', 'Ivan')
+LAST_NAMES = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Okafor', 'Mensah',
+              'Nguyen', 'Patel', 'Kim', 'Rossi', 'Silva', 'Kowalski', 'Haddad', 'Ivanova', 'Tanaka', 'Adeyemi')
+CITIES = (('Austin', 'TX'), ('Denver', 'CO'), ('Atlanta', 'GA'), ('Phoenix', 'AZ'), ('Columbus', 'OH'), ('Tampa', 'FL'))
+
+SYNTHETIC_ADMIN_EMAIL = 'synthetic-admin@example.test'
+
+# Fields whose auto_now_add would otherwise flatten every row to "now".
+TIMESTAMP_FIELDS = (
+    (User, 'created_at'),
+    (BankDetail, 'created_at'),
+    (Loan, 'created_at'),
+    (WithdrawalRequest, 'created_at'),
+    (LoanAgreement, 'created_at'),
+    (AuditLog, 'timestamp'),
+)
+
+
+def _pick(rng, weighted):
+    values, weights = zip(*weighted)
+    return rng.choices(values, weights)[0]
+
+
+@contextmanager
+def explicit_timestamps():
+    """Let generated rows keep their backdated created_at/timestamp values."""
+    fields = [model._meta.get_field(name) for model, name in TIMESTAMP_FIELDS]
+    previous = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, previous):
+            field.auto_now_add = value
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_objects(model, objs):
+    """Stream unsaved instances into ``model``'s table with PostgreSQL COPY."""
+    if not objs:
+        return
+    fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+    buf = io.StringIO()
+    for obj in objs:
+        buf.write('\t'.join(_copy_value(getattr(obj, f.attname)) for f in fields))
+        buf.write('\n')
+    buf.seek(0)
+    columns = ', '.join(connection.ops.quote_name(f.column) for f in fields)
+    sql = f'COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN'
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):  # psycopg2
+            raw.copy_expert(sql, buf)
+        else:  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buf.getvalue())
+
+
+def _insert_leaf(model, objs, batch_size, use_copy):
+    if use_copy:
+        copy_objects(model, objs)
+    else:
+        model.objects.bulk_create(objs, batch_size=batch_size)
+    return len(objs)
+
+
+def _users(rng, start, count, tag, password_hash, now, days):
+    users = []
+    for i in range(start, start + count):
+        created = now - timedelta(days=rng.random() * days)
+        verified = rng.random() < VERIFIED_RATE
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        users.append(User(
+            full_name=f'{first} {last}',
+            email=f'synth-{tag}-{i}@example.test',
+            phone=f'+8{tag:04d}{i:09d}',
+            password=password_hash,
+            password_hash=password_hash,
+            created_at=created,
+            is_active=verified,
+            email_verified=verified,
+            email_verified_at=created + timedelta(minutes=rng.randint(2, 2880)) if verified else None,
+        ))
+    return users
+
+
+def _generate_batch(rng, start, count, *, tag, password_hash, admin_id, now, days, batch_size, use_copy, extra_audit):
+    counts = Counter()
+    users = User.objects.bulk_create(_users(rng, start, count, tag, password_hash, now, days), batch_size=batch_size)
+    if users and users[0].pk is None:
+        by_email = dict(User.objects.filter(email__in=[u.email for u in users]).values_list('email', 'pk'))
+        for user in users:
+            user.pk = by_email[user.email]
+    counts['users'] += len(users)
+
+    profiles, banks, loans = [], [], []
+    for user in users:
+        if not user.email_verified or rng.random() >= PROFILE_RATE:
+            continue
+        income = Decimal(rng.randrange(1500_00, 15000_00)) / 100
+        city, state = rng.choice(CITIES)
+        profiles.append(Profile(
+            user_id=user.pk,
+            street_address=f'{rng.randint(1, 9999)} Main St',
+            city=city,
+            state=state,
+            postal_code=f'{rng.randint(10000, 99999)}',
+            nationality='US',
+            marital_status=rng.choice(Profile.MARITAL_STATUS_CHOICES)[0],
+            housing_status=rng.choice(Profile.HOUSING_STATUS_CHOICES)[0],
+            dob=date(rng.randint(1950, 2005), rng.randint(1, 12), rng.randint(1, 28)),
+            employment_status=_pick(rng, EMPLOYMENT_WEIGHTS),
+            monthly_income=income,
+            completed=True,
+        ))
+        if rng.random() >= BANK_RATE:
+            continue
+        number = f'{rng.randrange(10 ** 9, 10 ** 12)}'
+        banks.append(BankDetail(
+            user_id=user.pk,
+            bank_name='Synthetic Credit Union',
+            account_name=user.full_name,
+            account_number=number,
+            account_last4=identity.account_last4(number),
+            created_at=user.created_at + timedelta(hours=rng.randint(1, 72)),
+        ))
+        if rng.random() >= LOAN_RATE:
+            continue
+        requested = Decimal(rng.randrange(500, 50000)).quantize(Decimal('1.00'))
+        status = _pick(rng, LOAN_STATUS_WEIGHTS)
+        created = user.created_at + timedelta(days=rng.random() * 14)
+        loans.append(Loan(
+            user_id=user.pk,
+            requested_amount=requested,
+            approved_amount=requested if status in ('APPROVED', 'ACTIVE', 'CLOSED') else None,
+            term_months=rng.randint(1, 12),
+            status=status,
+            loan_purpose=rng.choice(('Car repair', 'Rent', 'Medical bill', 'Tuition', 'Home improvement', 'Debt consolidation')),
+            monthly_income=income,
+            created_at=created,
+            approved_at=created + timedelta(hours=rng.randint(1, 48)) if status in ('APPROVED', 'ACTIVE', 'CLOSED') else None,
+            closed_at=created + timedelta(days=rng.randint(30, 365)) if status == 'CLOSED' else None,
+        ))
+    Profile.objects.bulk_create(profiles, batch_size=batch_size)
+    BankDetail.objects.bulk_create(banks, batch_size=batch_size)
+    loans = Loan.objects.bulk_create(loans, batch_size=batch_size)
+    counts['profiles'] += len(profiles)
+    counts['bank_details'] += len(banks)
+    counts['loans'] += len(loans)
+
+    names = {user.pk: user.full_name for user in users}
+    withdrawals, agreements, audits = [], [], []
+    for loan in loans:
+        if loan.status == 'PENDING':
+            continue
+        audits.append(AuditLog(
+            admin_id=admin_id,
+            action='REJECTED' if loan.status == 'REJECTED' else 'APPROVED',
+            entity_type='Loan',
+            entity_id=loan.pk,
+            timestamp=loan.approved_at or loan.created_at + timedelta(hours=6),
+        ))
+        if loan.status == 'REJECTED':
+            continue
+        if loan.status != 'APPROVED' or rng.random() < 0.5:
+            agreements.append(LoanAgreement(
+                loan_id=loan.pk,
+                user_id=loan.user_id,
+                borrower_name=names[loan.user_id],
+                requested_amount=loan.requested_amount,
+                account_last4=f'{rng.randint(0, 9999):04d}',
+                signature_text='Signed electronically',
+                signed_at=loan.approved_at + timedelta(hours=rng.randint(1, 24)),
+                ip_address=f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+                user_agent='Mozilla/5.0 (iPhone) Mobile',
+                terms_version='v2026-01-24',
+                created_at=loan.approved_at + timedelta(hours=1),
+            ))
+        remaining = loan.approved_amount
+        for _ in range(rng.randint(0, 6) if loan.status != 'APPROVED' else rng.randint(0, 2)):
+            amount = (remaining * Decimal(rng.uniform(0.05, 0.4))).quantize(Decimal('1.00'))
+            if amount <= 0:
+                break
+            status = _pick(rng, WITHDRAWAL_STATUS_WEIGHTS)
+            created = loan.approved_at + timedelta(days=rng.random() * 60)
+            withdrawal = WithdrawalRequest(
+                user_id=loan.user_id,
+                loan_id=loan.pk,
+                amount=amount,
+                status=status,
+                note='',
+                created_at=created,
+                processed_at=created + timedelta(hours=rng.randint(1, 30)) if status != 'PENDING' else None,
+            )
+            withdrawals.append(withdrawal)
+            if status == 'APPROVED':
+                remaining -= amount
+    for user in users:
+        for _ in range(extra_audit):
+            audits.append(AuditLog(
+                admin_id=admin_id,
+                action=rng.choice(('VIEWED', 'NOTE_ADDED', 'CONTACTED')),
+                entity_type='User',
+                entity_id=user.pk,
+                timestamp=user.created_at + timedelta(days=rng.random() * 30),
+            ))
+
+    # Withdrawals need their ids for the audit trail, so they always go through bulk_create.
+    withdrawals = WithdrawalRequest.objects.bulk_create(withdrawals, batch_size=batch_size)
+    counts['withdrawals'] += len(withdrawals)
+    for withdrawal in withdrawals:
+        if withdrawal.status != 'PENDING':
+            audits.append(AuditLog(
+                admin_id=admin_id,
+                action=f'{withdrawal.status}_WITHDRAWAL',
+                entity_type='WithdrawalRequest',
+                entity_id=withdrawal.pk,
+                timestamp=withdrawal.processed_at,
+            ))
+    counts['agreements'] += _insert_leaf(LoanAgreement, agreements, batch_size, use_copy)
+    counts['audit_logs'] += _insert_leaf(AuditLog, audits, batch_size, use_copy)
+    return counts
+
+
+def generate_chunk(start, count, *, seed, tag, password_hash, admin_id, days, batch_size, use_copy, extra_audit):
+    """Generate users ``[start, start + count)`` and everything hanging off them."""
+    rng = random.Random(seed * 1_000_003 + start)
+    now = timezone.now()
+    counts = Counter()
+    with explicit_timestamps():
+        for offset in range(start, start + count, batch_size):
+            size = min(batch_size, start + count - offset)
+            with transaction.atomic():
+                counts += _generate_batch(
+                    rng, offset, size,
+                    tag=tag, password_hash=password_hash, admin_id=admin_id, now=now, days=days,
+                    batch_size=batch_size, use_copy=use_copy, extra_audit=extra_audit,
+                )
+    return counts
+
+
+def _worker(kwargs):
+    counts = generate_chunk(**kwargs)
+    connections.close_all()
+    return counts
+
+
+def synthetic_admin(password_hash):
+    admin, _ = User.objects.get_or_create(
+        email=SYNTHETIC_ADMIN_EMAIL,
+        defaults={
+            'phone': '+80000000000000',
+            'full_name': 'Synthetic Admin',
+            'password': password_hash,
+            'password_hash': password_hash,
+            'role': 'ADMIN',
+            'is_staff': True,
+            'email_verified': True,
+        },
+    )
+    return admin
+
+
+def tag_in_use(tag):
+    return User.objects.filter(email__startswith=f'synth-{tag}-').exists()
+
+
+def free_tag():
+    """A random 0-9999 tag no earlier run has used, so repeated runs never collide."""
+    for _ in range(100):
+        tag = secrets.randbelow(10000)
+        if not tag_in_use(tag):
+            return tag
+    raise ValueError('No free synthetic tag found; pass one explicitly.')
+
+
+def generate(users, *, workers=1, chunk_size=20000, batch_size=5000, seed=0, tag=None, password=DEFAULT_PASSWORD,
+             days=730, extra_audit=0, use_copy=None, progress=None):
+    """Generate ``users`` synthetic borrowers; returns a Counter of rows inserted per table."""
+    if tag is None:
+        tag = free_tag()
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    # One PBKDF2 run for the whole dataset instead of one per user.
+    password_hash = make_password(password)
+    admin_id = synthetic_admin(password_hash).pk
+
+    jobs = [
+        dict(start=start, count=min(chunk_size, users - start), seed=seed, tag=tag, password_hash=password_hash,
+             admin_id=admin_id, days=days, batch_size=batch_size, use_copy=use_copy, extra_audit=extra_audit)
+        for start in range(0, users, chunk_size)
+    ]
+    totals = Counter()
+    if workers > 1 and len(jobs) > 1:
+        # Children must open their own connections; never share the parent's socket.
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            for counts in pool.imap_unordered(_worker, jobs):
+                totals += counts
+                if progress:
+                    progress(totals)
+    else:
+        for job in jobs:
+            totals += generate_chunk(**job)
+            if progress:
+                progress(totals)
+    return totals
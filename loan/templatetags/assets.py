@@ -0,0 +1,52 @@
+"""Responsive image markup from the ``build_assets`` manifest (see loan/assets.py).
+
+    {% load assets %}
+    {% picture 'banner.jpeg' alt='Banner' sizes='100vw' %}
+    <video poster="{% responsive_url 'banner.jpeg' 'webp' 480 %}">
+
+Images missing from the manifest (build_assets not run) fall back to a plain
+``<img>`` / the original file, so templates work before the first build.
+"""
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from loan import assets
+
+register = template.Library()
+
+
+def _srcset(variants):
+    return ', '.join(f'{static(name)} {width}w' for name, width in variants)
+
+
+@register.simple_tag
+def picture(name, alt='', sizes='100vw', loading='lazy', **attrs):
+    """``<picture>`` with AVIF/WebP ``srcset`` sources and the original as the ``<img>`` fallback.
+
+    ``loading`` defaults to lazy; pass ``loading='eager'`` for images above the fold.
+    Other keyword arguments (``class``, ``style``...) are added to the ``<img>``.
+    """
+    entry = assets.manifest().get(name)
+    img_attrs = {'src': static(name), 'alt': alt, 'loading': loading, 'decoding': 'async'}
+    if entry:
+        img_attrs['width'] = entry['width']
+        img_attrs['height'] = entry['height']
+    img_attrs.update(attrs)
+    img = format_html('<img {}>', format_html_join(' ', '{}="{}"', img_attrs.items()))
+    if not entry:
+        return img
+    sources = format_html_join(
+        '',
+        '<source type="{}" srcset="{}" sizes="{}">',
+        ((assets.MIME_TYPES.get(fmt, f'image/{fmt}'), _srcset(variants), sizes)
+         for fmt, variants in entry['variants'].items() if variants),
+    )
+    return format_html('<picture>{}{}</picture>', sources, img)
+
+
+@register.simple_tag
+def responsive_url(name, fmt='webp', width=0):
+    """URL of the narrowest ``fmt`` variant at least ``width`` pixels wide (for ``poster=`` etc.),
+    or of the original when no variant is both wide enough and lighter."""
+    return static(assets.best_url_name(name, fmt, int(width)))
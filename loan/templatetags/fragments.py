@@ -0,0 +1,40 @@
+"""Loan fragments cached by ``Loan.version`` (see loan/fragments.py).
+
+    {% load fragments %}
+    {% loan_fragment 'dashboard' loan %}
+      ...markup that only depends on the loan and its withdrawals...
+    {% endloan_fragment %}
+
+Without a loan (``None``) the block renders uncached. Keep CSRF tokens,
+messages and per-request values out of cached blocks.
+"""
+from django import template
+from django.utils.safestring import mark_safe
+
+from loan import fragments
+
+register = template.Library()
+
+
+class LoanFragmentNode(template.Node):
+    def __init__(self, nodelist, name, loan):
+        self.nodelist = nodelist
+        self.name = name
+        self.loan = loan
+
+    def render(self, context):
+        loan = self.loan.resolve(context)
+        if loan is None:
+            return self.nodelist.render(context)
+        content = fragments.render(self.name.resolve(context), loan, lambda: self.nodelist.render(context))
+        return mark_safe(content)
+
+
+@register.tag
+def loan_fragment(parser, token):
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name and a loan.")
+    nodelist = parser.parse(('endloan_fragment',))
+    parser.delete_first_token()
+    return LoanFragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
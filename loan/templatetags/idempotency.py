@@ -0,0 +1,21 @@
+"""Hidden idempotency token for borrower forms (see loan/idempotency.py).
+
+    {% load idempotency %}
+    <form method="post">{% csrf_token %}{% idempotency_field %}...</form>
+
+Each render issues a fresh token, so resubmitting the same rendered form
+(double tap, retry on a flaky connection) is recognised as a duplicate.
+"""
+import uuid
+
+from django import template
+from django.utils.html import format_html
+
+from loan.idempotency import FIELD_NAME
+
+register = template.Library()
+
+
+@register.simple_tag
+def idempotency_field():
+    return format_html('<input type="hidden" name="{}" value="{}">', FIELD_NAME, uuid.uuid4().hex)
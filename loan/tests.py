@@ -1,3 +1,330 @@
-from django.test import TestCase
+import csv
+import datetime
+import hashlib
+import io
+import shutil
+import tempfile
+from decimal import ROUND_HALF_UP, Decimal
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connections
+from django.db.models import Count, Sum
+from django.http import HttpResponse, HttpResponseRedirect
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from loan import accrual, idempotency, lifecycle, payouts, replicas
+from loan.benchmarks.runner import BenchContext
+from loan.models import BankDetail, InterestAccrual, Loan, WithdrawalRequest
+
+
+class FixtureMixin:
+    """Borrowers and loans built with the benchmark fixtures (loan/benchmarks/runner.py)."""
+
+    def setUp(self):
+        super().setUp()
+        self.fixtures = BenchContext()
+
+    def borrower(self, account_number='000123456789', status='APPROVED', amount=Decimal('12000.00')):
+        user = self.fixtures.create_user()
+        BankDetail.objects.filter(user=user).update(account_number=account_number)
+        return user, self.fixtures.create_loan(user, status, amount)
+
+    def withdraw(self, loan, amount, status='APPROVED', on=None):
+        processed_at = timezone.now() if on is None else timezone.make_aware(datetime.datetime.combine(on, datetime.time(12)))
+        return WithdrawalRequest.objects.create(
+            user_id=loan.user_id, loan=loan, amount=Decimal(amount), status=status, processed_at=processed_at,
+        )
+
+
+class PayoutFileTests(FixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        # Account numbers longer than 10 digits only contribute their last 10 to the entry hash.
+        self.accounts = ['9912345678901', '000123456789', '55-0001']
+        amounts = ['10.10', '20.05', '0.99']
+        for account, amount in zip(self.accounts, amounts):
+            _, loan = self.borrower(account_number=account)
+            self.withdraw(loan, amount)
+        self.withdraw(loan, '7.00', status='PENDING')  # not approved: never claimed
+
+    def expected_hash(self):
+        return sum(int(''.join(ch for ch in a if ch.isdigit())[-10:]) for a in self.accounts) % 10**10
+
+    def generate(self, file_format):
+        batch = payouts.create_batch(file_format=file_format, chunk_size=2)
+        return payouts.generate_file(batch, chunk_size=2)
+
+    def read(self, batch):
+        with batch.file.open('rb') as f:
+            return f.read()
+
+    def test_batch_totals(self):
+        batch = payouts.create_batch(chunk_size=2)
+        self.assertEqual(batch.withdrawal_count, 3)
+        self.assertEqual(batch.total_amount, Decimal('31.14'))
+        self.assertIsNone(payouts.create_batch(), 'claimed withdrawals are not claimed again')
+
+    def test_csv_trailer_and_checksums(self):
+        batch = self.generate('CSV')
+        data = self.read(batch)
+        rows = list(csv.reader(io.StringIO(data.decode())))
+        self.assertEqual(rows[0], list(payouts.CSV_HEADER))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(sum(Decimal(row[5]) for row in rows[1:-1]), Decimal('31.14'))
+        self.assertEqual(rows[-1], ['TRAILER', str(batch.pk), '3', '31.14', f'{self.expected_hash():010d}'])
+        self.assertEqual(batch.entry_hash, f'{self.expected_hash():010d}')
+        self.assertEqual(batch.file_sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(batch.status, 'GENERATED')
+
+    def test_fixed_width_records(self):
+        batch = self.generate('FIXED')
+        records = self.read(batch).decode('ascii').split('\r\n')
+        self.assertEqual(records.pop(), '')
+        self.assertTrue(all(len(record) == payouts.RECORD_LENGTH for record in records))
+        self.assertEqual([record[0] for record in records], ['1', '6', '6', '6', '9'])
+        self.assertEqual(sum(int(record[64:76]) for record in records[1:-1]), 3114)
+        trailer = records[-1]
+        self.assertEqual(trailer[1:9], '00000003')
+        self.assertEqual(trailer[9:23], f'{3114:014d}')
+        self.assertEqual(trailer[23:33], f'{self.expected_hash():010d}')
+
+    def test_mark_paid_and_cancel(self):
+        batch = payouts.create_batch()
+        with self.assertRaises(ValueError):
+            payouts.mark_paid(batch)  # no file generated yet
+        batch = payouts.generate_file(batch)
+        self.assertEqual(payouts.mark_paid(batch, chunk_size=2), 3)
+        self.assertFalse(WithdrawalRequest.objects.filter(payout_batch=batch, paid_at__isnull=True).exists())
+        with self.assertRaises(ValueError):
+            payouts.cancel(batch)
+
+
+@override_settings(LOAN_ANNUAL_RATE='0.18', LOAN_ANNUAL_FEE_RATE='0.015', LOAN_ACCRUAL_DAY_COUNT=365)
+class AccrualTests(FixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = timezone.localdate() - datetime.timedelta(days=40)
+        self.through = self.start + datetime.timedelta(days=29)
+        _, self.loan = self.borrower(status='ACTIVE')
+        self.withdraw(self.loan, '1000.00', on=self.start)
+        self.withdraw(self.loan, '333.33', on=self.start + datetime.timedelta(days=5))
+        self.withdraw(self.loan, '50.00', status='PENDING', on=self.start)  # not drawn
+        _, self.undrawn = self.borrower(status='ACTIVE')
+
+    def expected(self, rate):
+        # Closed form over the whole period, in Decimal: principal-days x rate / 365, half up.
+        principal_days = Decimal('1000.00') * 30 + Decimal('333.33') * 25
+        return (principal_days * Decimal(rate) / 365).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    def totals(self, loan):
+        return InterestAccrual.objects.filter(loan=loan).aggregate(interest=Sum('interest'), fee=Sum('fee'), days=Count('pk'))
+
+    def test_accrues_drawn_principal_to_the_cent(self):
+        stats = accrual.accrue(self.through)
+        self.assertEqual(stats['loans'], 1)
+        rows = list(InterestAccrual.objects.filter(loan=self.loan).order_by('date'))
+        self.assertEqual(len(rows), 30)
+        self.assertEqual(rows[0].date, self.start)
+        self.assertEqual({row.principal for row in rows[:5]}, {Decimal('1000.00')})
+        self.assertEqual({row.principal for row in rows[5:]}, {Decimal('1333.33')})
+        self.assertEqual(sum(row.interest for row in rows), self.expected('0.18'))
+        self.assertEqual(sum(row.fee for row in rows), self.expected('0.015'))
+        self.assertFalse(InterestAccrual.objects.filter(loan=self.undrawn).exists())
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.accrued_through, self.through)
+
+    def test_reruns_and_partial_runs_post_each_day_once(self):
+        for _ in range(6):
+            accrual.accrue(self.through, max_days=7, chunk_size=1)
+        once = self.totals(self.loan)
+        self.assertEqual(accrual.accrue(self.through)['entries'], 0)
+        self.assertEqual(self.totals(self.loan), once)
+        self.assertEqual(once['interest'], self.expected('0.18'))
+
+    def test_python_fallback_matches_numpy(self):
+        args = ([0, 0, 1, 1], [1, 6, 3, 1], [100000, 33333, 99, 1686000000], 18000000, [1, 2], [30, 400], 365)
+        with_numpy = [list(map(int, column)) for column in accrual.daily_accruals(*args)]
+        with mock.patch.object(accrual, 'np', None):
+            without = [list(column) for column in accrual.daily_accruals(*args)]
+        self.assertEqual(with_numpy, without)
+
+
+class LifecycleCloseTests(FixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        state = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, state, ignore_errors=True)
+        override = override_settings(LOAN_LIFECYCLE_STATE_FILE=f'{state}/lifecycle.json')
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def active(self, approved_days_ago, term_months=1):
+        _, loan = self.borrower(status='ACTIVE')
+        Loan.objects.filter(pk=loan.pk).update(
+            term_months=term_months, approved_at=timezone.now() - datetime.timedelta(days=approved_days_ago))
+        return loan
+
+    def test_only_loans_that_owe_nothing_close_after_their_term(self):
+        expired = self.active(40)
+        running = self.active(40, term_months=3)
+        drawn = self.active(400)
+        self.withdraw(drawn, '12000.00')  # the whole line: still owed, keeps accruing
+        pending = self.active(400)
+        self.withdraw(pending, '10.00', status='PENDING')
+        lifecycle.sweep(['close'])
+        statuses = dict(Loan.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[expired.pk], 'CLOSED')
+        self.assertEqual(statuses[running.pk], 'ACTIVE')
+        self.assertEqual(statuses[drawn.pk], 'ACTIVE')
+        self.assertEqual(statuses[pending.pk], 'ACTIVE')
+
+
+@mock.patch.object(replicas, 'replica_healthy', return_value=True)
+@mock.patch.object(replicas, 'configured', return_value=True)
+class ReplicaRouterTests(SimpleTestCase):
+    router = replicas.ReplicaRouter()
+    cache_entry = SimpleNamespace(_meta=SimpleNamespace(app_label=replicas.CACHE_APP_LABEL))
+
+    def read(self, model=Loan):
+        return self.router.db_for_read(model)
+
+    def test_reads_use_the_replica_only_when_asked(self, *mocks):
+        self.assertEqual(self.read(), replicas.PRIMARY)
+        with replicas.replica_reads():
+            self.assertEqual(self.read(), replicas.REPLICA)
+            self.assertEqual(self.read(self.cache_entry), replicas.PRIMARY)
+        self.assertEqual(self.read(), replicas.PRIMARY)
+
+    def test_primary_after_a_write_or_read_primary(self, *mocks):
+        with replicas.replica_reads():
+            self.router.db_for_write(self.cache_entry)  # cache claims are not borrower writes
+            self.assertEqual(self.read(), replicas.REPLICA)
+            self.assertEqual(self.router.db_for_write(Loan), replicas.PRIMARY)
+            self.assertEqual(self.read(), replicas.PRIMARY)
+        with replicas.replica_reads():
+            replicas.read_primary()
+            self.assertEqual(self.read(), replicas.PRIMARY)
+
+    def test_primary_inside_a_transaction_or_when_lagging(self, configured, healthy):
+        with replicas.replica_reads():
+            with mock.patch.object(connections[replicas.PRIMARY], 'in_atomic_block', True):
+                self.assertEqual(self.read(), replicas.PRIMARY)
+            healthy.return_value = False
+            self.assertEqual(self.read(), replicas.PRIMARY)
+
+    def test_middleware_pins_a_client_that_wrote(self, *mocks):
+        seen = []
+
+        def view(request):
+            with replicas.replica_reads():
+                seen.append(self.read())
+                if request.method == 'POST':
+                    self.router.db_for_write(WithdrawalRequest)
+            return HttpResponse()
+
+        middleware = replicas.ReplicaPinningMiddleware(view)
+        factory = RequestFactory()
+        self.assertNotIn(replicas.PIN_COOKIE, middleware(factory.get('/')).cookies)
+        response = middleware(factory.post('/'))
+        pin = response.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(pin['max-age'], replicas.pin_seconds())
+        factory.cookies[replicas.PIN_COOKIE] = pin.value
+        middleware(factory.get('/'))
+        factory.cookies[replicas.PIN_COOKIE] = 'garbage'
+        middleware(factory.get('/'))
+        self.assertEqual(seen, [replicas.REPLICA, replicas.REPLICA, replicas.PRIMARY, replicas.REPLICA])
+
+    def test_views_read_the_replica_for_safe_methods_only(self, *mocks):
+        view = replicas.replica_reads_view(lambda request: HttpResponse(self.read()))
+        factory = RequestFactory()
+        self.assertEqual(view(factory.get('/')).content.decode(), replicas.REPLICA)
+        self.assertEqual(view(factory.post('/')).content.decode(), replicas.PRIMARY)
+
+
+@skipUnless(replicas.configured(), 'needs DATABASE_REPLICA_URL (mirrored onto default in tests)')
+class ReplicaMirrorTests(FixtureMixin, TransactionTestCase):
+    databases = '__all__'
+
+    def test_routed_queries_see_primary_rows(self):
+        _, loan = self.borrower()
+        with replicas.replica_reads():
+            queryset = Loan.objects.filter(pk=loan.pk)
+            self.assertEqual(queryset.db, replicas.REPLICA)
+            self.assertEqual(queryset.get().status, 'APPROVED')
+            Loan.objects.filter(pk=loan.pk).update(status='ACTIVE')
+            queryset = Loan.objects.filter(pk=loan.pk)
+            self.assertEqual(queryset.db, replicas.PRIMARY)
+            self.assertEqual(queryset.get().status, 'ACTIVE')
+
+
+@override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'idempotency': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'idempotency-tests'},
+    },
+    IDEMPOTENCY_CACHE='idempotency', IDEMPOTENCY_WAIT_SECONDS=0,
+)
+class IdempotencyTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+        self.user = SimpleNamespace(pk=7, is_authenticated=True)
+        self.addCleanup(idempotency.cache().clear)
+
+    def view(self, request):
+        self.calls.append(request.POST.get('amount'))
+        if request.POST.get('amount') == 'invalid':
+            return HttpResponse('form errors')
+        return HttpResponseRedirect('/dashboard/')
+
+    def post(self, data, path='/withdraw/'):
+        request = RequestFactory().post(path, {idempotency.FIELD_NAME: 'token-1', **data})
+        request.user = self.user
+        return idempotency.idempotent(self.view)(request)
+
+    def test_duplicate_replays_the_first_outcome(self):
+        first = self.post({'amount': '10'})
+        second = self.post({'amount': '10'})
+        self.assertEqual(self.calls, ['10'])
+        self.assertEqual((second.status_code, second['Location']), (first.status_code, first['Location']))
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+
+    def test_conflict_while_pending_or_on_another_form(self):
+        key = idempotency.cache_key(self.user.pk, 'token-1')
+        idempotency.cache().add(key, (idempotency.PENDING, '/withdraw/'))
+        self.assertEqual(self.post({'amount': '10'}).status_code, 409)
+        idempotency.cache().delete(key)
+        self.post({'amount': '10'})
+        self.assertEqual(self.post({'amount': '10'}, path='/apply/').status_code, 409)
+        self.assertEqual(self.calls, ['10'])
+
+    def test_validation_error_releases_the_key(self):
+        self.assertEqual(self.post({'amount': 'invalid'}).status_code, 200)
+        self.assertIsNone(idempotency.cache().get(idempotency.cache_key(self.user.pk, 'token-1')))
+        self.assertEqual(self.post({'amount': '10'}).status_code, 302)
+        self.assertEqual(self.calls, ['invalid', '10'])
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'loan_test_shared_cache'},
+})
+class PurgeSharedCacheTests(TestCase):
+    def test_deletes_only_expired_rows(self):
+        call_command('createcachetable', database='default', verbosity=0)
+        shared = caches['shared']
+        shared.set_many({f'old-{i}': i for i in range(5)}, timeout=60)
+        shared.set('live', 1, timeout=3600)
+        out = io.StringIO()
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + datetime.timedelta(minutes=5)):
+            call_command('purge_shared_cache', chunk_size=2, stdout=out)
+        self.assertIn('shared: deleted 5 expired rows', out.getvalue())
+        self.assertEqual(shared.get('live'), 1)
@@ -0,0 +1,85 @@
+"""Token-bucket throttling for the credential endpoints.
+
+Login and registration both run PBKDF2, so a credential-stuffing burst can
+pin the CPU. ``check()`` is called before any form validation, hashing or
+database work: each (scope, identity) pair has a bucket in the cache that
+refills continuously at ``THROTTLE_RATES[scope]`` (e.g. ``'5/5m'`` means a
+burst of 5, refilled at 5 tokens per 5 minutes). Rejections are counted in
+the ``loan_throttle_rejected_total`` metric.
+
+Buckets live in the ``THROTTLE_CACHE`` cache alias. Point it at a shared
+backend (database, Redis, memcached) so limits hold across workers; the
+read-modify-write is not atomic, which can at worst let a handful of extra
+attempts through under heavy concurrency.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.shortcuts import render
+
+from .instrumentation import registry
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+registry.describe('loan_throttle_rejected_total', 'counter', 'Attempts rejected by throttling, by scope.')
+
+
+def parse_rate(rate):
+    """Parse ``'<count>/<n><unit>'`` (``'5/5m'``, ``'10/h'``) into ``(capacity, period_seconds)``."""
+    count, _, period = rate.partition('/')
+    multiplier = period[:-1] or '1'
+    return int(count), int(multiplier) * PERIODS[period[-1]]
+
+
+def client_ip(request):
+    header = getattr(settings, 'THROTTLE_CLIENT_IP_HEADER', '')
+    if header:
+        value = request.META.get(header, '')
+        if value:
+            return value.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def consume(scope, identity, now=None):
+    """Take one token from the bucket; returns 0 when allowed, else seconds until a token is available."""
+    rate = getattr(settings, 'THROTTLE_RATES', {}).get(scope)
+    if not rate:
+        return 0.0
+    capacity, period = parse_rate(rate)
+    refill_per_second = capacity / period
+    now = time.time() if now is None else now
+    digest = hashlib.sha256(identity.encode()).hexdigest()[:32]
+    key = f'throttle:{scope}:{digest}'
+    cache = caches[getattr(settings, 'THROTTLE_CACHE', 'default')]
+
+    tokens, stamp = cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + max(0.0, now - stamp) * refill_per_second)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    cache.set(key, (tokens, now), timeout=period)
+    return 0.0 if allowed else (1 - tokens) / refill_per_second
+
+
+def check(*buckets):
+    """Consume from each ``(scope, identity)`` bucket; returns the retry delay of the first rejection."""
+    for scope, identity in buckets:
+        if not identity:
+            continue
+        retry_after = consume(scope, identity)
+        if retry_after:
+            registry.inc('loan_throttle_rejected_total', scope=scope)
+            return retry_after
+    return 0.0
+
+
+def throttled_response(request, template_name, context, retry_after):
+    minutes = max(1, math.ceil(retry_after / 60))
+    messages.error(request, f"Too many attempts. Please wait {minutes} minute{'s' if minutes != 1 else ''} and try again.")
+    response = render(request, template_name, context, status=429)
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
@@ -0,0 +1,287 @@
+"""Declarative underwriting rules evaluated in bulk over pending loans.
+
+Rules come from active ``UnderwritingRule`` rows, or from the
+``UNDERWRITING_RULES`` setting when the table has none. ``compile_rules``
+turns each spec into a predicate once: thresholds are converted to cents,
+age limits to a date-of-birth cutoff and DTI limits to per-term annuity
+factors, so evaluating a loan is a handful of integer comparisons.
+
+``underwrite`` walks PENDING loans in primary-key (keyset) chunks, one flat
+``values_list`` query per chunk, and optionally fans chunks out to a process
+pool. Each loan is decided as follows:
+
+* any failed REJECT rule: ``REJECT``;
+* otherwise any failed REVIEW rule: ``REVIEW`` (left pending for a human);
+* otherwise ``APPROVE`` when ``UNDERWRITING_AUTO_APPROVE`` is on, else ``PASS``
+  (left pending).
+
+Decisions are written per chunk with one UPDATE per outcome and one bulk
+AuditLog insert; the failed rule names are stored in ``AuditLog.details``.
+Portfolio summaries are adjusted through ``summaries.apply_deltas`` because
+the updates bypass model signals.
+"""
+import multiprocessing
+import time
+from collections import Counter, deque, namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import amortization, events, summaries
+from .models import AuditLog, Loan, UnderwritingRule
+
+Application = namedtuple('Application', 'pk requested_cents term_months income_cents employment_status dob')
+
+APPLICATION_FIELDS = (
+    'pk',
+    'requested_amount',
+    'term_months',
+    'monthly_income',
+    'user__profile__monthly_income',
+    'user__profile__employment_status',
+    'user__profile__dob',
+)
+
+DECISIONS = ('APPROVE', 'REJECT', 'REVIEW', 'PASS')
+
+
+def load_specs():
+    """Active rule specs as plain dicts (picklable, so workers can compile them)."""
+    rules = UnderwritingRule.objects.filter(active=True)
+    specs = [
+        {
+            'name': rule.name,
+            'kind': rule.kind,
+            'threshold': rule.threshold,
+            'values': [v.strip() for v in rule.values.split(',') if v.strip()],
+            'outcome': rule.outcome,
+        }
+        for rule in rules
+    ]
+    return specs or list(getattr(settings, 'UNDERWRITING_RULES', []))
+
+
+def _years_ago(today, years):
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:  # 29 February
+        return today.replace(year=today.year - years, day=28)
+
+
+def _dti_predicate(limit_bp, annual_rate):
+    rate = amortization.monthly_rate(annual_rate)
+    factors = {}
+
+    def predicate(app):
+        if not app.income_cents:
+            return False
+        factor = factors.get(app.term_months)
+        if factor is None:
+            factor = factors[app.term_months] = amortization.annuity_factor(rate, app.term_months)
+        installment = amortization._div_half_up(app.requested_cents * factor, amortization.SCALE)
+        return amortization.dti_basis(installment, app.income_cents) <= limit_bp
+    return predicate
+
+
+def compile_rule(spec, today=None):
+    """Predicate ``fn(Application) -> bool`` (True when the loan passes) for one spec."""
+    today = today or timezone.localdate()
+    kind = spec['kind']
+    threshold = Decimal(str(spec['threshold'])) if spec.get('threshold') is not None else None
+    if kind == 'MAX_INCOME_MULTIPLE':
+        return lambda app: bool(app.income_cents) and app.requested_cents * 10000 <= app.income_cents * int(threshold * 10000)
+    if kind == 'MIN_INCOME':
+        floor = amortization.to_cents(threshold)
+        return lambda app: app.income_cents >= floor
+    if kind == 'MAX_AMOUNT':
+        ceiling = amortization.to_cents(threshold)
+        return lambda app: app.requested_cents <= ceiling
+    if kind == 'MAX_TERM':
+        months = int(threshold)
+        return lambda app: app.term_months <= months
+    if kind == 'MIN_AGE':
+        born_by = _years_ago(today, int(threshold))
+        return lambda app: app.dob is not None and app.dob <= born_by
+    if kind == 'MAX_AGE':
+        born_after = _years_ago(today, int(threshold) + 1)
+        return lambda app: app.dob is not None and app.dob > born_after
+    if kind == 'MAX_DTI':
+        return _dti_predicate(int(threshold / amortization.DTI_QUANTUM), amortization.default_rate())
+    if kind in ('EMPLOYMENT_IN', 'EMPLOYMENT_NOT_IN'):
+        allowed = frozenset(spec.get('values') or ())
+        if kind == 'EMPLOYMENT_IN':
+            return lambda app: app.employment_status in allowed
+        return lambda app: app.employment_status not in allowed
+    raise ValueError(f"Unknown underwriting rule kind {kind!r} in rule {spec.get('name')!r}")
+
+
+def compile_rules(specs, today=None):
+    """``[(name, outcome, predicate)]``; REJECT rules first so they decide before REVIEW."""
+    compiled = [(spec['name'], spec.get('outcome', 'REVIEW'), compile_rule(spec, today)) for spec in specs]
+    return sorted(compiled, key=lambda rule: rule[1] != 'REJECT')
+
+
+def application(row):
+    pk, requested, term, loan_income, profile_income, employment, dob = row
+    income = profile_income if profile_income is not None else loan_income
+    return Application(
+        pk,
+        amortization.to_cents(requested),
+        term,
+        amortization.to_cents(income) if income else 0,
+        employment or '',
+        dob,
+    )
+
+
+def decide(app, rules, auto_approve):
+    """``(decision, failed rule names)`` for one application."""
+    failed = [(name, outcome) for name, outcome, predicate in rules if not predicate(app)]
+    if any(outcome == 'REJECT' for _, outcome in failed):
+        decision = 'REJECT'
+    elif failed:
+        decision = 'REVIEW'
+    else:
+        decision = 'APPROVE' if auto_approve else 'PASS'
+    return decision, [name for name, _ in failed]
+
+
+def evaluate_rows(rows, rules, auto_approve):
+    return [(row[0], *decide(application(row), rules, auto_approve)) for row in rows]
+
+
+# Process-pool workers compile the rules once in the initializer.
+_worker_rules = None
+
+
+def _init_worker(specs, today, auto_approve):
+    global _worker_rules
+    _worker_rules = (compile_rules(specs, today), auto_approve)
+
+
+def _evaluate_in_worker(rows):
+    rules, auto_approve = _worker_rules
+    return evaluate_rows(rows, rules, auto_approve)
+
+
+def pending_chunks(queryset, chunk_size):
+    """Yield lists of ``APPLICATION_FIELDS`` tuples, ``chunk_size`` loans at a time, in pk order."""
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list(*APPLICATION_FIELDS)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1][0]
+
+
+def apply_decisions(decisions, admin=None):
+    """Write APPROVE/REJECT decisions for one chunk; returns the ids actually changed."""
+    actionable = {pk: (decision, reasons) for pk, decision, reasons in decisions if decision in ('APPROVE', 'REJECT')}
+    if not actionable:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        # Lock the rows still pending; ones decided concurrently (or locked by another run) are skipped.
+        current = list(
+            Loan.objects.select_for_update(skip_locked=True)
+            .filter(pk__in=list(actionable), status='PENDING')
+            .values_list('pk', 'created_at', 'requested_amount', 'approved_amount', 'user_id')
+        )
+        by_decision = {'APPROVE': [], 'REJECT': []}
+        deltas = []
+        messages = []
+        for pk, created_at, requested, approved, user_id in current:
+            decision = actionable[pk][0]
+            by_decision[decision].append(pk)
+            status = 'APPROVED' if decision == 'APPROVE' else 'REJECTED'
+            messages.append(events.loan_message(user_id, pk, status, 'PENDING'))
+            before = summaries.contribution('LOAN', (created_at, 'PENDING', requested, approved))
+            if decision == 'APPROVE':
+                after = summaries.contribution('LOAN', (created_at, 'APPROVED', requested, approved or requested))
+            else:
+                after = summaries.contribution('LOAN', (created_at, 'REJECTED', requested, approved))
+            deltas.extend(summaries.diff(before, after))
+        if by_decision['APPROVE']:
+            Loan.objects.filter(pk__in=by_decision['APPROVE']).update(
+                status='APPROVED',
+                approved_amount=Coalesce(F('approved_amount'), F('requested_amount')),
+                approved_at=now,
+                version=F('version') + 1,
+            )
+        if by_decision['REJECT']:
+            Loan.objects.filter(pk__in=by_decision['REJECT']).update(status='REJECTED', version=F('version') + 1)
+        AuditLog.objects.bulk_create([
+            AuditLog(
+                admin=admin,
+                action='AUTO_APPROVED' if decision == 'APPROVE' else 'AUTO_REJECTED',
+                entity_type='Loan',
+                entity_id=pk,
+                details={'engine': 'underwriting', 'failed_rules': actionable[pk][1]},
+            )
+            for decision, pks in by_decision.items()
+            for pk in pks
+        ], batch_size=1000)
+        summaries.apply_deltas(deltas)
+        events.publish_many(messages)
+    return by_decision['APPROVE'] + by_decision['REJECT']
+
+
+def underwrite(queryset=None, *, specs=None, chunk_size=5000, workers=1, dry_run=False, admin=None,
+               auto_approve=None, limit=None, progress=None):
+    """Evaluate pending loans; returns a stats dict (decisions, failed rules, throughput)."""
+    queryset = Loan.objects.all() if queryset is None else queryset
+    queryset = queryset.filter(status='PENDING')
+    specs = load_specs() if specs is None else specs
+    if auto_approve is None:
+        auto_approve = getattr(settings, 'UNDERWRITING_AUTO_APPROVE', False)
+    today = timezone.localdate()
+    rules = compile_rules(specs, today)
+
+    stats = {'evaluated': 0, 'written': 0, 'decisions': Counter(), 'failed_rules': Counter()}
+    started = time.perf_counter()
+
+    def chunks():
+        remaining = limit
+        for rows in pending_chunks(queryset, chunk_size):
+            if remaining is not None:
+                rows = rows[:remaining]
+                remaining -= len(rows)
+            yield rows
+            if remaining is not None and remaining <= 0:
+                return
+
+    def handle(decisions):
+        stats['evaluated'] += len(decisions)
+        for _, decision, reasons in decisions:
+            stats['decisions'][decision] += 1
+            stats['failed_rules'].update(reasons)
+        if not dry_run:
+            stats['written'] += len(apply_decisions(decisions, admin=admin))
+        if progress:
+            progress(stats)
+
+    if workers > 1:
+        # Rows are fetched (and decisions written) here; workers only evaluate.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with context.Pool(workers, initializer=_init_worker, initargs=(specs, today, auto_approve)) as pool:
+            # Submit from this thread (pool.imap would query from its feeder thread) with a bounded window.
+            in_flight = deque()
+            for rows in chunks():
+                in_flight.append(pool.apply_async(_evaluate_in_worker, (rows,)))
+                if len(in_flight) >= workers * 2:
+                    handle(in_flight.popleft().get())
+            while in_flight:
+                handle(in_flight.popleft().get())
+    else:
+        for rows in chunks():
+            handle(evaluate_rows(rows, rules, auto_approve))
+
+    stats['seconds'] = time.perf_counter() - started
+    stats['rate'] = stats['evaluated'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
@@ -12,9 +12,12 @@ urlpatterns = [
     path('bank-detail/', views.bank_detail, name='bank_detail'),
     path('loan/apply/', views.loan_application, name='loan_application'),
     path('loan/dashboard/', views.loan_dashboard, name='loan_dashboard'),
+    path('api/loan/status/', views.loan_status_api, name='loan_status_api'),
+    path('api/loan/events/', views.loan_events, name='loan_events'),
     path('withdrawal/request/', views.withdrawal_request, name='withdrawal_request'),
     path('terms/', views.terms, name='terms'),
     path('loan/<int:loan_id>/agreement/', views.loan_agreement, name='loan_agreement'),
     path('loan/agreement/<int:agreement_id>/download/', views.agreement_download, name='agreement_download'),
     path('loan/agreement/<int:agreement_id>/view/', views.agreement_view, name='agreement_view'),
+    path('loan/agreement/<int:agreement_id>/signature/', views.agreement_signature, name='agreement_signature'),
 ]
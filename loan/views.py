@@ -12,17 +12,22 @@ from django.contrib.auth import login, authenticate, logout, get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.tokens import default_token_generator
 from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
 from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.paginator import Paginator
 from django.db.models import Sum
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, FileResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.db import transaction, IntegrityError
 from django.template.loader import render_to_string
 from django.templatetags.static import static
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from django.utils.encoding import force_bytes, force_str
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
 from .forms import (
 	LoanForm,
@@ -34,10 +39,15 @@ from .forms import (
 	InviteEmailForm,
 )
 from .forms_whatsapp import InviteWhatsAppForm
+from .amortization import quote, quote_loan
+from .instrumentation import render_prometheus, timed
+from . import events, fragments, funnel, identity, protected_media, summaries, throttling
+from .idempotency import idempotent, replay_as
+from .replicas import read_primary, replica_reads_view
 from .models import Loan, BankDetail, Profile, User, WithdrawalRequest
 from .models import LoanAgreement
 from django.core.files.base import ContentFile
-import base64, os
+import base64, hashlib, os
 
 logger = logging.getLogger(__name__)
 
@@ -75,32 +85,60 @@ def send_email_verification(user, request):
 	)
 	email.attach_alternative(html_body, 'text/html')
 	try:
-		email.send(fail_silently=False)
+		with timed('smtp'):
+			email.send(fail_silently=False)
 	except (SMTPException, OSError) as exc:
 		logger.exception('Verification email failed: %s', exc)
 		return False
 	return True
 
+def loan_balance(loan):
+	"""Return ``(approved_amount, approved_withdrawals_total, available_balance)`` for a loan."""
+	approved_amount = loan.approved_amount or loan.requested_amount
+	approved_withdrawals_total = WithdrawalRequest.objects.filter(
+		loan=loan, status="APPROVED"
+	).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+	return approved_amount, approved_withdrawals_total, approved_amount - approved_withdrawals_total
+
+
+def loan_older_than(loan, expected):
+	"""Whether ``loan`` is older than ``expected`` (``<loan id>.<version>``, as in the status ETag)."""
+	try:
+		loan_id, version = (int(part) for part in expected.split('.'))
+	except ValueError:
+		return False
+	return loan is None or loan.pk < loan_id or (loan.pk == loan_id and loan.version < version)
+
+
 @login_required
+@replica_reads_view
 def loan_dashboard(request):
 	loan = Loan.objects.filter(user=request.user).order_by('-created_at').first()
+	# ?v= is the loan version a pushed status change announced (see the template's script). A
+	# replica that has not replayed it yet would render the old page and trigger another reload.
+	expected = request.GET.get('v')
+	if expected and loan_older_than(loan, expected):
+		read_primary()
+		loan = Loan.objects.filter(user=request.user).order_by('-created_at').first()
 	balance = None
 	approved_withdrawals_total = Decimal('0.00')
 	available_balance = None
 	withdrawal_requests = []
 	if loan and loan.status in ["APPROVED", "ACTIVE"]:
-		approved_amount = loan.approved_amount or loan.requested_amount
-		approved_withdrawals_total = WithdrawalRequest.objects.filter(
-			loan=loan, status="APPROVED"
-		).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-		available_balance = approved_amount - approved_withdrawals_total
-		balance = available_balance
+		# Deferred: evaluated only when the cached 'dashboard' fragment is rendered (loan/fragments.py)
+		figures = fragments.deferred(lambda: loan_balance(loan))
+		approved_withdrawals_total = fragments.deferred(lambda: figures()[1])
+		available_balance = balance = fragments.deferred(lambda: figures()[2])
 		withdrawal_requests = WithdrawalRequest.objects.filter(loan=loan).order_by('-created_at')
+	repayment = None
+	if loan and loan.status != "REJECTED":
+		repayment = fragments.deferred(lambda: quote_loan(loan))
 	return render(
 		request,
 		'loan/loan_dashboard.html',
 		{
 			'loan': loan,
+			'repayment': repayment,
 			'balance': balance,
 			'available_balance': available_balance,
 			'approved_withdrawals_total': approved_withdrawals_total,
@@ -108,7 +146,74 @@ def loan_dashboard(request):
 		},
 	)
 
+def loan_status_etag(request):
+	"""``<loan id>.<version>`` of the user's current loan: one indexed lookup, no balance or list queries."""
+	row = Loan.objects.filter(user=request.user).order_by('-created_at').values_list('pk', 'version').first()
+	return f'{row[0]}.{row[1]}' if row else 'none'
+
+
 @login_required
+@replica_reads_view
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=loan_status_etag)
+def loan_status_api(request):
+	"""Current loan, balance and a page of withdrawals as JSON, for polling clients.
+
+	Responses carry a strong ETag built from ``Loan.version``; a poll sending it back in
+	``If-None-Match`` gets a 304 after a single query.
+	"""
+	loan = Loan.objects.filter(user=request.user).order_by('-created_at').first()
+	if loan is None:
+		return JsonResponse({'loan': None, 'balance': None, 'withdrawals': None})
+	balance = None
+	if loan.status in ["APPROVED", "ACTIVE"]:
+		approved_amount, approved_withdrawals_total, available_balance = loan_balance(loan)
+		balance = {
+			'approved_amount': approved_amount,
+			'approved_withdrawals_total': approved_withdrawals_total,
+			'available_balance': available_balance,
+		}
+	withdrawals = WithdrawalRequest.objects.filter(loan=loan).order_by('-created_at', '-pk').values(
+		'id', 'amount', 'status', 'created_at', 'processed_at')
+	per_page = getattr(settings, 'LOAN_STATUS_API_PAGE_SIZE', 20)
+	page = Paginator(withdrawals, per_page).get_page(request.GET.get('page'))
+	return JsonResponse({
+		'loan': {
+			'id': loan.id,
+			'status': loan.status,
+			'requested_amount': loan.requested_amount,
+			'approved_amount': loan.approved_amount,
+			'term_months': loan.term_months,
+			'created_at': loan.created_at,
+			'approved_at': loan.approved_at,
+			'closed_at': loan.closed_at,
+			'version': loan.version,
+		},
+		'balance': balance,
+		'withdrawals': {
+			'page': page.number,
+			'pages': page.paginator.num_pages,
+			'count': page.paginator.count,
+			'results': list(page.object_list),
+		},
+	})
+
+@login_required
+async def loan_events(request):
+	"""Server-sent events with the user's loan and withdrawal status changes (see loan/events.py).
+
+	In production ``EventStreamRouter`` (core/asgi.py) answers this path before Django does; this
+	view covers other setups. Under WSGI every open stream would pin a worker thread, so it
+	answers 204, which tells ``EventSource`` not to reconnect and leaves the page to reloads.
+	"""
+	if not isinstance(request, ASGIRequest):
+		return HttpResponse(status=204)
+	user = await request.auser()
+	return events.stream_response(user.pk)
+
+
+@login_required
+@idempotent
 def loan_application(request):
 	# Preconditions: profile and bank details completed, no active/pending loan
 	if not (hasattr(request.user, 'profile') and request.user.profile.completed):
@@ -129,6 +234,14 @@ def loan_application(request):
 				post_data['monthly_income'] = ''
 		form = LoanForm(post_data)
 		if form.is_valid():
+			if 'estimate' in request.POST:
+				# Show the repayment plan without creating the loan
+				estimate = quote(
+					form.cleaned_data['requested_amount'],
+					form.cleaned_data['term_months'],
+					monthly_income=form.cleaned_data.get('monthly_income'),
+				)
+				return render(request, 'loan/loan_application.html', {'form': form, 'estimate': estimate})
 			loan = form.save(commit=False)
 			loan.user = request.user
 			loan.status = "PENDING"
@@ -140,6 +253,7 @@ def loan_application(request):
 
 
 @login_required
+@idempotent
 def loan_agreement(request, loan_id):
 	# Show agreement for a specific loan and allow borrower to sign (drawn + typed fallback)
 	loan = get_object_or_404(Loan, pk=loan_id)
@@ -190,7 +304,9 @@ def loan_agreement(request, loan_id):
 
 		agreement.save()
 
-		return render(request, 'loan/agreement_submitted.html', {'agreement': agreement})
+		response = render(request, 'loan/agreement_submitted.html', {'agreement': agreement})
+		# A resubmitted signature lands on the saved agreement instead of creating another
+		return replay_as(response, reverse('agreement_view', args=[agreement.pk]))
 
 	return render(request, 'loan/agreement.html', {
 		'loan': loan,
@@ -201,19 +317,19 @@ def loan_agreement(request, loan_id):
 	})
 
 
-@login_required
-def agreement_download(request, agreement_id):
-	ag = get_object_or_404(LoanAgreement, pk=agreement_id)
-	if ag.user != request.user:
-		return redirect('loan_dashboard')
-	# Build simple HTML with embedded signature (base64) for download
-	signature_data_uri = ''
-	if ag.signature_image and hasattr(ag.signature_image, 'path') and os.path.exists(ag.signature_image.path):
-		with open(ag.signature_image.path, 'rb') as f:
-			b = f.read()
-			signature_data_uri = 'data:image/png;base64,' + base64.b64encode(b).decode('ascii')
-
-	html = f'''<!doctype html>
+def build_agreement_html(ag, signature_src=None):
+	"""Build the standalone HTML document for a signed agreement.
+
+	The signature is referenced, not embedded: by default as a ``file://`` URL that
+	WeasyPrint reads directly; pass ``signature_src`` for documents opened elsewhere.
+	"""
+	if signature_src is None and ag.signature_image:
+		try:
+			signature_src = protected_media.resolve(ag.signature_image.name).as_uri()
+		except Http404:
+			signature_src = None
+
+	return f'''<!doctype html>
 <html><head><meta charset="utf-8"><title>Agreement-{ag.id}</title></head><body>
 <h2>Signed Agreement</h2>
 <p>Borrower: {ag.borrower_name}</p>
@@ -221,44 +337,98 @@ def agreement_download(request, agreement_id):
 <p>Account (last4): {ag.account_last4}</p>
 <p>Signed at: {ag.signed_at}</p>
 <p>Signature:</p>
-{('<img src="'+signature_data_uri+'"/>') if signature_data_uri else ('<p>'+ (ag.signature_text or '---') +'</p>')}
+{('<img src="'+signature_src+'"/>') if signature_src else ('<p>'+ (ag.signature_text or '---') +'</p>')}
 </body></html>'''
 
-	# Try to render PDF via WeasyPrint if available; otherwise fall back to HTML attachment
+
+def render_agreement_pdf(html):
+	"""Render agreement HTML to PDF bytes; returns None when WeasyPrint is not installed."""
 	try:
-		from weasyprint import HTML, CSS  # type: ignore
+		from weasyprint import HTML  # type: ignore
 	except Exception:
-		HTML = None
+		return None
+	with timed('pdf'):
+		return HTML(string=html).write_pdf()
 
-	if HTML:
-		try:
-			# Use WeasyPrint to render PDF from the HTML string
-			pdf = HTML(string=html).write_pdf()
-			resp = HttpResponse(pdf, content_type='application/pdf')
-			resp['Content-Disposition'] = f'attachment; filename="agreement-{ag.id}.pdf"'
-			return resp
-		except Exception:
-			# if PDF generation fails, fall back to HTML
-			logger.exception('WeasyPrint PDF generation failed for agreement %s', ag.id)
 
+def agreement_pdf_path(ag, html):
+	"""MEDIA_ROOT-relative path of the rendered PDF, rendering and storing it on first use.
+
+	Named by a hash of the HTML, so an edited agreement gets a new file. Returns None
+	when WeasyPrint is unavailable.
+	"""
+	digest = hashlib.sha256(html.encode('utf-8')).hexdigest()[:16]
+	path = f'agreements/documents/agreement-{ag.id}-{digest}.pdf'
+	full = protected_media.media_root() / path
+	if not full.exists():
+		pdf = render_agreement_pdf(html)
+		if pdf is None:
+			return None
+		full.parent.mkdir(parents=True, exist_ok=True)
+		tmp = full.with_name(f'{full.name}.{os.getpid()}.tmp')
+		tmp.write_bytes(pdf)
+		os.replace(tmp, full)
+	return path
+
+
+def can_access_agreement(user, ag):
+	return ag.user_id == user.pk or user.is_staff
+
+
+@login_required
+def agreement_download(request, agreement_id):
+	ag = get_object_or_404(LoanAgreement, pk=agreement_id)
+	if not can_access_agreement(request.user, ag):
+		return redirect('loan_dashboard')
+	html = build_agreement_html(ag)
+
+	# Render the PDF once and let the front server send it; fall back to an HTML attachment
+	try:
+		pdf_path = agreement_pdf_path(ag, html)
+	except Exception:
+		# if PDF generation fails, fall back to HTML
+		logger.exception('WeasyPrint PDF generation failed for agreement %s', ag.id)
+		pdf_path = None
+
+	if pdf_path is not None:
+		return protected_media.serve(request, pdf_path, filename=f'agreement-{ag.id}.pdf', as_attachment=True,
+			content_type='application/pdf')
+
+	# The HTML copy is opened outside the server, so point it at the signature URL instead
+	if ag.signature_image:
+		html = build_agreement_html(ag, request.build_absolute_uri(reverse('agreement_signature', args=[ag.id])))
 	resp = HttpResponse(html, content_type='text/html')
 	resp['Content-Disposition'] = f'attachment; filename="agreement-{ag.id}.html"'
 	return resp
 
 
 @login_required
+def agreement_signature(request, agreement_id):
+	"""Signature image of an agreement, for its owner or staff (sent by the front server)."""
+	ag = get_object_or_404(LoanAgreement, pk=agreement_id)
+	if not can_access_agreement(request.user, ag):
+		raise Http404('No signature.')
+	return protected_media.serve_field_file(request, ag.signature_image)
+
+
+@login_required
+@replica_reads_view
 def agreement_view(request, agreement_id):
 	"""Read-only viewer for a saved LoanAgreement.
 
 	Access is allowed for the agreement owner or staff users.
 	"""
 	ag = get_object_or_404(LoanAgreement, pk=agreement_id)
-	if ag.user != request.user and not request.user.is_staff:
+	if not can_access_agreement(request.user, ag):
 		return redirect('loan_dashboard')
 	return render(request, 'loan/agreement_view.html', {'agreement': ag})
 
 def register(request):
 	if request.method == 'POST':
+		# Throttle before validation: UserRegistrationForm.save runs the password hasher.
+		retry_after = throttling.check(('register_ip', throttling.client_ip(request)))
+		if retry_after:
+			return throttling.throttled_response(request, 'loan/register.html', {'form': UserRegistrationForm()}, retry_after)
 		form = UserRegistrationForm(request.POST)
 		if form.is_valid():
 			user = form.save(commit=False)
@@ -297,6 +467,13 @@ def verify_email(request, uidb64, token):
 
 def user_login(request):
 	if request.method == 'POST':
+		# Throttle before authenticate() so over-limit attempts never reach the hasher or the DB.
+		retry_after = throttling.check(
+			('login_ip', throttling.client_ip(request)),
+			('login_account', identity.normalize_email(request.POST.get('username'))),
+		)
+		if retry_after:
+			return throttling.throttled_response(request, 'loan/login.html', {'form': UserLoginForm()}, retry_after)
 		form = UserLoginForm(request, data=request.POST)
 		if form.is_valid():
 			user = form.get_user()
@@ -304,10 +481,7 @@ def user_login(request):
 			return redirect('loan_dashboard')
 		else:
 			# Check if user exists
-			from django.contrib.auth import get_user_model
-			User = get_user_model()
-			email = request.POST.get('username')
-			if not User.objects.filter(email=email).exists():
+			if identity.user_by_email(request.POST.get('username')) is None:
 				from django.contrib import messages
 				messages.error(request, 'No account found with this email address.')
 	else:
@@ -376,16 +550,14 @@ def bank_detail(request):
 	return render(request, 'loan/bank_detail.html', {'form': form})
 
 @login_required
+@idempotent
 def withdrawal_request(request):
 	loan = Loan.objects.filter(user=request.user).order_by('-created_at').first()
 	if not loan or loan.status not in ["APPROVED", "ACTIVE"]:
 		return redirect('loan_dashboard')
 
-	approved_amount = loan.approved_amount or loan.requested_amount
-	approved_withdrawals_total = WithdrawalRequest.objects.filter(
-		loan=loan, status="APPROVED"
-	).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-	available_balance = approved_amount - approved_withdrawals_total
+	# Deferred: a GET only needs it when the cached 'withdrawal-balance' fragment is rendered
+	figures = fragments.deferred(lambda: loan_balance(loan))
 
 	if request.method == 'POST':
 		form = WithdrawalRequestForm(request.POST)
@@ -393,7 +565,7 @@ def withdrawal_request(request):
 			withdrawal = form.save(commit=False)
 			if withdrawal.amount <= 0:
 				form.add_error('amount', 'Amount must be greater than zero.')
-			elif withdrawal.amount > available_balance:
+			elif withdrawal.amount > figures()[2]:
 				form.add_error('amount', 'Amount exceeds available balance.')
 			else:
 				withdrawal.user = request.user
@@ -412,9 +584,9 @@ def withdrawal_request(request):
 		{
 			'form': form,
 			'loan': loan,
-			'available_balance': available_balance,
-			'approved_amount': approved_amount,
-			'approved_withdrawals_total': approved_withdrawals_total,
+			'available_balance': fragments.deferred(lambda: figures()[2]),
+			'approved_amount': fragments.deferred(lambda: figures()[0]),
+			'approved_withdrawals_total': fragments.deferred(lambda: figures()[1]),
 		},
 	)
 
@@ -451,7 +623,8 @@ def send_invite(request):
 			email = EmailMultiAlternatives(subject, text_body, from_email, [recipient_email], reply_to=reply_to)
 			email.attach_alternative(html_body, 'text/html')
 			try:
-				email.send(fail_silently=False)
+				with timed('smtp'):
+					email.send(fail_silently=False)
 			except (SMTPException, OSError) as exc:
 				logger.exception('Invite email failed: %s', exc)
 				console_backend_path = 'django.core.mail.backends.console.EmailBackend'
@@ -516,7 +689,8 @@ def send_invite_whatsapp(request):
 			email = EmailMultiAlternatives(subject, text_body, from_email, [recipient_email], reply_to=reply_to)
 			email.attach_alternative(html_body, 'text/html')
 			try:
-				email.send(fail_silently=False)
+				with timed('smtp'):
+					email.send(fail_silently=False)
 			except (SMTPException, OSError) as exc:
 				logger.exception('WhatsApp-fallback invite email failed: %s', exc)
 				console_backend_path = 'django.core.mail.backends.console.EmailBackend'
@@ -548,6 +722,69 @@ def send_invite_whatsapp(request):
 	return render(request, 'loan/send_invite_whatsapp.html', {'form': form})
 
 
+def metrics(request):
+	"""Prometheus scrape endpoint.
+
+	Accessible to staff sessions or to scrapers presenting ``METRICS_TOKEN`` as a bearer token.
+	"""
+	token = getattr(settings, 'METRICS_TOKEN', '')
+	auth = request.META.get('HTTP_AUTHORIZATION', '')
+	if not (token and constant_time_compare(auth, f'Bearer {token}')):
+		if not (request.user.is_authenticated and request.user.is_staff):
+			raise PermissionDenied('Metrics are restricted to staff.')
+	return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@login_required
+@replica_reads_view
+def portfolio_report(request):
+	"""Monthly loan volume, approval rate and withdrawal totals, read from ``DailySummary`` only."""
+	if not request.user.is_staff:
+		raise PermissionDenied('Only administrators can view reports.')
+	try:
+		months = int(request.GET.get('months', 12))
+	except ValueError:
+		months = 12
+	if months not in summaries.REPORT_MONTHS:
+		months = 12
+	report = summaries.report(months)
+	return render(request, 'admin/portfolio_report.html', {
+		'title': 'Portfolio report',
+		'report': report,
+		'months': months,
+		'month_choices': summaries.REPORT_MONTHS,
+		'cache_seconds': getattr(settings, 'PORTFOLIO_REPORT_CACHE_SECONDS', 300),
+	})
+
+
+@login_required
+@replica_reads_view
+def funnel_report(request):
+	"""Onboarding funnel by signup week; ``?format=csv`` downloads the same figures."""
+	if not request.user.is_staff:
+		raise PermissionDenied('Only administrators can view reports.')
+	try:
+		weeks = int(request.GET.get('weeks', 12))
+	except ValueError:
+		weeks = 12
+	if weeks not in funnel.REPORT_WEEKS:
+		weeks = 12
+	report = funnel.report(weeks)
+	if request.GET.get('format') == 'csv':
+		resp = HttpResponse(content_type='text/csv')
+		resp['Content-Disposition'] = f'attachment; filename="onboarding-funnel-{weeks}w.csv"'
+		funnel.write_csv(report, resp)
+		return resp
+	return render(request, 'admin/funnel_report.html', {
+		'title': 'Onboarding funnel',
+		'report': report,
+		'weeks': weeks,
+		'week_choices': funnel.REPORT_WEEKS,
+		'stage_labels': [label for _, label, _ in funnel.STAGES],
+		'cache_seconds': getattr(settings, 'FUNNEL_REPORT_CACHE_SECONDS', 600),
+	})
+
+
 def custom_404(request, exception):
 	"""Custom 404 handler that renders a branded 404 page."""
 	return render(request, 'loan/404.html', status=404)